@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+
+# asyncio API for solver checks in worker processes, with deadlines,
+# cancellation and progress streaming
+#
+# every engine blocks in solver.check() without a time limit, so one query
+# that blows up (e.g. the Int encoding of test_gen.py at a large length)
+# hangs the whole run. CheckService keeps a pool of worker processes (each
+# with its own z3) and runs jobs on them:
+#
+#   smt2_job(text)                 an SMT-LIB2 query (see smt2_batch.to_smt2)
+#   model_job(model, bound)        the queries of a model (smt2_batch.run_model)
+#   call_job('module:f', *args)    any function of the models, e.g.
+#                                  call_job('bmc_gcd_fpsat:gcd_bmc_with_fixed_point', 20, False)
+#
+# while a job runs, every query it makes is reported as a progress event
+# (the query events of tracing.py: kind, bound, result, times, statistics).
+# A job that passes its deadline, or whose awaiting task is cancelled, is
+# interrupted (Context.interrupt() if a check is running, which then
+# returns unknown) and, if it does not stop within a grace period, its
+# worker is killed. Either way the result is unknown, with the statistics
+# of the last query reported so far, and the worker is replaced: z3 keeps
+# the cancel flag of an interrupt, so its context cannot be reused.
+#
+#   async with CheckService(workers=2) as service:
+#       result = await service.check(model_job('test-gen', 40), deadline=5)
+#       async for event in service.stream(model_job('counter', 20)):
+#           print(event['bound'], event['result'])
+#
+# run: python async_check.py
+
+import asyncio
+import contextlib
+import importlib
+import io
+import multiprocessing
+import queue
+import re
+import threading
+import time
+
+def smt2_job(text):
+    return ('smt2', text)
+
+def model_job(model, bound=None):
+    return ('model', model, bound)
+
+def call_job(function, *args):
+    return ('call', function) + args
+
+class CheckResult:
+    """
+    Outcome of a job: status is sat, unsat or unknown (the result of the
+    last query for model and call jobs), reason says why it is unknown
+    (timeout, cancelled, error or the solver's reason), value is the return
+    value of a call job (as far as it can be pickled) or the model of an
+    smt2 job (as text), statistics are those of the last query.
+    """
+
+    def __init__(self, status, reason=None, value=None, statistics=None, seconds=None, events=()):
+        self.status = status
+        self.reason = reason
+        self.value = value
+        self.statistics = statistics or {}
+        self.seconds = seconds
+        self.events = list(events)
+
+    def __repr__(self):
+        return "CheckResult(%s%s, %.3fs, %d queries)" % (self.status, ", " + self.reason if self.reason else "",
+                                                        self.seconds or 0.0, len(self.events))
+
+# worker process side
+
+class _Interrupted(Exception):
+    pass
+
+def _plain(value):
+    """value with everything but JSON-like data replaced by its string."""
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [ _plain(v) for v in value ]
+    if isinstance(value, dict):
+        return { str(k): _plain(v) for k, v in value.items() }
+    return str(value)
+
+def _run_job(job, send, interrupted, checking, timeout):
+    """
+    Run job in this (worker) process; progress events go to send. Each query
+    gets the time left until timeout seconds from now as its z3 timeout.
+    checking (lock, flag) tells the interrupt listener whether a check runs.
+    """
+    import z3
+    import tracing
+
+    end = None if timeout is None else time.monotonic() + timeout
+
+    class ProgressTracer(tracing.Tracer):
+        def __init__(self):
+            tracing.Tracer.__init__(self, render=False, statistics=True, sizes=False)
+            self.last = None
+
+        def query(self, solver, assumptions, event):
+            if end is not None:
+                left = end - time.monotonic()
+                if left <= 0:
+                    raise _Interrupted('timeout')
+                solver.set('timeout', max(1, int(left * 1000)))
+            with checking[0]:
+                if interrupted.is_set():
+                    raise _Interrupted('interrupted')
+                checking[1] = True # the check starts right after this
+
+        def emit(self, event):
+            if event['event'] == 'query':
+                with checking[0]:
+                    checking[1] = False
+                self.last = event
+                send(event)
+
+    tracer = ProgressTracer()
+    value = None
+    with tracing.tracing(tracer), contextlib.redirect_stdout(io.StringIO()):
+        if job[0] == 'smt2':
+            text = job[1]
+            s = z3.Solver()
+            s.from_string(text)
+            # from_string skips the commands, so the assumptions are read here
+            assumptions = []
+            m = re.search(r'\(check-sat-assuming \((.*)\)\)', text)
+            for lit in re.findall(r'\(not ([^()\s]+)\)|([^()\s]+)', m.group(1)) if m else []:
+                assumptions.append(z3.Not(z3.Bool(lit[0])) if lit[0] else z3.Bool(lit[1]))
+            if tracing.check(s, *assumptions, kind='smt2') == z3.sat:
+                value = s.model().sexpr()
+            elif tracer.last['result'] == 'unknown':
+                tracer.last['reason'] = s.reason_unknown()
+        elif job[0] == 'model':
+            from smt2_batch import run_model
+            run_model(job[1], job[2])
+        elif job[0] == 'call':
+            module, name = job[1].split(':')
+            value = _plain(getattr(importlib.import_module(module), name)(*job[2:]))
+        else:
+            raise ValueError("unknown job %r" % (job[0],))
+    return value, tracer.last
+
+def _worker(conn):
+    """
+    Worker process: runs the jobs received on conn one at a time; a thread
+    listens for interrupts meanwhile, and interrupts z3 in the main thread
+    if it is in a check (an interrupt outside of a check would cancel the
+    next one).
+    """
+    import z3
+    jobs = queue.Queue()
+    interrupted = threading.Event()
+    checking = [ threading.Lock(), False ]
+    current = [ None ]
+
+    def listen():
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                jobs.put(None)
+                return
+            if message[0] == 'interrupt':
+                if message[1] == current[0]:
+                    with checking[0]:
+                        interrupted.set()
+                        if checking[1]:
+                            z3.main_ctx().interrupt()
+            else:
+                jobs.put(message)
+
+    threading.Thread(target=listen, daemon=True).start()
+    while True:
+        message = jobs.get()
+        if message is None:
+            return
+        _, job_id, job, timeout = message
+        current[0] = job_id
+        interrupted.clear()
+        checking[1] = False
+        start = time.perf_counter()
+        try:
+            value, last = _run_job(job, lambda e: conn.send(('event', job_id, e)), interrupted, checking, timeout)
+            status = last['result'] if last else 'unknown'
+            reason = last.get('reason') if last else None
+            if interrupted.is_set():
+                status, reason = 'unknown', 'interrupted'
+            elif status == 'unknown' and reason is None and timeout is not None \
+                    and time.perf_counter() - start >= timeout:
+                reason = 'timeout' # the z3 timeout of the last query
+            conn.send(('done', job_id, status, reason, value, (last or {}).get('z3'),
+                       time.perf_counter() - start))
+        except _Interrupted as e:
+            conn.send(('done', job_id, 'unknown', str(e), None, None, time.perf_counter() - start))
+        except Exception as e:
+            conn.send(('done', job_id, 'unknown', 'error: %r' % e, None, None, time.perf_counter() - start))
+        current[0] = None
+
+# asyncio side
+
+class _Worker:
+    """A worker process, its pipe, and the message queues of its jobs."""
+
+    def __init__(self, mp, loop):
+        self.conn, child = mp.Pipe()
+        self.process = mp.Process(target=_worker, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.loop = loop
+        self.jobs = {} # job id -> asyncio queue of its messages
+        self.alive = True
+        loop.add_reader(self.conn.fileno(), self._receive)
+
+    def send(self, message):
+        try:
+            self.conn.send(message)
+        except OSError: # broken pipe: the process is gone
+            self._died()
+
+    def _receive(self):
+        try:
+            while self.conn.poll():
+                message = self.conn.recv()
+                target = self.jobs.get(message[1])
+                if target is not None:
+                    target.put_nowait(message)
+        except (EOFError, OSError):
+            self._died()
+
+    def _died(self):
+        """The process ended (crashed or killed): its jobs are done, unknown."""
+        if not self.alive:
+            return
+        self.alive = False
+        self.loop.remove_reader(self.conn.fileno())
+        for job_id, messages in self.jobs.items():
+            messages.put_nowait(('done', job_id, 'unknown', 'worker died', None, None, None))
+
+    def kill(self):
+        if self.alive:
+            self.alive = False
+            self.loop.remove_reader(self.conn.fileno())
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class CheckService:
+    """
+    Pool of worker processes running jobs (see smt2_job, model_job,
+    call_job), at most one per worker at a time; more jobs wait for a free
+    worker. grace is the time an interrupted job gets to stop before its
+    worker is killed.
+    """
+
+    def __init__(self, workers=None, grace=1.0):
+        self.size = workers or multiprocessing.cpu_count()
+        self.grace = grace
+        self.mp = multiprocessing.get_context('spawn')
+        self.idle = None
+        self.workers = []
+        self.next_id = 0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.idle = asyncio.Queue()
+        for i in range(self.size):
+            w = _Worker(self.mp, loop)
+            self.workers.append(w)
+            self.idle.put_nowait(w)
+        return self
+
+    async def close(self):
+        for w in self.workers:
+            w.kill()
+        self.workers = []
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _replace(self, w):
+        w.kill()
+        self.workers.remove(w)
+        replacement = _Worker(self.mp, asyncio.get_running_loop())
+        self.workers.append(replacement)
+        return replacement
+
+    async def stream(self, job, deadline=None):
+        """
+        Run job, yielding its progress (query) events as they arrive, then
+        a final event {'event': 'result', 'result': CheckResult}. deadline is
+        in seconds from now, the time spent waiting for a worker included.
+        """
+        end = None if deadline is None else time.monotonic() + deadline
+        self.next_id += 1
+        job_id = self.next_id
+        w = await self._acquire(end)
+        if w is None:
+            yield { 'event': 'result', 'result': CheckResult('unknown', 'timeout', seconds=deadline) }
+            return
+        messages = asyncio.Queue()
+        w.jobs[job_id] = messages
+        events = []
+        result = None
+        start = time.perf_counter()
+        try:
+            w.send(('job', job_id, job, None if end is None else max(0.0, end - time.monotonic())))
+            while result is None:
+                wait = None if end is None else max(0.0, end - time.monotonic())
+                try:
+                    message = await asyncio.wait_for(messages.get(), wait)
+                except asyncio.TimeoutError:
+                    result, w = await self._stop(w, job_id, messages, events, 'timeout', start)
+                    break
+                if message[0] == 'event':
+                    events.append(message[2])
+                    yield message[2]
+                else:
+                    _, _, status, reason, value, statistics, seconds = message
+                    if statistics is None and events:
+                        statistics = events[-1].get('z3') # of the last query before the job stopped
+                    result = CheckResult(status, reason, value, statistics, seconds, events)
+        except (asyncio.CancelledError, GeneratorExit):
+            # the caller is gone: stop the job, but do not wait for it
+            w.send(('interrupt', job_id))
+            asyncio.get_running_loop().call_later(self.grace, self._reap, w, job_id)
+            w = None
+            raise
+        finally:
+            if w is not None:
+                w.jobs.pop(job_id, None)
+                self.idle.put_nowait(w if w.alive else self._replace(w))
+        yield { 'event': 'result', 'result': result }
+
+    async def check(self, job, deadline=None, progress=None):
+        """Run job and return its CheckResult; progress (if given) is called with each event."""
+        async for event in self.stream(job, deadline):
+            if event['event'] == 'result':
+                return event['result']
+            if progress is not None:
+                progress(event)
+
+    async def _acquire(self, end):
+        if end is None:
+            return await self.idle.get()
+        try:
+            return await asyncio.wait_for(self.idle.get(), max(0.0, end - time.monotonic()))
+        except asyncio.TimeoutError:
+            return None
+
+    async def _stop(self, w, job_id, messages, events, reason, start):
+        """
+        Interrupt job_id and wait up to grace for it to stop; its worker is
+        replaced either way. Returns (result, new worker).
+        """
+        w.send(('interrupt', job_id))
+        end = time.monotonic() + self.grace
+        statistics = None
+        while True:
+            try:
+                message = await asyncio.wait_for(messages.get(), max(0.0, end - time.monotonic()))
+            except asyncio.TimeoutError:
+                break
+            if message[0] == 'event':
+                events.append(message[2])
+            else:
+                statistics = message[5]
+                break
+        w.jobs.pop(job_id, None)
+        statistics = statistics or (events[-1].get('z3') if events else None)
+        return CheckResult('unknown', reason, None, statistics, time.perf_counter() - start, events), self._replace(w)
+
+    def _reap(self, w, job_id):
+        """After a cancelled job's grace period: replace its (interrupted) worker."""
+        if w not in self.workers:
+            return
+        w.jobs.pop(job_id, None)
+        self.idle.put_nowait(self._replace(w))
+
+async def _demo():
+    async with CheckService(workers=2) as service:
+        def progress(event):
+            print("  [%s k=%s] %s in %.4fs" % (event['kind'], event['bound'], event['result'], event['check_time']))
+        # two jobs multiplexed on the pool; the Int test generation of
+        # length 40 does not finish in time
+        jobs = [ service.check(model_job('counter', 15), deadline=30, progress=progress),
+                 service.check(call_job('test_gen:benchmark', (40,), (32,), 3, 1), deadline=3) ]
+        for result in await asyncio.gather(*jobs):
+            print(result, { k: v for k, v in result.statistics.items() if k in ('conflicts', 'time') })
+        # cancellation: the task is cancelled while its query is running
+        task = asyncio.ensure_future(service.check(call_job('test_gen:benchmark', (40,), (32,), 3, 1)))
+        await asyncio.sleep(1)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            print("cancelled")
+        print(await service.check(call_job('bmc_gcd_fpsat:gcd_bmc_with_fixed_point', 10, False), deadline=30))
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+# auto-tuning of the solver configuration (tactic pipeline, logic, parameters)
+# per model family
+#
+# every engine uses a default Solver(), although the bit-vector GCD and
+# 64-bit counter queries are bit-blasting problems and Sudoku is a finite
+# domain problem. tune() collects a sample of the queries of a family (by
+# running its model, see smt2_batch.run_model, with a tracer recording the
+# queries and their results), solves each of them with every candidate
+# configuration that fits the sorts of the queries on a fresh solver (with
+# a timeout), and saves the fastest configuration that answers all of them
+# correctly to solver_configs.json (the default, unless a candidate is
+# clearly faster, see below). Correctly means: the same result as the
+# default solver, and for sat a model that satisfies the query. As most
+# models only have sat queries (their property is violated), a proof run
+# of each family (PROOFS: k-induction of a property that holds, exhaustive
+# enumeration) adds unsat ones; a family whose sample has no unsat query is
+# not tuned, as nothing would show that a candidate does not answer sat to
+# everything.
+# Each query is timed repeat times (the minimum counts), and a candidate
+# replaces the default only if it is more than 10% and MARGIN seconds faster.
+# The configurations are saved next to this file, or to $SOLVER_CONFIGS.
+# The engines create their solvers with make_solver(family), which uses the
+# saved configuration of the family if there is one, and the default
+# solver otherwise:
+#
+#   solver = make_solver('gcd_bv')
+#
+# families are named like the TransitionSystem families: counter, gcd,
+# gcd_fp, gcd_bv, test_gen, sudoku.
+#
+# run: python autotune.py [family,...] [--timeout S] [--sample N] [--repeat N]
+
+import json
+import os
+import sys
+import time
+
+from z3 import *
+
+import tracing
+
+CONFIGS = os.environ.get('SOLVER_CONFIGS',
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solver_configs.json'))
+
+# name -> configuration: 'tactic' is a named tactic or a list of tactics
+# combined with Then (as in portfolio.py), 'logic' a logic for SolverFor,
+# 'params' solver parameters; {} is the default Solver()
+CANDIDATES = {
+    'default':    {},
+    'qfbv':       { 'tactic': 'qfbv' },
+    'bit-blast':  { 'tactic': [ 'simplify', 'solve-eqs', 'bit-blast', 'sat' ] },
+    'qf_bv':      { 'logic': 'QF_BV' },
+    'qf_fd':      { 'logic': 'QF_FD' },
+    'qflia':      { 'tactic': 'qflia' },
+    'qfnia':      { 'tactic': 'qfnia' },
+    'qf_ufbv':    { 'logic': 'QF_UFBV' },
+    'relevancy0': { 'params': { 'smt.relevancy': 0 } },
+}
+
+# name -> sorts of the queries the candidate is meant for ('bv' also covers
+# Bool only queries, 'int' queries with Int or Real constants)
+THEORIES = {
+    'default':    ('bv', 'int'),
+    'qfbv':       ('bv',),
+    'bit-blast':  ('bv',),
+    'qf_bv':      ('bv',),
+    'qf_fd':      ('bv', 'int'), # finite domains: Bool, bit-vectors, bounded Ints
+    'qflia':      ('int',),
+    'qfnia':      ('int',),
+    'qf_ufbv':    ('bv',),
+    'relevancy0': ('bv', 'int'),
+}
+
+# family -> (model of smt2_batch.run_model, bound) whose queries are sampled
+FAMILIES = {
+    'counter':  ('counter', 15),
+    'gcd':      ('gcd', 8),
+    'gcd_fp':   ('gcd-fp', 12),
+    'gcd_bv':   ('gcd-bv', 10),
+    'test_gen': ('test-gen', None),
+    'sudoku':   ('sudoku', None),
+}
+
+# seconds a candidate must save on the sample (besides 10%) to replace the default
+MARGIN = 0.05
+
+def build_solver(config, ctx=None):
+    """A solver for configuration config (see CANDIDATES)."""
+    if 'tactic' in config:
+        tactic = config['tactic']
+        if isinstance(tactic, str):
+            solver = Tactic(tactic, ctx).solver()
+        else:
+            solver = Then(*[ Tactic(t, ctx) for t in tactic ]).solver()
+    elif 'logic' in config:
+        solver = SolverFor(config['logic'], ctx)
+    else:
+        solver = Solver(ctx=ctx)
+    for k, v in config.get('params', {}).items():
+        solver.set(k, v)
+    return solver
+
+_loaded = {} # path -> (modification time, configurations)
+
+def load_configs(path=CONFIGS):
+    """The saved configurations, family -> entry (see tune); {} without a file."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    if path not in _loaded or _loaded[path][0] != mtime:
+        with open(path) as f:
+            _loaded[path] = (mtime, json.load(f))
+    return _loaded[path][1]
+
+def solver_config(family, path=CONFIGS):
+    """The saved configuration make_solver(family) uses, None for its default."""
+    entry = load_configs(path).get(family)
+    return entry and entry['config']
+
+def make_solver(family, ctx=None, default=None, path=CONFIGS):
+    """
+    Solver for the queries of family: with its tuned configuration if one
+    was saved, otherwise default() (if given) or the default Solver().
+    """
+    entry = load_configs(path).get(family)
+    if entry is not None:
+        return build_solver(entry['config'], ctx)
+    if default is not None:
+        return default()
+    return Solver(ctx=ctx)
+
+class SampleTracer(tracing.Tracer):
+    """Records the queries (assertions, assumptions) and their results."""
+
+    def __init__(self):
+        tracing.Tracer.__init__(self, render=False, statistics=False, sizes=False)
+        self.queries = []
+
+    def query(self, solver, assumptions, event):
+        self.queries.append([ list(solver.assertions()), list(assumptions), None ])
+
+    def emit(self, event):
+        if event['event'] == 'query':
+            self.queries[-1][2] = event['result']
+
+def _spread(queries, n):
+    """n of queries evenly spread over them, the last one included."""
+    if len(queries) <= n:
+        return queries
+    step = len(queries) / n
+    return [ queries[len(queries) - 1 - int(i * step)] for i in reversed(range(n)) ]
+
+def _prove(system, bound=4):
+    from transition_system import KInduction
+    KInduction(system).run(bound)
+
+def _prove_gcd():
+    from bmc_gcd import gcd_system, gcd_sign_violation
+    _prove(gcd_system(gcd_sign_violation))
+
+def _prove_gcd_fp():
+    from bmc_gcd_fpsat import gcd_fixed_point_system
+    _prove(gcd_fixed_point_system().with_bad(lambda V: Or(V['x'] <= 0, V['y'] < 0)))
+
+def _prove_gcd_bv():
+    from bmc_gcd_fpsat_bv import gcd_bv_system
+    _prove(gcd_bv_system(5).with_bad(lambda V: V['x'] == 0))
+
+def _prove_test_gen():
+    import io
+    import test_gen
+    # all tests of each length for 4-bit inputs, until none is left
+    test_gen.stream_tests(io.StringIO(), 5, 4, 1000, test_gen.opt_integer)
+
+def _prove_sudoku():
+    import sudoku_bench
+    import z3_sudoku
+    s = Solver() # plain solver, as in smt2_batch.run_model
+    s.add(z3_sudoku.sudoku_c)
+    for line in sudoku_bench.EASY + sudoku_bench.HARD:
+        z3_sudoku.is_unique(line, s=s) # no second solution: unsat
+
+# family -> run with unsat queries (a property that holds), see sample_queries
+PROOFS = {
+    'gcd':      _prove_gcd,
+    'gcd_fp':   _prove_gcd_fp,
+    'gcd_bv':   _prove_gcd_bv,
+    'test_gen': _prove_test_gen,
+    'sudoku':   _prove_sudoku,
+}
+
+def sample_queries(family, sample=8):
+    """
+    Up to sample queries of family with their results (sat or unsat), from
+    its model run and its proof run (PROOFS), evenly spread (the last,
+    largest query is always included); up to half of them are unsat
+    queries, if there are any.
+    """
+    from smt2_batch import run_model
+    model, bound = FAMILIES[family]
+    with tracing.tracing(SampleTracer()) as tracer:
+        run_model(model, bound)
+        if family in PROOFS:
+            PROOFS[family]()
+    unsats = [ q for q in tracer.queries if q[2] == 'unsat' ]
+    sats = [ q for q in tracer.queries if q[2] == 'sat' ]
+    unsats = _spread(unsats, max(sample // 2, sample - len(sats)))
+    return _spread(sats, sample - len(unsats)) + unsats
+
+def theory(queries):
+    """'int' if the queries have Int or Real terms, otherwise 'bv' (see THEORIES)."""
+    todo = [ e for assertions, assumptions, _ in queries for e in assertions + assumptions ]
+    seen = set()
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if e.sort().kind() in (Z3_INT_SORT, Z3_REAL_SORT):
+            return 'int'
+        todo.extend(e.children())
+    return 'bv'
+
+def measure(config, queries, timeout=10, repeat=3):
+    """
+    Total time of config on queries, each solved repeat times on a fresh
+    solver with timeout seconds (the fastest time counts), or None if some
+    query is not answered correctly in time: with the expected result, and
+    for sat a model satisfying the query.
+    """
+    total = 0.0
+    for assertions, assumptions, expected in queries:
+        times = []
+        for _ in range(repeat):
+            solver = build_solver(config)
+            solver.set('timeout', int(timeout * 1000))
+            solver.add(assertions)
+            start = time.perf_counter()
+            try:
+                result = solver.check(*assumptions)
+            except Z3Exception:
+                return None # e.g. a tactic that does not apply to the query
+            times.append(time.perf_counter() - start)
+            if str(result) != expected:
+                return None
+            if result == sat:
+                query = And(assertions + assumptions)
+                if not is_true(solver.model().eval(query, model_completion=True)):
+                    return None
+        total += min(times)
+    return total
+
+def tune(family, candidates=None, timeout=10, sample=8, repeat=3, path=CONFIGS):
+    """
+    Measure the candidates (names of CANDIDATES, by default all that fit the
+    sorts of the queries) on a sample of the queries of family, and save the
+    fastest one for make_solver. Returns {name: total time or None}; {} if
+    the sample has no unsat query (the family is not tuned then).
+    """
+    queries = sample_queries(family, sample)
+    if not any(expected == 'unsat' for _, _, expected in queries):
+        print("%-10s not tuned: no unsat query in the sample" % family)
+        return {}
+    times = {}
+    kind = theory(queries)
+    for name in candidates or [ n for n in CANDIDATES if kind in THEORIES[n] ]:
+        times[name] = measure(CANDIDATES[name], queries, timeout, repeat)
+        print("%-10s %-12s %s" % (family, name, "-" if times[name] is None else "%.4f" % times[name]))
+    answered = { n: t for n, t in times.items() if t is not None }
+    if not queries or not answered:
+        return times
+    best = min(answered, key=answered.get)
+    if 'default' in answered and (answered[best] > 0.9 * answered['default']
+                                  or answered['default'] - answered[best] < MARGIN):
+        best = 'default' # within measurement noise of the default
+    configs = dict(load_configs(path))
+    configs[family] = { 'name': best, 'config': CANDIDATES[best], 'time': answered[best],
+                        'default_time': times.get('default'), 'queries': len(queries),
+                        'z3': get_version_string(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S') }
+    with open(path, 'w') as f:
+        json.dump(configs, f, indent=1, sort_keys=True)
+    return times
+
+def main():
+    args = sys.argv[1:]
+    def option(name, default, convert=str):
+        if name in args:
+            i = args.index(name)
+            value = convert(args[i+1])
+            del args[i:i+2]
+            return value
+        return default
+    timeout = option('--timeout', 10, float)
+    sample = option('--sample', 8, int)
+    repeat = option('--repeat', 3, int)
+    families = args[0].split(',') if args else list(FAMILIES)
+    for family in families:
+        if family not in FAMILIES:
+            sys.exit("unknown family %s (families: %s)" % (family, ', '.join(FAMILIES)))
+    for family in families:
+        tune(family, timeout=timeout, sample=sample, repeat=repeat)
+    for family, entry in sorted(load_configs().items()):
+        print("%-10s %-12s %.4fs (default %s)" % (family, entry['name'], entry['time'],
+              "-" if entry['default_time'] is None else "%.4fs" % entry['default_time']))
+
+if __name__ == "__main__":
+    main()
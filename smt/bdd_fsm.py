@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+# symbolic (BDD) model checking of finite TransitionSystems
+#
+# the counter of bmc.py is finite (control location x bit-vector x x press),
+# but bmc() only unrolls it, so x >= 10 is only decided for a bounded
+# number of steps. Here the z3 formulas of a TransitionSystem (the same
+# transitions() that stepTransition uses) are bit-blasted into BDDs: one BDD
+# variable per bit of every state variable (enumeration datatypes such as
+# ControlLocation get ceil(log2(#constructors)) bits), current and next
+# copies interleaved, and bit-vector operations become ripple-carry
+# circuits over BDDs. The reachable states are then computed to the
+# fixpoint with bdd_reach.py, which decides the property for any k.
+#
+# run: python bdd_fsm.py [bits,...] [count_max,...]
+#   benchmark of the BDD engine against SMT BMC on the counter
+
+import sys
+import time
+
+from z3 import *
+
+from bdd_graph import make_bdd
+from bdd_reach import PartitionedRelation, forward_reach
+from transition_system import BMC, Result
+
+def sort_bits(sort):
+    """Number of BDD variables for a value of sort (None for Bool)."""
+    if sort.kind() == Z3_BOOL_SORT:
+        return None
+    if sort.kind() == Z3_BV_SORT:
+        return sort.size()
+    if sort.kind() == Z3_DATATYPE_SORT and all( sort.constructor(i).arity() == 0
+                                                for i in range(sort.num_constructors()) ):
+        return max(1, (sort.num_constructors() - 1).bit_length())
+    raise NotImplementedError("no finite bit encoding of sort " + str(sort))
+
+class BitBlaster:
+    """
+    Translation of z3 formulas over Bool, bit-vector and enumeration
+    constants into BDDs: Bool terms become a BDD, other terms a list of BDDs,
+    one per bit (least significant first). Only the operations needed for
+    finite state machines are supported.
+    """
+
+    def __init__(self, bdd):
+        self.bdd = bdd
+        self.consts = {} # z3 constant id -> BDD or list of bit BDDs
+        self.cache = {} # expression id -> (expression, BDD or bits)
+
+    def declare(self, const, names):
+        """Bind a z3 constant to BDD variables (one name for Bool, else one per bit)."""
+        if isinstance(names, str):
+            self.consts[const.get_id()] = self.bdd.var(names)
+        else:
+            self.consts[const.get_id()] = [ self.bdd.var(n) for n in names ]
+
+    def xor(self, a, b):
+        return self.bdd.apply('xor', a, b)
+
+    def equal(self, a, b):
+        if isinstance(a, list):
+            u = self.bdd.true
+            for ai, bi in zip(a, b):
+                u &= ~self.xor(ai, bi)
+            return u
+        return ~self.xor(a, b)
+
+    def add(self, a, b, carry=None):
+        carry = carry if carry is not None else self.bdd.false
+        result = []
+        for ai, bi in zip(a, b):
+            t = self.xor(ai, bi)
+            result.append(self.xor(t, carry))
+            carry = (ai & bi) | (carry & t)
+        return result
+
+    def less(self, a, b, signed, strict):
+        """a < b (a <= b if not strict), computed from the least significant bit up."""
+        if signed:
+            a = a[:-1] + [ ~a[-1] ]
+            b = b[:-1] + [ ~b[-1] ]
+        lt = self.bdd.false if strict else self.bdd.true
+        for ai, bi in zip(a, b):
+            lt = (~ai & bi) | (~self.xor(ai, bi) & lt)
+        return lt
+
+    def value(self, e):
+        """Bits of a bit-vector value or enumeration constructor."""
+        if is_bv_value(e):
+            v, n = e.as_long(), e.size()
+        else:
+            sort = e.sort()
+            v = [ sort.constructor(i) for i in range(sort.num_constructors()) ].index(e.decl())
+            n = sort_bits(sort)
+        return [ self.bdd.true if v >> i & 1 else self.bdd.false for i in range(n) ]
+
+    def blast(self, e):
+        # the expression is kept in the cache, so that its id is not reused
+        key = e.get_id()
+        if key not in self.cache:
+            self.cache[key] = (e, self._blast(e))
+        return self.cache[key][1]
+
+    def _blast(self, e):
+        bdd = self.bdd
+        if is_true(e):
+            return bdd.true
+        if is_false(e):
+            return bdd.false
+        if is_bv_value(e):
+            return self.value(e)
+        k = e.decl().kind()
+        if k == Z3_OP_DT_CONSTRUCTOR:
+            return self.value(e)
+        if k == Z3_OP_UNINTERPRETED and e.num_args() == 0:
+            if e.get_id() not in self.consts:
+                raise KeyError("no BDD variables for " + str(e))
+            return self.consts[e.get_id()]
+        args = [ self.blast(c) for c in e.children() ]
+        if k == Z3_OP_AND:
+            u = bdd.true
+            for a in args:
+                u &= a
+            return u
+        if k == Z3_OP_OR:
+            u = bdd.false
+            for a in args:
+                u |= a
+            return u
+        if k == Z3_OP_NOT:
+            return ~args[0]
+        if k == Z3_OP_IMPLIES:
+            return ~args[0] | args[1]
+        if k == Z3_OP_XOR:
+            return self.xor(args[0], args[1])
+        if k == Z3_OP_EQ or k == Z3_OP_IFF:
+            return self.equal(args[0], args[1])
+        if k == Z3_OP_DISTINCT:
+            u = bdd.true
+            for i in range(len(args)):
+                for j in range(i):
+                    u &= ~self.equal(args[i], args[j])
+            return u
+        if k == Z3_OP_ITE:
+            c, a, b = args
+            if isinstance(a, list):
+                return [ bdd.ite(c, ai, bi) for ai, bi in zip(a, b) ]
+            return bdd.ite(c, a, b)
+        if k == Z3_OP_BADD:
+            u = args[0]
+            for a in args[1:]:
+                u = self.add(u, a)
+            return u
+        if k == Z3_OP_BSUB:
+            return self.add(args[0], [ ~b for b in args[1] ], bdd.true)
+        if k == Z3_OP_BNEG:
+            return self.add([ ~b for b in args[0] ], [ bdd.false ] * len(args[0]), bdd.true)
+        if k == Z3_OP_BNOT:
+            return [ ~b for b in args[0] ]
+        if k == Z3_OP_BAND:
+            return [ a & b for a, b in zip(args[0], args[1]) ]
+        if k == Z3_OP_BOR:
+            return [ a | b for a, b in zip(args[0], args[1]) ]
+        compare = { Z3_OP_SLT: (True, True, False), Z3_OP_SLEQ: (True, False, False),
+                    Z3_OP_SGT: (True, True, True), Z3_OP_SGEQ: (True, False, True),
+                    Z3_OP_ULT: (False, True, False), Z3_OP_ULEQ: (False, False, False),
+                    Z3_OP_UGT: (False, True, True), Z3_OP_UGEQ: (False, False, True) }
+        if k in compare:
+            signed, strict, swap = compare[k]
+            a, b = (args[1], args[0]) if swap else (args[0], args[1])
+            return self.less(a, b, signed, strict)
+        raise NotImplementedError("cannot bit-blast " + str(e.decl()))
+
+class SymbolicSystem:
+    """
+    BDDs of a TransitionSystem: init, bad and the transition relation, over
+    interleaved current/next bits of the state variables. Inputs only get
+    current bits (they are quantified in the image); rigid variables are
+    state variables that the relation keeps unchanged.
+
+    With partitioned, the relation is split into one conjunct per next
+    state variable, \\E (other next bits): T; this is exact for
+    deterministic relations such as the counter (press is an input), and
+    the parts are checked against the monolithic relation.
+    """
+
+    def __init__(self, system, bdd, partitioned=True):
+        self.system = system
+        self.bdd = bdd
+        self.blaster = BitBlaster(bdd)
+        V = system.variables(0)
+        W = system.variables(1)
+        self.names = {} # state variable -> current BDD variable names
+        self.prime = {}
+        next_names = {}
+        for n, sort in system.state_vars + system.rigid_vars:
+            width = sort_bits(sort)
+            names = [ n ] if width is None else [ "%s%d" % (n, i) for i in range(width) ]
+            for v in names:
+                bdd.declare(v)
+                if n not in system.inputs:
+                    bdd.declare(v + "'")
+                    self.prime[v] = v + "'"
+            self.names[n] = names
+            next_names[n] = [ v + "'" for v in names ]
+            self.blaster.declare(V[n], names[0] if width is None else names)
+            if n not in system.inputs and n in W and not W[n].eq(V[n]):
+                self.blaster.declare(W[n], next_names[n][0] if width is None else next_names[n])
+        self.init = self.blaster.blast(system.init(V))
+        self.bad = self.blaster.blast(system.bad(V))
+        T = self.blaster.blast(system.trans(V, W))
+        for n, _ in system.rigid_vars:
+            for v in self.names[n]:
+                T &= self.blaster.equal(bdd.var(v), bdd.var(self.prime[v]))
+        self.trans = T
+        parts = [ T ]
+        if partitioned:
+            all_next = set(self.prime.values())
+            parts = []
+            for n in self.names:
+                mine = set(next_names[n]) & all_next
+                if mine:
+                    parts.append(bdd.exist(all_next - mine, T))
+            conj = bdd.true
+            for p in parts:
+                conj &= p
+            if conj != T:
+                parts = [ T ] # nondeterministic: keep the monolithic relation
+        self.relation = PartitionedRelation(bdd, parts, self.prime, inputs=[ v for n in system.inputs
+                                                                               for v in self.names[n] ])
+
+    def decode(self, assignment):
+        """State variable values of one assignment to the current bits."""
+        state = {}
+        for n, sort in self.system.state_vars + self.system.rigid_vars:
+            if n in self.system.inputs:
+                continue
+            names = self.names[n]
+            if sort.kind() == Z3_BOOL_SORT:
+                state[n] = BoolVal(assignment[names[0]])
+                continue
+            v = sum( 1 << i for i, b in enumerate(names) if assignment[b] )
+            if sort.kind() == Z3_BV_SORT:
+                state[n] = BitVecVal(v, sort.size())
+            else:
+                state[n] = sort.constructor(v)()
+        return state
+
+    def trace(self, frontiers, k):
+        """A shortest path from init to a bad state through the frontiers 0..k."""
+        current = [ v for n, vs in self.names.items() if n not in self.system.inputs for v in vs ]
+        u = frontiers[k] & self.bad
+        path = []
+        for i in range(k, -1, -1):
+            assignment = self.bdd.pick(u, care_vars=current)
+            path.append(self.decode(assignment))
+            if i > 0:
+                state = self.bdd.cube({ v: assignment[v] for v in current })
+                u = frontiers[i-1] & self.relation.preimage(state)
+        path.reverse()
+        return path
+
+def bdd_check(system, backend='autoref', reorder=False, partitioned=True):
+    """
+    Decide system (bad states reachable or not, for any number of steps) by
+    BDD based forward reachability to the fixpoint. Returns (result, stats):
+    sat with a shortest trace (states only, inputs are not shown), or unsat
+    at the number of iterations of the fixpoint.
+    """
+    bdd = make_bdd(backend, reorder)
+    sym = SymbolicSystem(system, bdd, partitioned)
+    stats = forward_reach(sym.relation, sym.init, sym.bad, keep_frontiers=True)
+    if stats.hit is not None:
+        return Result(sat, stats.hit, sym.trace(stats.frontiers, stats.hit)), stats
+    return Result(unsat, stats.iterations), stats
+
+def benchmark(bits_list=(4, 8, 16, 32, 64), count_max_list=(5, 10, 20, 40), backend='autoref'):
+    """
+    BDD fixpoint against incremental SMT BMC on the counter of bmc.py, for
+    a reachable (x >= count_max, found at k = count_max + 1) and an
+    unreachable (x > count_max) property; BMC runs up to count_max + 2,
+    where it can only report unknown for the latter.
+    """
+    from bmc import counter_system
+    print("%6s %9s %10s %10s %10s %10s %10s" % ("bits", "count_max", "property", "bdd", "bdd time",
+                                                "bmc", "bmc time"))
+    for bits in bits_list:
+        for count_max in count_max_list:
+            for name, bad in (("reach", lambda V, c=count_max: V['x'] >= c),
+                              ("safe", lambda V, c=count_max: V['x'] > c)):
+                system = counter_system(bits=bits, count_max=count_max, bad=bad)
+                start = time.perf_counter()
+                result, stats = bdd_check(system, backend)
+                bdd_time = time.perf_counter() - start
+                start = time.perf_counter()
+                bmc_result = BMC(counter_system(bits=bits, count_max=count_max, bad=bad)).run(count_max + 2)
+                bmc_time = time.perf_counter() - start
+                print("%6d %9d %10s %10s %10.4f %10s %10.4f" % (bits, count_max, name,
+                      "%s@%d" % (result.status, result.k), bdd_time,
+                      "%s@%d" % (bmc_result.status, bmc_result.k), bmc_time))
+
+if __name__ == "__main__":
+    bits_list = [ int(b) for b in sys.argv[1].split(',') ] if len(sys.argv) > 1 else (4, 8, 16, 32, 64)
+    count_max_list = [ int(c) for c in sys.argv[2].split(',') ] if len(sys.argv) > 2 else (5, 10, 20, 40)
+    benchmark(bits_list, count_max_list)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+# BDD reachability on graphs given as edge lists
+#
+# week07bdd.py writes the transition relation of a 4 node graph as one
+# expression string; for real graphs with thousands of nodes the relation
+# is built here directly from the edge list: node i is encoded in
+# ceil(log2(n)) bits, current and next state bits are interleaved in the
+# variable order (x0 x0' x1 x1' ...), and the relation is the disjunction
+# of the edges, built as balanced trees (per source node over its
+# successors, then over the source nodes) so the intermediate BDDs stay
+# small. Reachability then runs on bdd_reach.py.
+#
+# run: python bdd_graph.py [edges.txt] [source] [--cudd] [--reorder]
+#
+# edges.txt has one edge "u v" per line (# starts a comment); without it
+# a random graph is generated.
+
+import importlib
+import random
+import sys
+import time
+
+from bdd_reach import PartitionedRelation, backward_reach, forward_reach
+
+def make_bdd(backend='autoref', reorder=False):
+    """
+    New BDD manager of dd.autoref or dd.cudd (falls back to dd.autoref if
+    dd.cudd is not compiled), with dynamic variable reordering on or off.
+    """
+    try:
+        module = importlib.import_module('dd.' + backend)
+    except ImportError:
+        print("dd.%s not available, using dd.autoref" % backend)
+        module = importlib.import_module('dd.autoref')
+    bdd = module.BDD()
+    bdd.configure(reordering=reorder)
+    return bdd
+
+def read_edges(path):
+    """
+    Read an edge list. Returns (nodes, edges): the node labels in order of
+    appearance and the edges as pairs of node indices.
+    """
+    index = {}
+    nodes = []
+    edges = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) < 2:
+                raise ValueError("bad edge line: " + line.strip())
+            pair = []
+            for label in fields[:2]:
+                if label not in index:
+                    index[label] = len(nodes)
+                    nodes.append(label)
+                pair.append(index[label])
+            edges.append(tuple(pair))
+    return nodes, edges
+
+def random_edges(n, degree=3, seed=0):
+    """A random graph on n nodes with degree successors per node."""
+    rng = random.Random(seed)
+    return [ (u, rng.randrange(n)) for u in range(n) for _ in range(degree) ]
+
+def balanced_or(bdd, us):
+    """Disjunction of the BDDs us as a balanced tree."""
+    us = list(us)
+    if not us:
+        return bdd.false
+    while len(us) > 1:
+        us = [ us[i] | us[i+1] if i + 1 < len(us) else us[i] for i in range(0, len(us), 2) ]
+    return us[0]
+
+class GraphEncoding:
+    """
+    Binary encoding of the nodes 0..n-1 in bits = ceil(log2(n)) variables
+    x0.. (least significant first), with interleaved next state copies.
+    """
+
+    def __init__(self, bdd, n):
+        self.bdd = bdd
+        self.n = n
+        self.bits = max(1, (n - 1).bit_length())
+        self.current = [ "x%d" % i for i in range(self.bits) ]
+        self.prime = { x: x + "'" for x in self.current }
+        for x in self.current:
+            bdd.declare(x, self.prime[x])
+
+    def cube(self, node, primed=False):
+        """The BDD of the single node (in the next state copy if primed)."""
+        return self.bdd.cube({ self.prime[x] if primed else x: bool(node >> i & 1)
+                               for i, x in enumerate(self.current) })
+
+    def nodes(self, u):
+        """Node indices in the set u (over the current state variables)."""
+        for assignment in self.bdd.pick_iter(u, care_vars=self.current):
+            yield sum( 1 << i for i, x in enumerate(self.current) if assignment[x] )
+
+    def count(self, u):
+        """Number of nodes in the set u."""
+        return int(self.bdd.count(u, nvars=self.bits))
+
+def graph_relation(enc, edges):
+    """Transition relation of the edges (pairs of node indices)."""
+    successors = {}
+    for u, v in edges:
+        successors.setdefault(u, set()).add(v)
+    per_source = [ enc.cube(u) & balanced_or(enc.bdd, ( enc.cube(v, True) for v in sorted(vs) ))
+                   for u, vs in sorted(successors.items()) ]
+    return balanced_or(enc.bdd, per_source)
+
+def load_graph(nodes, edges, backend='autoref', reorder=False):
+    """
+    Build the BDDs of a graph with the nodes 0..nodes-1. Returns the
+    encoding, the partitioned relation (a single part) for bdd_reach and
+    the construction time in seconds.
+    """
+    bdd = make_bdd(backend, reorder)
+    start = time.perf_counter()
+    enc = GraphEncoding(bdd, nodes)
+    T = graph_relation(enc, edges)
+    rel = PartitionedRelation(bdd, [ T ], enc.prime)
+    return enc, rel, time.perf_counter() - start
+
+def main():
+    args = [ a for a in sys.argv[1:] if not a.startswith('--') ]
+    backend = 'cudd' if '--cudd' in sys.argv else 'autoref'
+    reorder = '--reorder' in sys.argv
+    if args:
+        labels, edges = read_edges(args[0])
+    else:
+        labels = [ str(i) for i in range(5000) ]
+        edges = random_edges(len(labels))
+    source = labels.index(args[1]) if len(args) > 1 else 0
+    enc, rel, t = load_graph(len(labels), edges, backend, reorder)
+    print("%d nodes, %d edges, %d bits: relation with %d nodes built in %.3fs" % (
+        len(labels), len(edges), enc.bits, rel.nodes(), t))
+    for name, reach in (("forward", forward_reach), ("backward", backward_reach)):
+        start = time.perf_counter()
+        stats = reach(rel, enc.cube(source))
+        print("%s from %s: %d nodes in %.3fs, %s" % (name, labels[source], enc.count(stats.reached),
+              time.perf_counter() - start, stats))
+
+if __name__ == "__main__":
+    main()
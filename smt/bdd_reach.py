@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+# BDD reachability with frontiers and a partitioned transition relation
+#
+# least_fixpoint of week07bdd.py conjoins the monolithic transition BDD
+# with the renamed whole set q in every iteration. Here the transition
+# relation is kept as a list of conjuncts (e.g. one per next state bit or
+# per guarded command), and images are computed by conjoining one part at
+# a time, quantifying every variable as soon as no later part mentions it
+# (early quantification), so the full product never has to be built.
+# The fixpoints only compute the image (preimage) of the frontier, the
+# states found in the previous iteration, instead of all reached states.
+#
+# works with dd.autoref and dd.cudd (which has a fused and_exists), e.g.:
+#
+#   rel = PartitionedRelation(bdd, parts, {'x0': "x0'", 'x1': "x1'"})
+#   stats = backward_reach(rel, target)
+#   print(stats, stats.reached.to_expr())
+
+import sys
+
+def _and_exists(bdd, u, v, qvars):
+    """\\E qvars: u /\\ v, fused if the backend provides it."""
+    and_exists = getattr(sys.modules[type(bdd).__module__], 'and_exists', None)
+    if and_exists is not None:
+        return and_exists(u, v, qvars)
+    return bdd.exist(qvars, u & v)
+
+def _schedule(bdd, parts, qvars):
+    """
+    Early quantification schedule: a list of (part, variables) where the
+    variables of qvars are quantified right after conjoining the last part
+    that mentions them; also returns the qvars that no part mentions.
+    """
+    supports = [ bdd.support(p) & qvars for p in parts ]
+    schedule = []
+    later = set()
+    for part, support in reversed(list(zip(parts, supports))):
+        schedule.append((part, support - later))
+        later |= support
+    schedule.reverse()
+    return schedule, qvars - later
+
+def order_parts(bdd, parts, qvars):
+    """
+    Greedy order of the parts for early quantification: next the part that
+    lets the most variables of qvars be quantified (those no remaining part
+    mentions), then the one with the smaller BDD.
+    """
+    remaining = list(parts)
+    ordered = []
+    while remaining:
+        supports = [ bdd.support(p) & qvars for p in remaining ]
+        def score(i):
+            others = set().union(*(supports[:i] + supports[i+1:]))
+            return (-len(supports[i] - others), remaining[i].dag_size)
+        best = min(range(len(remaining)), key=score)
+        ordered.append(remaining.pop(best))
+    return ordered
+
+class PartitionedRelation:
+    """
+    Conjunctively partitioned transition relation T = part_1 /\\ ... /\\ part_n
+    over current and next state variables.
+
+    prime:  map from current state variable to its next state copy
+    inputs: variables that are neither (e.g. button presses), quantified in
+            the image and in the preimage
+    """
+
+    def __init__(self, bdd, parts, prime, inputs=(), reorder=True):
+        self.bdd = bdd
+        self.prime = dict(prime)
+        self.unprime = { v: k for k, v in self.prime.items() }
+        current = set(self.prime) | set(inputs)
+        nxt = set(self.prime.values()) | set(inputs)
+        parts = [ p for p in parts if p != bdd.true ]
+        self.post = _schedule(bdd, order_parts(bdd, parts, current) if reorder else parts, current)
+        self.pre = _schedule(bdd, order_parts(bdd, parts, nxt) if reorder else parts, nxt)
+
+    @staticmethod
+    def _apply(bdd, states, schedule):
+        (parts, unused) = schedule
+        u = bdd.exist(unused, states) if unused else states
+        for part, qvars in parts:
+            u = _and_exists(bdd, u, part, qvars)
+            if u == bdd.false:
+                break
+        return u
+
+    def image(self, states):
+        """Successors of states: \\E current: states /\\ T, renamed to current."""
+        return self.bdd.let(self.unprime, self._apply(self.bdd, states, self.post))
+
+    def preimage(self, states):
+        """Predecessors of states: \\E next: T /\\ states[current := next]."""
+        return self._apply(self.bdd, self.bdd.let(self.prime, states), self.pre)
+
+    def nodes(self):
+        """BDD nodes of the parts (shared nodes counted once per part)."""
+        return sum( part.dag_size for part, _ in self.post[0] )
+
+class ReachStats:
+    """
+    Outcome of a fixpoint: the reached set, number of iterations (images
+    computed), the node counts of the frontier and of the reached set per
+    iteration, the peak size of the BDD manager, and the first iteration in
+    which the stop set was hit (None if not hit or not given); with
+    keep_frontiers, frontiers holds the frontier BDD of every iteration
+    (for counterexample traces).
+    """
+
+    def __init__(self, direction):
+        self.direction = direction
+        self.reached = None
+        self.iterations = 0
+        self.frontier_nodes = []
+        self.reached_nodes = []
+        self.peak_nodes = 0
+        self.hit = None
+        self.frontiers = None
+
+    def __repr__(self):
+        return "ReachStats(%s, iterations=%d, reached_nodes=%d, peak_nodes=%d, hit=%s)" % (
+            self.direction, self.iterations, self.reached_nodes[-1] if self.reached_nodes else 0,
+            self.peak_nodes, self.hit)
+
+def _fixpoint(bdd, start, step, direction, stop=None, max_iterations=None, keep_frontiers=False):
+    stats = ReachStats(direction)
+    if keep_frontiers:
+        stats.frontiers = []
+    reached = start
+    frontier = start
+    while True:
+        stats.frontier_nodes.append(frontier.dag_size)
+        stats.reached_nodes.append(reached.dag_size)
+        stats.peak_nodes = max(stats.peak_nodes, len(bdd))
+        if keep_frontiers:
+            stats.frontiers.append(frontier)
+        if stop is not None and stats.hit is None and frontier & stop != bdd.false:
+            stats.hit = stats.iterations
+            break
+        if frontier == bdd.false:
+            break
+        if max_iterations is not None and stats.iterations >= max_iterations:
+            break
+        new = step(frontier) & ~reached
+        reached = reached | new
+        frontier = new
+        stats.iterations += 1
+    stats.reached = reached
+    return stats
+
+def forward_reach(rel, init, bad=None, max_iterations=None, keep_frontiers=False):
+    """
+    States reachable from init, by images of the frontier only. With bad
+    given, stops as soon as a bad state is reached (stats.hit is the
+    length of a shortest path to it).
+    """
+    return _fixpoint(rel.bdd, init, rel.image, 'forward', bad, max_iterations, keep_frontiers)
+
+def backward_reach(rel, target, init=None, max_iterations=None, keep_frontiers=False):
+    """
+    States that can reach target (least fixpoint of target \\/ pre(q)), by
+    preimages of the frontier only. With init given, stops as soon as an
+    initial state is found.
+    """
+    return _fixpoint(rel.bdd, target, rel.preimage, 'backward', init, max_iterations, keep_frontiers)
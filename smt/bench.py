@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+# benchmark harness for all models in this directory
+#
+# every script hard-codes its parameters and only prints; here each model
+# is a case function run over a grid of parameters, with repetitions, each
+# run in a fresh (spawned) process so that its peak RSS is its own. Wall
+# time, peak RSS, the result and the Z3 statistics() of the run are written
+# to a JSON file, and two such files (e.g. of two revisions) can be
+# compared:
+#
+# run: python bench.py [--quick] [--repetitions N] [--timeout S] [--only m1,m2] [--out file]
+#      python bench.py compare old.json new.json [--threshold 1.25]
+
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import z3
+
+from tracing import z3_statistics
+
+# the cases: each takes the grid parameters as keywords and returns a dict
+# with (at least) the result, and the Z3 statistics if a solver was used
+
+def case_counter_bmc(bits, bound):
+    from bmc import counter_system
+    from transition_system import BMC
+    engine = BMC(counter_system(bits=bits))
+    result = engine.run(bound)
+    return { 'result': str(result), 'z3': z3_statistics(engine.solver.statistics()) }
+
+def case_counter_kinduction(bits, bound):
+    from bmc import counter_system
+    from transition_system import KInduction
+    engine = KInduction(counter_system(bits=bits, bad=lambda V: V['x'] >= 11))
+    result = engine.run(bound)
+    return { 'result': str(result), 'z3': z3_statistics(engine.step.statistics()) }
+
+def case_counter_bdd(bits, count_max):
+    from bmc import counter_system
+    from bdd_fsm import bdd_check
+    result, stats = bdd_check(counter_system(bits=bits, count_max=count_max))
+    return { 'result': str(result), 'iterations': stats.iterations, 'peak_nodes': stats.peak_nodes }
+
+def case_gcd(bound):
+    from bmc_gcd import gcd_system
+    from transition_system import BMC
+    engine = BMC(gcd_system())
+    result = engine.run(bound)
+    return { 'result': str(result), 'z3': z3_statistics(engine.solver.statistics()) }
+
+def case_gcd_fixed_point(bound):
+    from bmc_gcd_fpsat import gcd_fixed_point_system
+    from transition_system import BMC
+    engine = BMC(gcd_fixed_point_system())
+    result = engine.run(bound)
+    return { 'result': str(result), 'z3': z3_statistics(engine.solver.statistics()) }
+
+def case_gcd_bv(bits, bound):
+    from bmc_gcd_fpsat_bv import gcd_bv_system
+    from transition_system import BMC
+    engine = BMC(gcd_bv_system(bits))
+    result = engine.run(bound)
+    return { 'result': str(result), 'z3': z3_statistics(engine.solver.statistics()) }
+
+def case_horn():
+    from bmc_gcd_fp import gcd_fixedpoint_demo
+    result, fp = gcd_fixedpoint_demo()
+    return { 'result': str(result), 'z3': z3_statistics(fp.statistics()) }
+
+def case_sudoku(encoding, puzzles):
+    import sudoku_bench
+    import z3_sudoku
+    s = z3_sudoku.make_solver(encoding)
+    solved = 0
+    for line in getattr(sudoku_bench, puzzles.upper()):
+        if z3_sudoku.solve_with(s, z3_sudoku.parse_puzzle(line), encoding) is not None:
+            solved += 1
+    return { 'result': "%d solved" % solved, 'z3': z3_statistics(s.statistics()) }
+
+def case_test_gen(encoding, sort, length, bits, tests):
+    import test_gen
+    make = test_gen.flat_encoding if encoding == 'flat' else test_gen.uf_encoding
+    s, x, y = make(length, bits, sort == 'int')
+    found = test_gen.generate_tests(s, x, y, length, bits, tests, verbose=False)
+    return { 'result': "%d tests" % len(found), 'z3': z3_statistics(s.statistics()) }
+
+def case_bdd_graph(nodes, backend):
+    from bdd_graph import load_graph, random_edges
+    from bdd_reach import forward_reach
+    enc, rel, build = load_graph(nodes, random_edges(nodes), backend)
+    stats = forward_reach(rel, enc.cube(0))
+    return { 'result': "%d reachable" % enc.count(stats.reached), 'build': build,
+             'iterations': stats.iterations, 'peak_nodes': stats.peak_nodes }
+
+# model -> (case, full grid, quick grid)
+MODELS = {
+    'counter-bmc': (case_counter_bmc, { 'bits': [ 8, 16, 64 ], 'bound': [ 15, 40 ] },
+                    { 'bits': [ 64 ], 'bound': [ 15 ] }),
+    'counter-kind': (case_counter_kinduction, { 'bits': [ 8, 16, 64 ], 'bound': [ 15 ] },
+                     { 'bits': [ 64 ], 'bound': [ 15 ] }),
+    'counter-bdd': (case_counter_bdd, { 'bits': [ 8, 16, 64 ], 'count_max': [ 10, 40 ] },
+                    { 'bits': [ 16 ], 'count_max': [ 10 ] }),
+    'gcd': (case_gcd, { 'bound': [ 5, 10, 20 ] }, { 'bound': [ 5 ] }),
+    'gcd-fp': (case_gcd_fixed_point, { 'bound': [ 5, 10, 20 ] }, { 'bound': [ 5 ] }),
+    'gcd-bv': (case_gcd_bv, { 'bits': [ 5, 8, 16, 32 ], 'bound': [ 5, 10 ] },
+               { 'bits': [ 8 ], 'bound': [ 5 ] }),
+    'horn': (case_horn, {}, {}),
+    'sudoku': (case_sudoku, { 'encoding': [ 'int', 'bool', 'bool-pb' ], 'puzzles': [ 'easy', 'hard' ] },
+               { 'encoding': [ 'int' ], 'puzzles': [ 'hard' ] }),
+    'test-gen': (case_test_gen, { 'encoding': [ 'uf', 'flat' ], 'sort': [ 'bv', 'int' ], 'length': [ 2, 5, 10 ],
+                                  'bits': [ 8, 32 ], 'tests': [ 3 ] },
+                 { 'encoding': [ 'uf' ], 'sort': [ 'bv', 'int' ], 'length': [ 5 ], 'bits': [ 32 ], 'tests': [ 3 ] }),
+    'bdd-graph': (case_bdd_graph, { 'nodes': [ 1000, 5000 ], 'backend': [ 'autoref', 'cudd' ] },
+                  { 'nodes': [ 1000 ], 'backend': [ 'cudd' ] }),
+}
+
+def grid(params):
+    """All combinations of a parameter grid, as dicts."""
+    names = sorted(params)
+    for values in itertools.product(*( params[n] for n in names )):
+        yield dict(zip(names, values))
+
+def _run_case(model, params):
+    """One run in a worker process: wall time, peak RSS (KiB) and the case output."""
+    case = MODELS[model][0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        output = case(**params)
+        seconds = time.perf_counter() - start
+    output['time'] = seconds
+    output['rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return output
+
+def run_case(model, params, timeout=None):
+    """Run a case in a fresh spawned process; status timeout if it takes longer than timeout seconds."""
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        pending = pool.apply_async(_run_case, (model, params))
+        try:
+            output = pending.get(timeout)
+            output['status'] = 'ok'
+        except multiprocessing.TimeoutError:
+            pool.terminate()
+            output = { 'status': 'timeout', 'time': timeout }
+        except Exception as e:
+            output = { 'status': 'error', 'error': repr(e) }
+    return output
+
+def revision():
+    """git revision of the working tree (with a + if it has local changes), or None."""
+    try:
+        rev = subprocess.run([ 'git', 'rev-parse', '--short', 'HEAD' ], capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run([ 'git', 'status', '--porcelain', '--untracked-files=no' ],
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(models=None, quick=False, repetitions=3, timeout=300, out='bench_results.json'):
+    """Run the grids of models (all by default) and write the results to out."""
+    results = []
+    for model in models or MODELS:
+        case, full, small = MODELS[model]
+        for params in grid(small if quick else full):
+            runs = []
+            for r in range(repetitions):
+                runs.append(run_case(model, params, timeout))
+                if runs[-1]['status'] != 'ok':
+                    break # do not repeat timeouts and errors
+            times = [ o['time'] for o in runs if o['status'] == 'ok' ]
+            entry = { 'model': model, 'params': params, 'runs': runs,
+                      'median_time': statistics.median(times) if times else None,
+                      'max_rss_kb': max(( o['rss_kb'] for o in runs if 'rss_kb' in o ), default=None) }
+            results.append(entry)
+            print("%-13s %-56s %-22s %10s %10s" % (model, json.dumps(params, sort_keys=True),
+                  runs[-1].get('result', runs[-1]['status']),
+                  "%.4f" % entry['median_time'] if times else '-', entry['max_rss_kb'] or '-'))
+    report = { 'revision': revision(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(), 'z3': z3.get_version_string(),
+               'machine': platform.machine(), 'repetitions': repetitions, 'quick': quick,
+               'results': results }
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print("results written to " + out)
+    return report
+
+def _key(entry):
+    return entry['model'] + ' ' + json.dumps(entry['params'], sort_keys=True)
+
+def compare(old_path, new_path, threshold=1.25):
+    """
+    Compare the median times and peak RSS of two result files, case by case.
+    Returns the number of regressions (new/old above threshold).
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print("old: %s (%s), new: %s (%s)" % (old['revision'], old['date'], new['revision'], new['date']))
+    old_entries = { _key(e): e for e in old['results'] }
+    regressions = 0
+    print("%-64s %10s %10s %7s %7s" % ("case", "old time", "new time", "time", "rss"))
+    for e in new['results']:
+        key = _key(e)
+        o = old_entries.get(key)
+        if o is None or o['median_time'] is None or e['median_time'] is None:
+            print("%-64s %10s %10s" % (key, '-' if o is None or o['median_time'] is None else "%.4f" % o['median_time'],
+                  '-' if e['median_time'] is None else "%.4f" % e['median_time']))
+            continue
+        ratio = e['median_time'] / o['median_time'] if o['median_time'] > 0 else 1.0
+        rss = e['max_rss_kb'] / o['max_rss_kb'] if o['max_rss_kb'] else 1.0
+        flag = ''
+        if ratio > threshold or rss > threshold:
+            flag = 'REGRESSION'
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = 'faster'
+        if e['runs'][-1].get('result') != o['runs'][-1].get('result'):
+            flag += ' result changed'
+        print("%-64s %10.4f %10.4f %6.2fx %6.2fx %s" % (key, o['median_time'], e['median_time'], ratio, rss, flag))
+    return regressions
+
+def main():
+    args = sys.argv[1:]
+    def option(name, default, convert=str):
+        if name in args:
+            i = args.index(name)
+            value = convert(args[i+1])
+            del args[i:i+2]
+            return value
+        return default
+    if args and args[0] == 'compare':
+        threshold = option('--threshold', 1.25, float)
+        sys.exit(1 if compare(args[1], args[2], threshold) else 0)
+    quick = '--quick' in args
+    repetitions = option('--repetitions', 1 if quick else 3, int)
+    timeout = option('--timeout', 300, float)
+    only = option('--only', None)
+    out = option('--out', 'bench_results.json')
+    models = only.split(',') if only else None
+    for model in models or ():
+        if model not in MODELS:
+            sys.exit("unknown model %s (models: %s)" % (model, ', '.join(MODELS)))
+    run(models, quick, repetitions, timeout, out)
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,10 @@
 
 from z3 import *
 
+from autotune import make_solver
+import tracing
+from transition_system import TransitionSystem
+
 # bounded model checking applied to counter example
 # other examples can be checked by redefining the bad states, initial states, and step and time transition relations appropriately, etc.
 
@@ -26,10 +30,38 @@ ControlLocation = ControlLocation.create()
 
 length = 15 # k: number of transition relation steps to unroll
 
-s = Solver() # instantiate a solver
+s = None # the solver of the engines below, instantiated per run by newRun (not on import)
 
+# debug output: print every solver query and the formulas involved (see
+# tracing.py; without a tracer, the formulas are never rendered)
 opt_debug = True
 
+# write a JSONL trace of all solver queries to this file (instead of the
+# debug output)
+opt_trace = None
+
+# write every solver query as an SMT-LIB2 file to this directory, to be
+# solved offline (see smt2_batch.py)
+opt_export = None
+
+# alternative termination check: keep an index-free projection of every
+# frame (quantifier eliminated image of the previous frontier), and only
+# check the newly reached frontier against the union of earlier frames,
+# instead of comparing the whole nested reach formulas of steps k and k-1
+opt_fp_frontier = False
+
+# classic unrolling instead of nested reach formulas: one transition
+# relation per step on fresh step variables, bad states checked under
+# assumptions, so the cost per step stays flat for large length
+opt_unroll = False
+
+# prove the property by k-induction instead of refuting it by BMC
+opt_kind = False
+
+# decide the property without a bound: bit-blast the counter into BDDs and
+# compute all reachable states to the fixpoint (see bdd_fsm.py)
+opt_bdd = False
+
 # alternative encoding of transition relation: 
 # checks if each transition is enabled, then 
 # essentially constructs a tree of each 
@@ -46,24 +78,43 @@ press=[] # list of steps for press variable press
 reachedList = []
 reachedAllList = []
 
-# allocate 1st vars
-x.append( BitVec('x0', bits ) ) # counter variable
-# x[0] : equals x0: value of x at step 0 (initial value)
-# x[1] : equals x1: value of x at step 1
-q.append( Const('q0',  ControlLocation) ) # control location
-press.append( Const('press0', BoolSort() )) # press variable
-
-reachedList.append( [] ) # append empty list (stores reach sets this direction)
-
-# bounded model checking for bound iterations
-def bmc(bound):
+# start an engine run: instantiate a solver (tuned configuration, see
+# autotune.py) and allocate the 1st vars, so importing this module (e.g.
+# for counter_system) builds neither
+def newRun():
+    global s
+    s = make_solver('counter')
+    del x[:], q[:], press[:], reachedList[:], reachedAllList[:]
+    allocateSteps(0)
+    # x[0] : equals x0: value of x at step 0 (initial value)
+    # x[1] : equals x1: value of x at step 1
+    reachedList.append( [] ) # append empty list (stores reach sets this direction)
+
+# initial states in terms of the step 0 variables
+def initStates():
     initList = []
     # note: leave input press unconstrained (so it can always be either true or false)
     initList.append( And( q[0] == ControlLocation.off, x[0] == 0 ) ) # q0 = off /\ x0 = 0
     if len(initList) > 1:
-        init = And( initList )
-    else:
-        init = initList[0]
+        return And( initList )
+    return initList[0]
+
+# bad states in terms of the k^th iteration variables
+# this is the negation of the property
+def badStates(k):
+    badList = []
+    #badList.append( q[k] == ControlLocation.on );
+    #badList.append( x[k] >= 5 );
+    badList.append( x[k] >= 10 );
+
+    if len(badList) > 1:
+        return Or( badList )
+    return badList[0]
+
+# bounded model checking for bound iterations
+def bmc(bound):
+    newRun()
+    init = initStates()
     
     reachedOld = False # no states reached in iteration 0-1
     reachedOldAll = init
@@ -90,28 +141,17 @@ def bmc(bound):
             break
         
         # write bad states in terms of the k^th iteration variables
-        # this is the negation of the property
-        badList = []
-        #badList.append( q[k] == ControlLocation.on );
-        #badList.append( x[k] >= 5 );
-        badList.append( x[k] >= 10 );
-        
-        if len(badList) > 1:
-            bad = Or( badList )
-        else:
-            bad = badList[0]
+        bad = badStates(k)
         
         nt = len(reachedList[k])
         rt = 1
         
         reachedOldAll = reachedAll
         if len(reachedList[k]) > 1:
-            print('trans')
             reachedAll = Or(reachedList[k])
         else:
-            print('reachedList')
-            print(reachedList)
             reachedAll = reachedList[k][0]
+        tracing.debug('reachedList', k=k, sets=len(reachedList[k]), formula=lambda: reachedList)
         reachedAllList.append( reachedAll )
         
         if k >= bound - 1:
@@ -123,24 +163,16 @@ def bmc(bound):
             break
 
         reachedBad = And(reachedAll, bad)
-        if opt_debug:
-            print("\n\nBMC check: ")
-            print(reachedBad)
-            print("\n\n")
+        tracing.debug('BMC check', k=k, formula=lambda: reachedBad)
         s.push() # save context
         s.add(reachedBad) # assert in smtlib
-        result = s.check() # check in smtlib
+        result = tracing.check(s, kind='bmc', bound=k) # check in smtlib
 
         #print result
         if result == sat:
             print("UNSAFE")
-            print("Old:\n")
-            print(reachedOldAll)
-            print("\nNew:\n")
-            print(reachedAll)
-            print("\nBad check:\n")
-            print(reachedBad)
-            print(s.model())
+            tracing.debug('unsafe', k=k, old=lambda: reachedOldAll, new=lambda: reachedAll,
+                          bad_check=lambda: reachedBad)
             print("Bad states reached after " + str( k ) + " iterations.")
             print(bad)
             
@@ -160,12 +192,7 @@ def bmc(bound):
         
         if k >= 1:
             s.push() # save context for fixpoint check
-            if opt_debug:
-                print("old:\n\n")
-                print(reachedOldAll)
-                print("new:\n\n")
-                print(reachedAll)
-                print("\n\n\n")
+            tracing.debug('fixpoint check', k=k, old=lambda: reachedOldAll, new=lambda: reachedAll)
 
             # this fixedpoint check is over all reachable states
             # for efficiency, probably want to consider frontier only; otherwise, probably want to project away all step indices (e.g., just variable name, not keeping track of step)
@@ -182,10 +209,10 @@ def bmc(bound):
 
             # TODO: probably need to substitute all indices away instead of only k-1, would want to have cached this from prior iterations
             
-            print(fixedPoint)
+            tracing.debug('fixedPoint', k=k, formula=lambda: fixedPoint)
             
             s.add( Not(fixedPoint) ) # validity check
-            result = s.check()
+            result = tracing.check(s, kind='fixpoint', bound=k)
             
             if result == unsat: # valid if negation unsat
                 print("TERMINATING: FIXED POINT")
@@ -197,16 +224,11 @@ def bmc(bound):
         
         for reached in reachedList[k]:
             print("k=" + str(k) + " nt=" + str(nt) + " rt=" + str(rt))
-            if opt_debug:
-                print(reached)
+            tracing.debug('reached', k=k, formula=lambda: reached)
             
             if k >= 1 and result == unsat:# and rt >= nt:
-                print("Old:\n")
-                print(reachedOldAll)
-                print("\nNew:\n")
-                print(reachedAll)
-                print("Fixedpoint:\n")
-                print(fixedPoint)
+                tracing.debug('safe', k=k, old=lambda: reachedOldAll, new=lambda: reachedAll,
+                              fixedPoint=lambda: fixedPoint)
                 terminate = 1
                 print("SAFE after " + str(k) + " iterations")
                 break
@@ -224,12 +246,9 @@ def bmc(bound):
                         treached = simplify(And(reached, t))
                         s.push()
                         s.add(treached)
-                        res = s.check()
-                        if True:#opt_debug:
-                            print("transition can be taken? " + str(res))
-                            print(treached)
-                            if res == sat:
-                                print(s.model())
+                        res = tracing.check(s, kind='enabled', bound=k)
+                        tracing.debug('transition can be taken?', k=k, result=str(res), formula=lambda: treached,
+                                      model=lambda: s.model() if res == sat else None)
                         s.pop()
                     
                         # only explore enabled transitions, no reason to continue down a branch if transitions cannot be taken
@@ -251,24 +270,28 @@ def bmc(bound):
 # other examples could be handled by defining this 
 # transition relation differently (replace elements of ts)
 def stepTransition(k):
+    ts = transitions(q[k], x[k], press[k], q[k+1], x[k+1])
+
+    tracing.debug('transitions', k=k, formula=lambda: ts)
+
+    return ts
+
+# transitions of the counter from the current (qc, xc, pressc) to the next (qn, xn) step
+def transitions(qc, xc, pressc, qn, xn, count_max = 10): # count_max: counter maximum value
     ts = [] # list of transitions
-    count_max = 10 # counter maximum value
 
     # off -> off
-    ts.append(  And(q[k] == ControlLocation.off, Not(press[k]), q[k+1] == ControlLocation.off, x[k+1] == x[k]) )
+    ts.append(  And(qc == ControlLocation.off, Not(pressc), qn == ControlLocation.off, xn == xc) )
 
     # off -> on
-    ts.append(  And(q[k] == ControlLocation.off, press[k], q[k+1] == ControlLocation.on, x[k+1] == x[k]) )
+    ts.append(  And(qc == ControlLocation.off, pressc, qn == ControlLocation.on, xn == xc) )
 
     # on -> on
-    #ts.append(  And(q[k] == ControlLocation.on, Not(press[k]), q[k+1] == ControlLocation.on, x[k+1] == x[k] + 1) )
-    ts.append(  And(q[k] == ControlLocation.on, Not(press[k]), x[k] < count_max, q[k+1] == ControlLocation.on, x[k+1] == x[k] + 1) )
+    #ts.append(  And(qc == ControlLocation.on, Not(pressc), qn == ControlLocation.on, xn == xc + 1) )
+    ts.append(  And(qc == ControlLocation.on, Not(pressc), xc < count_max, qn == ControlLocation.on, xn == xc + 1) )
 
     # on -> off
-    ts.append(  And(q[k] == ControlLocation.on, Or(press[k], x[k] >= count_max), q[k+1] == ControlLocation.off, x[k+1] == 0) )
-    
-    if opt_debug:
-        print(ts)
+    ts.append(  And(qc == ControlLocation.on, Or(pressc, xc >= count_max), qn == ControlLocation.off, xn == 0) )
 
 # from nuxmv representation   
 #    ((mode = off & !press) -> (next(mode) = off & next(x) = x)) &
@@ -277,8 +300,204 @@ def stepTransition(k):
 #    ((mode = on & (press | x >= count_max)) -> (next(mode) = off & next(x) = 0));
     return ts
 
+# the counter as a reusable TransitionSystem (see transition_system.py), with
+# its own step variables instead of the module level lists used by bmc()
+def counter_system(bits = bits, count_max = 10, bad = None):
+    explicit = None
+    if bad is None:
+        bad = lambda V: V['x'] >= 10
+        def explicit():
+            import explicit
+            return explicit.counter_explicit(bits, count_max, 10)
+    return TransitionSystem('counter',
+        [('q', ControlLocation), ('x', BitVecSort(bits)), ('press', BoolSort())],
+        init = lambda V: And(V['q'] == ControlLocation.off, V['x'] == 0),
+        trans = lambda V, W: Or(transitions(V['q'], V['x'], V['press'], W['q'], W['x'], count_max)),
+        bad = bad,
+        inputs = ['press'],
+        explicit = explicit)
+
+
+# index-free state variables (no step index), used for the cached projections
+xs = BitVec('x', bits)
+qs = Const('q', ControlLocation)
+presss = Const('press', BoolSort())
+
+# eliminates the quantified step variables of an image and keeps the result small
+projectTactic = Then(Tactic('simplify'), Tactic('qe'), Tactic('ctx-solver-simplify'))
+
+# allocate the step variables up to step k
+def allocateSteps(k):
+    while len(x) <= k:
+        i = len(x)
+        x.append( BitVec('x' + str(i), bits ) )
+        q.append( Const('q'+ str(i),  ControlLocation) )
+        press.append( Const('press'+ str(i), BoolSort() ))
+
+# rename step i variables into the index-free variables (or back with toStep)
+def projectStep(f, i):
+    return substitute(f, (q[i],qs), (x[i],xs), (press[i],presss))
+
+def toStep(f, i):
+    return substitute(f, (qs,q[i]), (xs,x[i]), (presss,press[i]))
+
+# image of an index-free set of states: exists step 0 variables such that the
+# set holds at step 0 and some transition leads to step 1, projected back to
+# index-free variables; press at step 1 stays unconstrained (it is an input)
+def image(states):
+    img = Exists([q[0], x[0], press[0]], And(toStep(states, 0), Or(stepTransition(0))))
+    return projectStep(projectTactic(img).as_expr(), 1)
+
+# bounded model checking with frontier-based fixed point check
+# reachProjectedList[j] caches the index-free projection of frame j, so
+# each query only involves the current frontier and these small formulas
+def bmc_frontier(bound):
+    newRun()
+    allocateSteps(1)
+    frontier = projectStep(initStates(), 0)
+    reachProjectedList = []
+
+    for k in range(bound):
+        # only states not reached in earlier frames are new
+        if len(reachProjectedList) > 0:
+            s.push()
+            s.add( frontier, Not(Or(reachProjectedList)) )
+            result = tracing.check(s, kind='fixpoint', bound=k)
+            s.pop()
+            if result == unsat:
+                print("TERMINATING: FIXED POINT after " + str(k) + " iterations, unsafe states not found, safe (for any k)")
+                return 0
+            frontier = projectTactic(And(frontier, Not(Or(reachProjectedList)))).as_expr()
+        reachProjectedList.append(frontier)
+
+        tracing.debug('frontier', k=k, formula=lambda: frontier)
+
+        # bad states only need to be checked on the new frontier
+        s.push()
+        s.add( frontier, projectStep(badStates(0), 0) )
+        result = tracing.check(s, kind='bmc', bound=k)
+        s.pop()
+        if result == sat:
+            print("UNSAFE")
+            print("Bad states reached after " + str(k) + " iterations.")
+            counterexample(k)
+            return 0
+
+        # the frontier only needs to be expanded by one more step
+        frontier = image(frontier)
+
+    print("Terminated without finding a path to bad states after " + str(bound) + " iterations.")
+    return 0
+
+# reconstruct a counterexample trace of length k by unrolling the steps
+def counterexample(k):
+    allocateSteps(k)
+    s.push()
+    s.add( initStates() )
+    for i in range(k):
+        s.add( Or(stepTransition(i)) )
+    s.add( badStates(k) )
+    if tracing.check(s, kind='counterexample', bound=k) == sat:
+        printTrace(s.model(), k)
+    s.pop()
+
+def printTrace(model, k):
+    print("Counterexample trace:")
+    for i in range(0, k+1):
+        print("step " + str(i) + "/" + str(k) + " state:")
+        print("mode: " + str(model[q[i]]))
+        print("x: " + str(model[x[i]]))
+        print("press: " + str(model[press[i]]))
+
+# classic bounded model checking by unrolling: the initial states are
+# asserted once, then one transition relation per step over fresh step
+# variables; bad states of step k are only enabled under an assumption
+# literal, so the solver (and everything it learned) is reused for every k
+# and the per-step cost does not grow with the reach formulas
+def bmc_unroll(bound):
+    newRun()
+    s.push()
+    s.add( initStates() )
+    for k in range(bound):
+        allocateSteps(k+1)
+        checkBad = Bool('bad' + str(k))
+        s.add( Implies(checkBad, badStates(k)) )
+        result = tracing.check(s, checkBad, kind='bmc', bound=k)
+        print("k=" + str(k) + " " + str(result))
+        if result == sat:
+            print("UNSAFE")
+            print("Bad states reached after " + str(k) + " iterations.")
+            printTrace(s.model(), k)
+            s.pop()
+            return 0
+        s.add( Not(checkBad) ) # retire bad states of step k
+        s.add( Or(stepTransition(k)) )
+    print("Terminated without finding a path to bad states after " + str(bound) + " iterations.")
+    s.pop()
+    return 0
+
+# k-induction: the base case is the unrolling of bmc_unroll (initial states,
+# k transitions, bad states at step k), the inductive step starts from
+# any state, assumes the property holds for k+1 consecutive states on a
+# simple path (pairwise different states) and checks if the next state
+# can be bad; both solvers are extended incrementally, one step per k
+def kinduction(bound):
+    allocateSteps(0)
+    base = make_solver('counter')
+    step = make_solver('counter')
+    base.add( initStates() )
+    for k in range(bound):
+        allocateSteps(k+1)
+
+        # base case: bad states reachable in exactly k steps?
+        checkBad = Bool('bad' + str(k))
+        base.add( Implies(checkBad, badStates(k)) )
+        result = tracing.check(base, checkBad, kind='kind-base', bound=k)
+        if result == sat:
+            print("UNSAFE")
+            print("Bad states reached after " + str(k) + " iterations.")
+            printTrace(base.model(), k)
+            return 0
+        base.add( Not(checkBad) )
+        base.add( Or(stepTransition(k)) )
+
+        # inductive step: k+1 good states on a simple path, then a bad one
+        step.add( Not(badStates(k)) )
+        step.add( Or(stepTransition(k)) )
+        for i in range(k+1):
+            step.add( Or(q[i] != q[k+1], x[i] != x[k+1]) )
+        checkStep = Bool('step' + str(k+1))
+        step.add( Implies(checkStep, badStates(k+1)) )
+        result = tracing.check(step, checkStep, kind='kind-step', bound=k)
+        step.add( Not(checkStep) )
+        print("k=" + str(k) + " base: unsat step: " + str(result))
+        if result == unsat:
+            print("SAFE: property is " + str(k+1) + "-inductive, bad states unreachable (for any k)")
+            return 0
+    print("Terminated without proof or counterexample after " + str(bound) + " iterations.")
+    return 0
 
 # call BMC for length iterations
-bmc(length)
+if __name__ == '__main__':
+    if opt_export:
+        from smt2_batch import Smt2Exporter
+        tracing.set_tracer(Smt2Exporter(opt_export))
+    elif opt_trace:
+        tracing.set_tracer(tracing.JsonlTracer(opt_trace))
+    elif opt_debug:
+        tracing.set_tracer(tracing.PrintTracer())
+    if opt_kind:
+        kinduction(length)
+    elif opt_bdd:
+        from bdd_fsm import bdd_check
+        result, stats = bdd_check(counter_system(bits))
+        print(result, stats)
+        result.print_trace()
+    elif opt_unroll:
+        bmc_unroll(length)
+    elif opt_fp_frontier:
+        bmc_frontier(length)
+    else:
+        bmc(length)
 
 
@@ -1,60 +1,218 @@
 #!/usr/bin/env python3
 
+import time
+
 from z3 import *
 
-def gcd_bmc(k):
+from autotune import make_solver
+import tracing
+from transition_system import TransitionSystem
+
+def gcd_init(X, Y, G):
+    """
+    Initial constraints: let x_0, y_0 > 0, and G is a positive integer dividing both.
+    """
+    return [X[0] > 0, Y[0] > 0, G > 0, X[0] % G == 0, Y[0] % G == 0]
+
+def gcd_step(X, Y, i):
+    """
+    Euclid's step: if x_i > y_i then (x_{i+1}, y_{i+1}) = (x_i - y_i, y_i)
+    otherwise (x_{i+1}, y_{i+1}) = (x_i, y_i - x_i)
+    """
+    return Or(
+        And(X[i] > Y[i],
+            X[i+1] == X[i] - Y[i],
+            Y[i+1] == Y[i]),
+        And(X[i] <= Y[i],
+            Y[i+1] == Y[i] - X[i],
+            X[i+1] == X[i])
+    )
+
+def gcd_violation(X, Y, G, k):
+    """
+    Violation condition: at step k, y_k = 0 but x_k != G.
+    """
+    return And(Y[k] == 0, X[k] != G)
+
+def gcd_sign_violation(X, Y, G, k):
+    """
+    Violation of the (inductive) invariant x_k > 0 and y_k >= 0.
+    """
+    return Or(X[k] <= 0, Y[k] < 0)
+
+def gcd_bmc(k, verbose=True):
     """
     Perform bounded model checking on the GCD algorithm, unrolled k steps.
     Looks for a violation where y_k == 0 but x_k != G,
     where G divides both x_0 and y_0.
+
+    Returns (result, encode_time, solve_time), times in seconds.
     """
-    solver = Solver()
+    start = time.perf_counter()
+    solver = make_solver('gcd')
 
     # Create symbolic variables for each step
     X = [Int(f'x_{i}') for i in range(k+1)]
     Y = [Int(f'y_{i}') for i in range(k+1)]
-    
+
     # A symbolic candidate for gcd(x_0, y_0)
     G = Int('G')
 
-    # Initial constraints: let x_0, y_0 > 0, and G is a positive integer dividing both
-    solver.add(X[0] > 0, Y[0] > 0, G > 0)
-    solver.add(X[0] % G == 0, Y[0] % G == 0)
+    solver.add(gcd_init(X, Y, G))
 
     # Encode the transitions for i in [0..k-1]
-    # Euclid's step: if x_i > y_i then (x_{i+1}, y_{i+1}) = (x_i - y_i, y_i)
-    # otherwise (x_{i+1}, y_{i+1}) = (x_i, y_i - x_i)
     for i in range(k):
-        solver.add(
-            Or(
-                And(X[i] > Y[i],
-                    X[i+1] == X[i] - Y[i],
-                    Y[i+1] == Y[i]),
-                And(X[i] <= Y[i],
-                    Y[i+1] == Y[i] - X[i],
-                    X[i+1] == X[i])
-            )
-        )
-
-    # Violation condition: at step k, y_k = 0 but x_k != G.
-    # We ask if there's any solution (SAT) to that scenario
-    solver.add(Y[k] == 0, X[k] != G)
+        solver.add(gcd_step(X, Y, i))
+
+    # We ask if there's any solution (SAT) to the violation scenario
+    solver.add(gcd_violation(X, Y, G, k))
+    encode_time = time.perf_counter() - start
 
     # Check for satisfiability
-    result = solver.check()
-    if result == sat:
-        print(f"[BMC k={k}] Counterexample found!")
-        print("Model (one possible assignment):")
-        print(solver.model())
-    else:
-        print(f"[BMC k={k}] No counterexample found (UNSAT).")
+    start = time.perf_counter()
+    result = tracing.check(solver, kind='gcd', bound=k)
+    solve_time = time.perf_counter() - start
+    if verbose:
+        if result == sat:
+            print(f"[BMC k={k}] Counterexample found!")
+            print("Model (one possible assignment):")
+            print(solver.model())
+        else:
+            print(f"[BMC k={k}] No counterexample found (UNSAT).")
+    return result, encode_time, solve_time
 
 
-def run_bmc_up_to(max_k):
+def gcd_bmc_incremental(max_k, verbose=True):
+    """
+    Same sweep as run_bmc_up_to, but keeps one solver alive across bounds.
+    Only the new Euclid step is added for each k; the violation at step k
+    is guarded by an assumption literal, which is retired afterwards so
+    the learned clauses stay valid for the next bound.
+
+    Returns a list of (k, result, encode_time, solve_time).
+    """
+    solver = make_solver('gcd')
+    X = [Int('x_0')]
+    Y = [Int('y_0')]
+    G = Int('G')
+    solver.add(gcd_init(X, Y, G))
+
+    results = []
+    for k in range(1, max_k+1):
+        start = time.perf_counter()
+        X.append(Int(f'x_{k}'))
+        Y.append(Int(f'y_{k}'))
+        solver.add(gcd_step(X, Y, k-1))
+        check_k = Bool(f'check_{k}')
+        solver.add(Implies(check_k, gcd_violation(X, Y, G, k)))
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = tracing.check(solver, check_k, kind='gcd', bound=k)
+        solve_time = time.perf_counter() - start
+        if verbose:
+            if result == sat:
+                print(f"[BMC k={k}] Counterexample found!")
+                print("Model (one possible assignment):")
+                print(solver.model())
+            else:
+                print(f"[BMC k={k}] No counterexample found (UNSAT).")
+
+        # retire the violation of this bound
+        solver.add(Not(check_k))
+        results.append((k, result, encode_time, solve_time))
+    return results
+
+
+def gcd_kinduction(max_k, violation=gcd_violation):
+    """
+    Try to prove that `violation` is unreachable by k-induction, for k up to max_k.
+
+    Base case: the incremental BMC query (init, k Euclid steps, violation at k).
+    Inductive step: k+1 states without violation, pairwise different
+    (simple path), connected by Euclid steps, followed by a violating state;
+    no initial constraints. If the step is UNSAT the property holds for all k.
+    Both solvers are extended by one step per k, checks use assumption literals.
+
+    Returns (result, k): sat if a counterexample of length k was found,
+    unsat if the property is k-inductive, unknown if max_k was reached.
+    """
+    base = make_solver('gcd')
+    step = make_solver('gcd')
+    X = [Int('x_0')]
+    Y = [Int('y_0')]
+    G = Int('G')
+    base.add(gcd_init(X, Y, G))
+
+    for k in range(max_k+1):
+        # base case: a violation reachable in exactly k steps?
+        check_k = Bool(f'check_{k}')
+        base.add(Implies(check_k, violation(X, Y, G, k)))
+        result = tracing.check(base, check_k, kind='gcd-kind-base', bound=k)
+        if result == sat:
+            print(f"[k-induction k={k}] Base case: counterexample found!")
+            print("Model (one possible assignment):")
+            print(base.model())
+            return sat, k
+        base.add(Not(check_k))
+
+        X.append(Int(f'x_{k+1}'))
+        Y.append(Int(f'y_{k+1}'))
+        base.add(gcd_step(X, Y, k))
+
+        # inductive step: k+1 good states on a simple path, then a violation
+        step.add(Not(violation(X, Y, G, k)))
+        step.add(gcd_step(X, Y, k))
+        for i in range(k+1):
+            step.add(Or(X[i] != X[k+1], Y[i] != Y[k+1]))
+        step_k = Bool(f'step_{k+1}')
+        step.add(Implies(step_k, violation(X, Y, G, k+1)))
+        result = tracing.check(step, step_k, kind='gcd-kind-step', bound=k)
+        step.add(Not(step_k))
+        if result == unsat:
+            print(f"[k-induction k={k+1}] Property is {k+1}-inductive, no violation for any k.")
+            return unsat, k+1
+        print(f"[k-induction k={k}] Base case UNSAT, inductive step {result}.")
+    return unknown, max_k
+
+def gcd_system(violation=gcd_violation):
+    """
+    The GCD model as a TransitionSystem (see transition_system.py), reusing
+    the constraints above on the two-step lists [V, W]; G is rigid.
+    """
+    return TransitionSystem('gcd',
+        [('x', IntSort()), ('y', IntSort())],
+        init=lambda V: And(gcd_init([V['x']], [V['y']], V['G'])),
+        trans=lambda V, W: gcd_step([V['x'], W['x']], [V['y'], W['y']], 0),
+        bad=lambda V: violation([V['x']], [V['y']], V['G'], 0),
+        rigid_vars=[('G', IntSort())])
+
+def run_bmc_up_to(max_k, incremental=False):
     print("=== Bounded Model Checking (BMC) for GCD ===")
+    if incremental:
+        gcd_bmc_incremental(max_k)
+        return
     for k in range(1, max_k+1):
         gcd_bmc(k)
 
+
+def compare_bmc_modes(max_k):
+    """
+    Print per-k encode and solve times of the from-scratch and the
+    incremental sweep side by side.
+    """
+    print("=== BMC for GCD: from-scratch vs incremental (seconds) ===")
+    incremental = gcd_bmc_incremental(max_k, verbose=False)
+    print(f"{'k':>3} {'result':>7} {'enc':>8} {'solve':>8} | {'enc inc':>8} {'solve inc':>9}")
+    total, total_inc = 0.0, 0.0
+    for k, result_inc, enc_inc, solve_inc in incremental:
+        result, enc, solve = gcd_bmc(k, verbose=False)
+        assert result == result_inc
+        total += enc + solve
+        total_inc += enc_inc + solve_inc
+        print(f"{k:>3} {str(result):>7} {enc:8.4f} {solve:8.4f} | {enc_inc:8.4f} {solve_inc:9.4f}")
+    print(f"total: from-scratch {total:.4f}, incremental {total_inc:.4f}")
+
 if __name__ == "__main__":
     # Run bounded model checking from k = 1 to k = 5
     run_bmc_up_to(5)
@@ -8,6 +8,8 @@ def gcd_fixedpoint_demo():
     to encode reachability in the Euclid GCD transition system.
     We query if there's a reachable state with y=0 and x != 1.
     (This is just a toy property to show how to use Fixedpoint.)
+    Returns the query result and the Fixedpoint object (e.g. for its
+    statistics()).
     """
     # Declare sorts (integers)
     x, y, x0, y0 = Ints('x y x0 y0')
@@ -57,6 +59,7 @@ def gcd_fixedpoint_demo():
         print(fp.get_answer())
     else:
         print("No such state is reachable (given the constraints).")
+    return res, fp
 
 
 if __name__ == "__main__":
@@ -1,79 +1,234 @@
 #!/usr/bin/env python3
 
+import multiprocessing
+import os
+import time
+
 from z3 import *
 
-def gcd_bmc_with_fixed_point(k):
+from autotune import make_solver, solver_config
+import tracing
+from solver_cache import CachedSolver
+from transition_system import TransitionSystem
+
+def gcd_init(X, Y, G):
+    """
+    Initial constraints: x_0, y_0 > 0 and G > 0 divides both.
+    """
+    return [X[0] > 0, Y[0] > 0, G > 0, X[0] % G == 0, Y[0] % G == 0]
+
+def gcd_step(X, Y, i):
+    """
+    Standard Euclid transition from step i to step i+1:
+      if x_i > y_i:
+          (x_{i+1}, y_{i+1}) = (x_i - y_i, y_i)
+      else:
+          (x_{i+1}, y_{i+1}) = (x_i, y_i - x_i)
+    """
+    return Or(
+        And(X[i] > Y[i],
+            X[i+1] == X[i] - Y[i],
+            Y[i+1] == Y[i]),
+        And(X[i] <= Y[i],
+            X[i+1] == X[i],
+            Y[i+1] == Y[i] - X[i])
+    )
+
+def gcd_fixed_violation(X, Y, G, k):
+    """
+    Fixed-point constraint at step k -> k+1, i.e. (x_{k+1}, y_{k+1}) = (x_k, y_k),
+    together with the violation y_{k+1} == 0 but x_{k+1} != G.
+    """
+    return And(X[k+1] == X[k], Y[k+1] == Y[k], Y[k+1] == 0, X[k+1] != G)
+
+def gcd_bmc_with_fixed_point(k, verbose=True, ctx=None, cache=None):
     """
     Unroll the GCD loop k steps, then add a "fixed point" constraint
     at step k -> k+1, and check if there's a stable state that violates
     gcd correctness (i.e., y=0 but x != G).
+    With cache (a solver_cache.SolverCache), a query solved before is
+    answered from the cache.
+
+    Returns (result, encode_time, solve_time, model), times in seconds,
+    model as text or None.
     """
 
-    solver = Solver()
+    start = time.perf_counter()
+    solver = make_solver('gcd_fp', ctx)
+    if cache is not None:
+        solver = CachedSolver(solver, cache, { 'family': 'gcd_fp', 'config': solver_config('gcd_fp') })
 
     # Create symbolic variables for each step: x_i, y_i for i in [0..k+1]
     # We'll have (k+2) states in total: 0..k plus the "fixed" state k+1.
-    X = [Int(f'x_{i}') for i in range(k+2)]
-    Y = [Int(f'y_{i}') for i in range(k+2)]
+    X = [Int(f'x_{i}', ctx) for i in range(k+2)]
+    Y = [Int(f'y_{i}', ctx) for i in range(k+2)]
 
     # A symbolic candidate for gcd(x_0, y_0)
-    G = Int('G')
+    G = Int('G', ctx)
 
     # -------------------------------------
     # 1) Initial constraints
     # -------------------------------------
-    solver.add(X[0] > 0, Y[0] > 0, G > 0)
-    solver.add(X[0] % G == 0, Y[0] % G == 0)
+    solver.add(gcd_init(X, Y, G))
 
     # -------------------------------------
     # 2) Encode standard Euclid transitions for i in [0..k-1]
     #    (these are the "unrolled" steps)
     # -------------------------------------
-    #   if x_i > y_i:
-    #       (x_{i+1}, y_{i+1}) = (x_i - y_i, y_i)
-    #   else:
-    #       (x_{i+1}, y_{i+1}) = (x_i, y_i - x_i)
     for i in range(k):
-        solver.add(
-            Or(
-                And(X[i] > Y[i],
-                    X[i+1] == X[i] - Y[i],
-                    Y[i+1] == Y[i]),
-                And(X[i] <= Y[i],
-                    X[i+1] == X[i],
-                    Y[i+1] == Y[i] - X[i])
-            )
-        )
-
-    # -------------------------------------
-    # 3) Fixed-point constraint at step k -> k+1
-    #    i.e. (x_{k+1}, y_{k+1}) = (x_k, y_k)
-    # -------------------------------------
-    solver.add(X[k+1] == X[k], Y[k+1] == Y[k])
+        solver.add(gcd_step(X, Y, i))
 
     # -------------------------------------
+    # 3) Fixed-point constraint at step k -> k+1 and
     # 4) "Violation" condition:
     #    We want to see if there's a stable state with y=0 but x != G.
     #    That is, at step (k+1), if y_{k+1} == 0 but x_{k+1} != G,
     #    do we have a model (SAT)?
     # -------------------------------------
-    solver.add(Y[k+1] == 0, X[k+1] != G)
+    solver.add(gcd_fixed_violation(X, Y, G, k))
+    encode_time = time.perf_counter() - start
 
     # -------------------------------------
     # 5) Check satisfiability
     # -------------------------------------
-    result = solver.check()
-    if result == sat:
-        print(f"[Fixed-Point BMC k={k}] Found a stable state violating gcd!")
-        print("Model (one possible assignment):")
-        print(solver.model())
-    else:
-        print(f"[Fixed-Point BMC k={k}] UNSAT - No bad stable state found.")
-
-def run_bmc_fixed_up_to(max_k):
+    start = time.perf_counter()
+    result = tracing.check(solver, kind='gcd-fp', bound=k)
+    solve_time = time.perf_counter() - start
+    if verbose:
+        if result == sat:
+            print(f"[Fixed-Point BMC k={k}] Found a stable state violating gcd!")
+            print("Model (one possible assignment):")
+            print(solver.model())
+        else:
+            print(f"[Fixed-Point BMC k={k}] UNSAT - No bad stable state found.")
+    # the model as text (None unless sat), so it can leave a worker process
+    model = str(solver.model()) if result == sat else None
+    return result, encode_time, solve_time, model
+
+def gcd_bmc_with_fixed_point_incremental(max_k, verbose=True):
+    """
+    Same sweep as run_bmc_fixed_up_to, but with one solver kept alive
+    across bounds. Each k adds only the Euclid step k-1 -> k; the
+    fixed-point and violation constraints of bound k are guarded by an
+    assumption literal and retired afterwards, so step k+1 can be reused
+    as a regular unrolled step by the next bound.
+
+    Returns a list of (k, result, encode_time, solve_time).
+    """
+    solver = make_solver('gcd_fp')
+    X = [Int('x_0'), Int('x_1')]
+    Y = [Int('y_0'), Int('y_1')]
+    G = Int('G')
+    solver.add(gcd_init(X, Y, G))
+
+    results = []
+    for k in range(1, max_k+1):
+        start = time.perf_counter()
+        X.append(Int(f'x_{k+1}'))
+        Y.append(Int(f'y_{k+1}'))
+        solver.add(gcd_step(X, Y, k-1))
+        check_k = Bool(f'check_{k}')
+        solver.add(Implies(check_k, gcd_fixed_violation(X, Y, G, k)))
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = tracing.check(solver, check_k, kind='gcd-fp', bound=k)
+        solve_time = time.perf_counter() - start
+        if verbose:
+            if result == sat:
+                print(f"[Fixed-Point BMC k={k}] Found a stable state violating gcd!")
+                print("Model (one possible assignment):")
+                print(solver.model())
+            else:
+                print(f"[Fixed-Point BMC k={k}] UNSAT - No bad stable state found.")
+
+        # retire the fixed-point/violation constraints of this bound
+        solver.add(Not(check_k))
+        results.append((k, result, encode_time, solve_time))
+    return results
+
+def gcd_fixed_point_system():
+    """
+    The fixed-point GCD model as a TransitionSystem (see transition_system.py):
+    a bad state is a stable state (the Euclid step maps it onto itself)
+    with y == 0 but x != G.
+    """
+    def bad(V):
+        X = [V['x'], V['x']]
+        Y = [V['y'], V['y']]
+        return And(gcd_step(X, Y, 0), gcd_fixed_violation(X, Y, V['G'], 0))
+    return TransitionSystem('gcd_fp',
+        [('x', IntSort()), ('y', IntSort())],
+        init=lambda V: And(gcd_init([V['x']], [V['y']], V['G'])),
+        trans=lambda V, W: gcd_step([V['x'], W['x']], [V['y'], W['y']], 0),
+        bad=bad,
+        rigid_vars=[('G', IntSort())])
+
+def run_bmc_fixed_up_to(max_k, incremental=False, cache=None):
     print("=== Bounded Model Checking (with Fixed-Point Step) for GCD ===")
+    if incremental:
+        gcd_bmc_with_fixed_point_incremental(max_k)
+        return
     for k in range(1, max_k+1):
-        gcd_bmc_with_fixed_point(k)
+        gcd_bmc_with_fixed_point(k, cache=cache)
+
+# z3 context of a worker process of the parallel sweep
+_worker_ctx = None
+
+def _init_worker():
+    global _worker_ctx
+    _worker_ctx = Context()
+
+def _check_bound(k):
+    result, encode_time, solve_time, model = gcd_bmc_with_fixed_point(k, verbose=False, ctx=_worker_ctx)
+    return k, str(result), encode_time, solve_time, model
+
+def run_bmc_fixed_parallel(max_k, workers=None):
+    """
+    Parallel version of run_bmc_fixed_up_to: the bounds 1..max_k are
+    independent queries, so they are spread over a process pool (one z3
+    context per worker). Results are reported in bound order as they
+    arrive; when bound k has a counterexample, the pool is terminated, which
+    cancels all outstanding work for larger bounds.
+
+    Returns the smallest bound with a counterexample, or None.
+    """
+    print("=== Bounded Model Checking (with Fixed-Point Step) for GCD, parallel ===")
+    workers = workers or os.cpu_count()
+    # spawn: fresh interpreters, no z3 state inherited from this process
+    pool = multiprocessing.get_context('spawn').Pool(workers, initializer=_init_worker)
+    found = None
+    try:
+        for k, result, encode_time, solve_time, model in pool.imap(_check_bound, range(1, max_k+1)):
+            if result == 'sat':
+                print(f"[Fixed-Point BMC k={k}] Found a stable state violating gcd! ({solve_time:.4f}s)")
+                print("Model (one possible assignment):")
+                print(model)
+                found = k
+                break
+            print(f"[Fixed-Point BMC k={k}] {result.upper()} - No bad stable state found. ({solve_time:.4f}s)")
+    finally:
+        # kills workers still solving larger bounds
+        pool.terminate()
+        pool.join()
+    return found
+
+def compare_bmc_fixed_modes(max_k):
+    """
+    Print per-k encode and solve times of the from-scratch and the
+    incremental sweep side by side.
+    """
+    print("=== Fixed-Point BMC for GCD: from-scratch vs incremental (seconds) ===")
+    incremental = gcd_bmc_with_fixed_point_incremental(max_k, verbose=False)
+    print(f"{'k':>3} {'result':>7} {'enc':>8} {'solve':>8} | {'enc inc':>8} {'solve inc':>9}")
+    total, total_inc = 0.0, 0.0
+    for k, result_inc, enc_inc, solve_inc in incremental:
+        result, enc, solve, _ = gcd_bmc_with_fixed_point(k, verbose=False)
+        assert result == result_inc
+        total += enc + solve
+        total_inc += enc_inc + solve_inc
+        print(f"{k:>3} {str(result):>7} {enc:8.4f} {solve:8.4f} | {enc_inc:8.4f} {solve_inc:9.4f}")
+    print(f"total: from-scratch {total:.4f}, incremental {total_inc:.4f}")
 
 if __name__ == "__main__":
     run_bmc_fixed_up_to(25)
@@ -1,17 +1,81 @@
 #!/usr/bin/env python3
 
+import time
+
 from z3 import *
 
-def gcd_bmc_with_fixed_point_bv(k):
+from autotune import make_solver
+import tracing
+from transition_system import TransitionSystem
+
+def gcd_init_bv(X, Y, G):
+    """
+    Initial constraints:
+       - x_0, y_0, and G are non-zero in 5-bit sense
+       - G divides x_0 and y_0 in the bitvector sense (x_0 % G == 0)
+
+    Note: We use != 0 to say it's not zero. Alternatively, we could do UGT(x_0,0).
+    Similarly for G != 0 to avoid division by zero in URem.
+    For "G divides x_0 and y_0", we use the unsigned remainder URem:
+    (Z3 uses 'URem' for bitvector remainder.)
+    """
+    return [X[0] != 0, Y[0] != 0, G != 0, URem(X[0], G) == 0, URem(Y[0], G) == 0]
+
+def gcd_step_bv(X, Y, i):
+    """
+    Standard Euclid transition from step i to step i+1:
+
+      if x_i > y_i:
+          x_{i+1} = x_i - y_i  (bitvector subtraction)
+          y_{i+1} = y_i
+      else:
+          x_{i+1} = x_i
+          y_{i+1} = y_i - x_i
+
+    But ">" becomes an unsigned BV comparison: UGT(x_i, y_i)
+    """
+    return Or(
+        And(
+            UGT(X[i], Y[i]),
+            X[i+1] == X[i] - Y[i],  # BVSub
+            Y[i+1] == Y[i]
+        ),
+        And(
+            Not(UGT(X[i], Y[i])),  # means x_i <= y_i (unsigned)
+            X[i+1] == X[i],
+            Y[i+1] == Y[i] - X[i]
+        )
+    )
+
+def gcd_fixed_violation_bv(X, Y, G, k):
+    """
+    Fixed-point constraint at step k -> k+1, (x_{k+1}, y_{k+1}) = (x_k, y_k),
+    and the violation: a stable state with y=0 but x != G.
+    """
+    return And(X[k+1] == X[k], Y[k+1] == Y[k], Y[k+1] == 0, X[k+1] != G)
+
+def print_bv_model(model):
+    print("Model (one possible assignment):")
+    print(model)
+    # Optionally show numeric values for X_i, Y_i, G
+    print("Interpreted values:")
+    for d in model.decls():
+        if is_bv_value(model[d]):
+            print(f"{d.name()} =", model[d].as_long(), "(decimal)")
+
+def gcd_bmc_with_fixed_point_bv(k, verbose=True):
     """
     Unroll the GCD loop k steps, then add a 'fixed point' constraint
     at step k -> k+1, using 5-bit BitVecs instead of Ints.
 
     Check if there's a stable state (y_{k+1} = y_k, x_{k+1} = x_k)
     where y=0 but x != G (meaning the stored 'gcd candidate' is violated).
+
+    Returns (result, encode_time, solve_time), times in seconds.
     """
 
-    solver = Solver()
+    start = time.perf_counter()
+    solver = make_solver('gcd_bv')
 
     # Define 5-bit bitvector sort
     BV5 = BitVecSort(5)
@@ -25,90 +89,133 @@ def gcd_bmc_with_fixed_point_bv(k):
     G = BitVec('G', 5)
 
     # -------------------------------------
-    # 1) Initial constraints:
-    #    - x_0, y_0, and G are non-zero in 5-bit sense
-    #    - G divides x_0 and y_0 in the bitvector sense (x_0 % G == 0)
-    #
-    # Note: We use UGT(x_0,0) to say it's not zero. Alternatively, we could do x_0 != 0.
-    # Similarly for G != 0 to avoid division by zero in URem.
+    # 1) Initial constraints
     # -------------------------------------
-    solver.add(X[0] != 0, Y[0] != 0, G != 0)
-
-    # For "G divides x_0 and y_0", we use the unsigned remainder URem:
-    # (Z3 uses 'URem' for bitvector remainder.)
-    solver.add(URem(X[0], G) == 0)
-    solver.add(URem(Y[0], G) == 0)
+    solver.add(gcd_init_bv(X, Y, G))
 
     # -------------------------------------
     # 2) Encode standard Euclid transitions (k steps)
-    #
-    #   if x_i > y_i:
-    #       x_{i+1} = x_i - y_i  (bitvector subtraction)
-    #       y_{i+1} = y_i
-    #   else:
-    #       x_{i+1} = x_i
-    #       y_{i+1} = y_i - x_i
-    #
-    # But ">" becomes an unsigned BV comparison: UGT(x_i, y_i)
     # -------------------------------------
     for i in range(k):
-        solver.add(
-            Or(
-                And(
-                    UGT(X[i], Y[i]),
-                    X[i+1] == X[i] - Y[i],  # BVSub
-                    Y[i+1] == Y[i]
-                ),
-                And(
-                    Not(UGT(X[i], Y[i])),  # means x_i <= y_i (unsigned)
-                    X[i+1] == X[i],
-                    Y[i+1] == Y[i] - X[i]
-                )
-            )
-        )
+        solver.add(gcd_step_bv(X, Y, i))
 
     # -------------------------------------
     # 3) Fixed-point constraint at step k -> k+1
     #
-    #    (x_{k+1}, y_{k+1}) = (x_k, y_k)
-    #
     # This forces the state not to change after step k.
-    # -------------------------------------
-    solver.add(X[k+1] == X[k], Y[k+1] == Y[k])
-
-    # -------------------------------------
+    #
     # 4) "Violation" condition:
     #
     #    We want a stable state (the final state) with y=0 but x != G.
     # -------------------------------------
-    solver.add(Y[k+1] == 0, X[k+1] != G)
+    solver.add(gcd_fixed_violation_bv(X, Y, G, k))
+    encode_time = time.perf_counter() - start
 
     # -------------------------------------
     # 5) Check satisfiability
     # -------------------------------------
-    result = solver.check()
-    if result == sat:
-        print(f"[Fixed-Point BMC (BV5) k={k}] Found a stable state violating gcd!")
-        model = solver.model()
-        print("Model (one possible assignment):")
-        print(model)
-        # Optionally show numeric values for X_i, Y_i, G
-        print("Interpreted values:")
-        for d in model.decls():
-            print(f"{d.name()} =", model[d].as_long(), "(decimal)")
-    else:
-        print(f"[Fixed-Point BMC (BV5) k={k}] UNSAT - No bad stable state found.")
+    start = time.perf_counter()
+    result = tracing.check(solver, kind='gcd-bv', bound=k)
+    solve_time = time.perf_counter() - start
+    if verbose:
+        if result == sat:
+            print(f"[Fixed-Point BMC (BV5) k={k}] Found a stable state violating gcd!")
+            print_bv_model(solver.model())
+        else:
+            print(f"[Fixed-Point BMC (BV5) k={k}] UNSAT - No bad stable state found.")
+    return result, encode_time, solve_time
+
+
+def gcd_bmc_with_fixed_point_bv_incremental(max_k, verbose=True):
+    """
+    Incremental version of the 5-bit fixed-point sweep: one solver for
+    all bounds, each k adds only the Euclid step k-1 -> k, and the
+    fixed-point/violation constraints of bound k are guarded by an
+    assumption literal that is retired after the check.
 
+    Returns a list of (k, result, encode_time, solve_time).
+    """
+    solver = make_solver('gcd_bv')
+    X = [BitVec('x_0', 5), BitVec('x_1', 5)]
+    Y = [BitVec('y_0', 5), BitVec('y_1', 5)]
+    G = BitVec('G', 5)
+    solver.add(gcd_init_bv(X, Y, G))
 
-def run_bmc_fixed_bv_up_to(max_k):
+    results = []
+    for k in range(1, max_k+1):
+        start = time.perf_counter()
+        X.append(BitVec(f'x_{k+1}', 5))
+        Y.append(BitVec(f'y_{k+1}', 5))
+        solver.add(gcd_step_bv(X, Y, k-1))
+        check_k = Bool(f'check_{k}')
+        solver.add(Implies(check_k, gcd_fixed_violation_bv(X, Y, G, k)))
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = tracing.check(solver, check_k, kind='gcd-bv', bound=k)
+        solve_time = time.perf_counter() - start
+        if verbose:
+            if result == sat:
+                print(f"[Fixed-Point BMC (BV5) k={k}] Found a stable state violating gcd!")
+                print_bv_model(solver.model())
+            else:
+                print(f"[Fixed-Point BMC (BV5) k={k}] UNSAT - No bad stable state found.")
+
+        # retire the fixed-point/violation constraints of this bound
+        solver.add(Not(check_k))
+        results.append((k, result, encode_time, solve_time))
+    return results
+
+
+def gcd_bv_system(bits=5):
+    """
+    The fixed-point GCD model over bits-wide BitVecs as a TransitionSystem
+    (see transition_system.py): a bad state is a stable state with y == 0
+    but x != G.
+    """
+    def bad(V):
+        X = [V['x'], V['x']]
+        Y = [V['y'], V['y']]
+        return And(gcd_step_bv(X, Y, 0), gcd_fixed_violation_bv(X, Y, V['G'], 0))
+    return TransitionSystem('gcd_bv',
+        [('x', BitVecSort(bits)), ('y', BitVecSort(bits))],
+        init=lambda V: And(gcd_init_bv([V['x']], [V['y']], V['G'])),
+        trans=lambda V, W: gcd_step_bv([V['x'], W['x']], [V['y'], W['y']], 0),
+        bad=bad,
+        rigid_vars=[('G', BitVecSort(bits))],
+        explicit=lambda: __import__('explicit').gcd_bv_explicit(bits))
+
+
+def run_bmc_fixed_bv_up_to(max_k, incremental=False):
     """
     Try the fixed-point BMC check with 5-bit bitvectors for k from 1..max_k.
     """
     print("=== Bounded Model Checking (with Fixed-Point Step) for GCD (5-bit BV) ===")
-    for k in range(1, max_k+1):
-        gcd_bmc_with_fixed_point_bv(k)
+    if incremental:
+        gcd_bmc_with_fixed_point_bv_incremental(max_k)
+    else:
+        for k in range(1, max_k+1):
+            gcd_bmc_with_fixed_point_bv(k)
     print("Done.")
 
 
+def compare_bmc_fixed_bv_modes(max_k):
+    """
+    Print per-k encode and solve times of the from-scratch and the
+    incremental 5-bit sweep side by side.
+    """
+    print("=== Fixed-Point BMC for GCD (5-bit BV): from-scratch vs incremental (seconds) ===")
+    incremental = gcd_bmc_with_fixed_point_bv_incremental(max_k, verbose=False)
+    print(f"{'k':>3} {'result':>7} {'enc':>8} {'solve':>8} | {'enc inc':>8} {'solve inc':>9}")
+    total, total_inc = 0.0, 0.0
+    for k, result_inc, enc_inc, solve_inc in incremental:
+        result, enc, solve = gcd_bmc_with_fixed_point_bv(k, verbose=False)
+        assert result == result_inc
+        total += enc + solve
+        total_inc += enc_inc + solve_inc
+        print(f"{k:>3} {str(result):>7} {enc:8.4f} {solve:8.4f} | {enc_inc:8.4f} {solve_inc:9.4f}")
+    print(f"total: from-scratch {total:.4f}, incremental {total_inc:.4f}")
+
+
 if __name__ == "__main__":
     run_bmc_fixed_bv_up_to(5)
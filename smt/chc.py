@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+# constrained Horn clauses (CHC) engine for transition systems, with Spacer
+#
+# gcd_fixedpoint_demo of bmc_gcd_fp.py writes the Horn rules of one query by
+# hand; here any TransitionSystem is translated into the rules
+#
+#   init(V)                  -> Inv(V)
+#   Inv(V) /\ trans(V, W)    -> Inv(W)
+#   Inv(V) /\ bad(V)         -> false   (the query)
+#
+# over its state variables (inputs are left out of Inv, rigid variables
+# such as G are kept), and solved by Spacer. On unsat, the inductive
+# invariant Inv is extracted and validated with a plain solver (init
+# implies it, it is closed under trans, it excludes bad). Validated
+# invariants are cached per model (init and trans); checking another
+# property of the same model first tries the cached invariants, and
+# otherwise gives them to Spacer as lemmas (add_cover), so it starts from
+# the old invariant instead of from scratch.
+#
+# run: python chc.py
+
+import hashlib
+import json
+import os
+import time
+
+from z3 import *
+
+import tracing
+from transition_system import BMC, Result
+
+# Spacer with the rules kept as given, so that Inv is not sliced or inlined
+# away (needed for add_cover and for extracting the invariant)
+DEFAULT_PARAMS = { 'engine': 'spacer', 'xform.slice': False, 'xform.inline_linear': False,
+                   'xform.inline_eager': False }
+
+def invariant_names(system):
+    """The arguments of Inv: non-input state variables and rigid variables."""
+    return [ n for n, _ in system.state_vars + system.rigid_vars if n not in system.inputs ]
+
+def model_key(system):
+    """Hash of a model (sorts, init and trans) for the invariant cache; the property is not part of it."""
+    V = system.variables(0)
+    W = system.variables(1)
+    h = hashlib.sha256()
+    for n, sort in system.state_vars + system.rigid_vars:
+        h.update(("%s:%s;" % (n, sort.sexpr())).encode())
+    # not simplified: simplify orders the arguments by AST ids, which differ
+    # between runs
+    h.update(system.init(V).sexpr().encode())
+    h.update(system.trans(V, W).sexpr().encode())
+    return h.hexdigest()
+
+def validate(system, invariant):
+    """
+    Is invariant (over the step 0 variables) inductive and does it exclude
+    bad states? True or False, or unknown if z3 could not decide it.
+    """
+    V = system.variables(0)
+    W = system.variables(1)
+    step = substitute(invariant, *[ (v, W[n]) for n, v in V.items() ])
+    for query in (And(system.init(V), Not(invariant)),
+                  And(invariant, system.trans(V, W), Not(step)),
+                  And(invariant, system.bad(V))):
+        s = Solver()
+        s.add(query)
+        result = tracing.check(s, kind='chc-validate')
+        if result == sat:
+            return False
+        if result == unknown:
+            return unknown
+    return True
+
+class InvariantCache:
+    """
+    Validated inductive invariants per model_key, in memory and, with path,
+    in a JSON file (as SMT-LIB terms over the step 0 variable names).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {} # key -> list of invariant sexprs
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, system):
+        """The cached invariants of the model of system, as formulas."""
+        terms = self.entries.get(model_key(system), [])
+        if not terms:
+            return []
+        decls = {}
+        sorts = {}
+        for v in system.variables(0).values():
+            decls[str(v)] = v
+            sort = v.sort()
+            if sort.kind() == Z3_DATATYPE_SORT:
+                sorts[sort.name()] = sort # declares the constructors too
+        return [ And(parse_smt2_string("(assert %s)" % t, sorts=sorts, decls=decls)) for t in terms ]
+
+    def put(self, system, invariant):
+        terms = self.entries.setdefault(model_key(system), [])
+        if invariant.sexpr() not in terms:
+            terms.append(invariant.sexpr())
+            if self.path is not None:
+                with open(self.path, 'w') as f:
+                    json.dump(self.entries, f, indent=1)
+
+class CHC:
+    """
+    CHC engine: run() translates the system into Horn clauses and solves
+    them with Spacer (params are Fixedpoint parameters on top of
+    DEFAULT_PARAMS). The Result of unsat carries the validated invariant
+    (result.invariant, over the step 0 variables), sat carries a shortest
+    trace, reconstructed by BMC at the depth of Spacer's counterexample.
+    """
+
+    def __init__(self, system, params=None, cache=None, timeout=None):
+        self.system = system
+        self.params = dict(DEFAULT_PARAMS)
+        self.params.update(params or {})
+        if timeout is not None:
+            self.params['timeout'] = int(timeout * 1000)
+        self.cache = cache
+        self.fp = None
+        self.warm = False # started from cached invariants
+
+    def horn(self):
+        """The Fixedpoint with the rules of the system, and the Inv relation."""
+        system = self.system
+        V = system.variables(0)
+        W = system.variables(1)
+        names = invariant_names(system)
+        Inv = Function(system.name + '_inv', *[ V[n].sort() for n in names ], BoolSort())
+        fp = Fixedpoint()
+        fp.set(*[ x for kv in self.params.items() for x in kv ])
+        fp.register_relation(Inv)
+        # rigid variables are the same constants in V and W
+        fp.declare_var(*{ v.get_id(): v for v in list(V.values()) + list(W.values()) }.values())
+        fp.rule(Inv(*[ V[n] for n in names ]), system.init(V))
+        fp.rule(Inv(*[ W[n] for n in names ]), [ Inv(*[ V[n] for n in names ]), system.trans(V, W) ])
+        return fp, Inv
+
+    def run(self):
+        system = self.system
+        V = system.variables(0)
+        args = [ V[n] for n in invariant_names(system) ]
+        cached = self.cache.get(system) if self.cache is not None else []
+        if cached:
+            # the cached invariants are inductive for this model: they may
+            # already exclude the new bad states
+            s = Solver()
+            s.add(And(cached), system.bad(V))
+            if tracing.check(s, kind='chc-cache') == unsat:
+                self.warm = True
+                return Result(unsat, 0, invariant=simplify(And(cached)))
+        self.fp, Inv = self.horn()
+        if cached:
+            self.warm = True
+            self.fp.add_cover(-1, Inv, substitute(And(cached), *[ (v, Var(i, v.sort()))
+                                                                  for i, v in enumerate(args) ]))
+        start = time.perf_counter()
+        try:
+            status = self.fp.query(And(Inv(*args), system.bad(V)))
+        except Z3Exception as e:
+            # e.g. mod/div with a variable divisor (the Int GCD model), which
+            # is not supported by Spacer
+            tracing.debug('chc', system=system.name, error=str(e))
+            return Result(unknown, 0)
+        tracing.debug('chc', system=system.name, result=str(status), check_time=time.perf_counter() - start,
+                      warm=self.warm)
+        stats = tracing.z3_statistics(self.fp.statistics())
+        if status == unsat:
+            invariant = substitute_vars(self.fp.get_cover_delta(-1, Inv), *args)
+            valid = validate(system, invariant)
+            if valid is unknown:
+                # not wrong, but not confirmed either: no verdict
+                tracing.debug('chc', system=system.name, validation='unknown')
+                return Result(unknown, stats.get('SPACER inductive level', 0))
+            if not valid:
+                raise RuntimeError("invariant of %s is not inductive: %s" % (system.name, invariant))
+            if self.cache is not None:
+                self.cache.put(system, invariant)
+            return Result(unsat, stats.get('SPACER inductive level', 0), invariant=invariant)
+        if status == sat:
+            k = len(self.fp.get_rules_along_trace()) - 2 # without the query and the init rule
+            result = BMC(system).run(max(k, 0))
+            if result.status != sat:
+                raise RuntimeError("no counterexample of %s up to k=%d" % (system.name, k))
+            return result
+        return Result(unknown, stats.get('SPACER max depth', 0))
+
+if __name__ == "__main__":
+    from bmc import counter_system
+    from bmc_gcd import gcd_system, gcd_sign_violation
+    from bmc_gcd_fpsat_bv import gcd_bv_system
+
+    cache = InvariantCache()
+    for system in (counter_system(bits=8), counter_system(bits=64, bad=lambda V: V['x'] >= 11),
+                   counter_system(bits=64, bad=lambda V: V['x'] >= 12),
+                   counter_system(bits=64, bad=lambda V: V['x'] < 0),
+                   gcd_system(), gcd_system(gcd_sign_violation), gcd_bv_system(5),
+                   gcd_bv_system(8).with_bad(lambda V: V['x'] == 0)):
+        engine = CHC(system, cache=cache, timeout=60)
+        start = time.perf_counter()
+        result = engine.run()
+        print("%s: %s in %.3fs%s" % (system, result, time.perf_counter() - start,
+                                     " (warm start)" if engine.warm else ""))
+        if result.status == unsat:
+            print("  invariant:", result.invariant)
+        elif result.status == sat:
+            print("  trace:", [ { n: str(v) for n, v in state.items() } for state in result.trace ])
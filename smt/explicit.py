@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+# explicit-state reachability for small finite-domain models
+#
+# the 5-bit GCD model of bmc_gcd_fpsat_bv.py has only 32*32*32 (x, y, G)
+# states, and the counter of bmc.py with a small bit width is similarly
+# tiny, so instead of one SMT query per k, the whole state space is
+# represented by NumPy arrays indexed by the state number, and the
+# reachable states are computed by breadth-first search with vectorized
+# transition functions. BFS gives a shortest trace to a bad state, and the
+# fixpoint (empty frontier) proves that no bad state is reachable at all.
+#
+# check() picks this engine automatically for a TransitionSystem that
+# provides an explicit version (system.explicit) small enough for memory,
+# and falls back to SMT based BMC otherwise.
+
+import numpy as np
+
+from z3 import sat, unsat, unknown
+
+from transition_system import BMC, Result
+
+class ExplicitSystem:
+    """
+    Finite transition system over the states 0..num_states-1.
+
+    init():          index array of the initial states
+    successors(src): (src, dst) index arrays, all transitions of the states src
+    bad(states):     boolean array, which of the states are bad
+    decode(state):   dict of variable values of one state
+    work:            peak bytes per state of the arrays init/successors
+                     allocate (e.g. 8 per int64 array over all states)
+
+    Nothing is allocated before the search, so memory() can be checked first.
+    """
+
+    def __init__(self, name, num_states, init, successors, bad, decode, work=0):
+        self.name = name
+        self.num_states = num_states
+        self.init = init
+        self.successors = successors
+        self.bad = bad
+        self.decode = decode
+        self.work = work
+
+    # visited flags (bool) plus parent pointers (int64)
+    BYTES_PER_STATE = 1 + 8
+
+    def memory(self):
+        """Upper bound of the bytes reachability() allocates."""
+        return self.num_states * (self.BYTES_PER_STATE + self.work)
+
+def reachability(es, bound=None):
+    """
+    Breadth-first search from the initial states of es, up to bound steps
+    (or to the fixpoint if bound is None).
+
+    Returns a Result: sat with a shortest trace to a bad state, unsat if
+    the fixpoint was reached without bad states, unknown at the bound.
+    """
+    visited = np.zeros(es.num_states, dtype=bool)
+    parent = np.full(es.num_states, -1, dtype=np.int64)
+    frontier = np.unique(es.init())
+    visited[frontier] = True
+    k = 0
+    while frontier.size > 0:
+        bad = frontier[es.bad(frontier)]
+        if bad.size > 0:
+            # follow the parent pointers back to an initial state
+            path = [ int(bad[0]) ]
+            while parent[path[-1]] >= 0:
+                path.append(int(parent[path[-1]]))
+            path.reverse()
+            return Result(sat, k, [ es.decode(state) for state in path ])
+        if bound is not None and k >= bound:
+            return Result(unknown, bound)
+        src, dst = es.successors(frontier)
+        fresh = ~visited[dst]
+        dst, first = np.unique(dst[fresh], return_index=True)
+        parent[dst] = src[fresh][first]
+        visited[dst] = True
+        frontier = dst
+        k += 1
+    return Result(unsat, k)
+
+def as_signed(v, bits):
+    """Two's complement value of the unsigned bits-wide values v."""
+    return np.where(v >= 2**(bits - 1), v - 2**bits, v)
+
+def counter_explicit(bits, count_max=10, bad_min=10):
+    """
+    Explicit version of the counter of bmc.py: state = (press * 2 + q) *
+    2**bits + x with q = 0 (off) or 1 (on); press is an input, a state
+    variable like in counter_system, so every state has one successor per
+    next press value. x is compared signed, like the bit-vector comparisons
+    of bmc.py, and so are the constants, which wrap around like bit-vector
+    literals; bad states are x >= bad_min.
+    """
+    size = 2**bits
+    signed = lambda c: c % size - size if c % size >= size // 2 else c % size
+    count_max = signed(count_max)
+    bad_min = signed(bad_min)
+
+    def split(s):
+        return s // (2 * size), (s // size) % 2, s % size
+
+    def init():
+        return np.array([ 0, 2 * size ], dtype=np.int64) # off, x = 0, either press
+
+    def successors(src):
+        press, q, x = split(src)
+        xs = as_signed(x, bits)
+        reset = (press == 1) | (xs >= count_max)
+        nq = np.where(q == 0, press, np.where(reset, 0, 1))
+        nx = np.where(q == 0, x, np.where(reset, 0, (x + 1) % size))
+        dst = nq * size + nx
+        return np.concatenate([ src, src ]), np.concatenate([ dst, dst + 2 * size ])
+
+    def bad(states):
+        return as_signed(states % size, bits) >= bad_min
+
+    def decode(state):
+        press, q, x = split(state)
+        return { 'q': 'on' if q else 'off', 'x': int(as_signed(x, bits)), 'press': bool(press) }
+
+    # successors of a frontier of all states: ~16 int64 arrays of its size
+    return ExplicitSystem('counter', 4 * size, init, successors, bad, decode, work=16 * 8)
+
+def gcd_bv_explicit(bits=5):
+    """
+    Explicit version of the fixed-point GCD model of bmc_gcd_fpsat_bv.py:
+    state = (x * 2**bits + y) * 2**bits + G, unsigned arithmetic modulo
+    2**bits; bad states are stable (the Euclid step maps them onto
+    themselves) with y == 0 but x != G.
+    """
+    size = 2**bits
+
+    def split(s):
+        return s // (size * size), (s // size) % size, s % size
+
+    def step(s):
+        x, y, G = split(s)
+        nx = np.where(x > y, (x - y) % size, x)
+        ny = np.where(x > y, y, (y - x) % size)
+        return (nx * size + ny) * size + G
+
+    def init():
+        # allocated only when searching, after check() compared memory()
+        states = np.arange(size**3, dtype=np.int64)
+        x, y, G = split(states)
+        ok = (x != 0) & (y != 0) & (G != 0)
+        Gs = np.where(G == 0, 1, G)
+        ok &= (x % Gs == 0) & (y % Gs == 0)
+        return states[ok]
+
+    def successors(src):
+        return src, step(src)
+
+    def bad(s):
+        x, y, G = split(s)
+        return (step(s) == s) & (y == 0) & (x != G)
+
+    def decode(s):
+        x, y, G = split(s)
+        return { 'x': int(x), 'y': int(y), 'G': int(G) }
+
+    # init: the state numbers, x, y, G, Gs and a remainder (int64), and masks
+    return ExplicitSystem('gcd_bv', size**3, init, successors, bad, decode, work=6 * 8 + 4)
+
+def check(system, bound, max_memory=2**30):
+    """
+    Check a TransitionSystem up to bound, with the explicit-state engine if
+    the system has an explicit version whose arrays fit in max_memory bytes,
+    otherwise with incremental BMC. Returns (result, engine name).
+    """
+    if system.explicit is not None:
+        es = system.explicit()
+        if es.memory() <= max_memory:
+            return reachability(es, bound), 'explicit'
+    return BMC(system).run(bound), 'bmc'
+
+if __name__ == "__main__":
+    from bmc import counter_system
+    from bmc_gcd_fpsat_bv import gcd_bv_system
+
+    for system in (counter_system(bits=8), counter_system(bits=64), gcd_bv_system(5),
+                   counter_system(bits=12, bad=lambda V: V['x'] >= 11)):
+        result, engine = check(system, 20)
+        print(system, engine, result)
+    result = reachability(counter_explicit(8, bad_min=11))
+    print("counter x >= 11 (8 bits) to the fixpoint:", result)
+    result = reachability(gcd_bv_explicit(5))
+    print("gcd 5 bits:", result, result.trace)
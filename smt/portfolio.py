@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+# portfolio solving of the fixed-point GCD query:
+# the unbounded Int encoding (bmc_gcd_fpsat.py) and the BitVec encoding
+# (bmc_gcd_fpsat_bv.py) ask the same question, but which one is faster
+# depends on the bound and the width, so several encodings and z3 tactic
+# configurations are raced as separate processes on the same query; the
+# first definitive answer (sat/unsat) wins and the rest are killed.
+# The answer is about the Int semantics: the 5-bit BitVec encoding wraps
+# around, so its counterexamples are replayed in the Int encoding (and only
+# count if they hold there), and its unsat answers are not definitive.
+# Winners are recorded in a JSON history file, and the next run launches
+# the configurations that won most often first.
+
+import json
+import multiprocessing
+import os
+import queue as queues
+import time
+
+from z3 import *
+
+import bmc_gcd_fpsat
+import bmc_gcd_fpsat_bv
+import tracing
+
+# name -> (encoding, tactic): tactic None is the default Solver(), a string
+# is a named tactic, a list is a pipeline of tactics combined with Then
+CONFIGURATIONS = {
+    'int-default': ('int', None),
+    'int-qfnia':   ('int', 'qfnia'),
+    'bv-default':  ('bv', None),
+    'bv-qfbv':     ('bv', 'qfbv'),
+    'bv-bitblast': ('bv', ['simplify', 'solve-eqs', 'bit-blast', 'sat']),
+}
+
+HISTORY = 'portfolio_history.json'
+
+POLL = 0.1 # seconds between checks for dead workers
+
+def make_solver(tactic, ctx):
+    if tactic is None:
+        return Solver(ctx=ctx)
+    if isinstance(tactic, str):
+        return Tactic(tactic, ctx).solver()
+    return Then(*[Tactic(t, ctx) for t in tactic]).solver()
+
+def fixed_point_query(encoding, k, ctx, bits=5):
+    """
+    Constraints of the fixed-point query of bound k (see bmc_gcd_fpsat.py
+    and bmc_gcd_fpsat_bv.py) in the given encoding and context.
+    """
+    if encoding == 'int':
+        X = [Int(f'x_{i}', ctx) for i in range(k+2)]
+        Y = [Int(f'y_{i}', ctx) for i in range(k+2)]
+        G = Int('G', ctx)
+        m = bmc_gcd_fpsat
+        return (m.gcd_init(X, Y, G) + [m.gcd_step(X, Y, i) for i in range(k)]
+                + [m.gcd_fixed_violation(X, Y, G, k)])
+    X = [BitVec(f'x_{i}', bits, ctx) for i in range(k+2)]
+    Y = [BitVec(f'y_{i}', bits, ctx) for i in range(k+2)]
+    G = BitVec('G', bits, ctx)
+    m = bmc_gcd_fpsat_bv
+    return (m.gcd_init_bv(X, Y, G) + [m.gcd_step_bv(X, Y, i) for i in range(k)]
+            + [m.gcd_fixed_violation_bv(X, Y, G, k)])
+
+def confirm_in_int(bv_model, k, bits, ctx):
+    """
+    Replay the inputs x_0, y_0, G of a BitVec counterexample (as unsigned
+    numbers) in the Int encoding: the Int model if it is a counterexample
+    there too, otherwise None.
+    """
+    solver = Solver(ctx=ctx)
+    solver.add(fixed_point_query('int', k, ctx))
+    for name in ('x_0', 'y_0', 'G'):
+        value = bv_model.eval(BitVec(name, bits, ctx), model_completion=True)
+        solver.add(Int(name, ctx) == value.as_long())
+    return solver.model() if tracing.check(solver, kind='portfolio-confirm', bound=k) == sat else None
+
+def _run_configuration(name, k, bits, queue):
+    """Worker: always posts (name, result, seconds, model or error message)."""
+    start = time.perf_counter()
+    try:
+        encoding, tactic = CONFIGURATIONS[name]
+        ctx = Context()
+        solver = make_solver(tactic, ctx)
+        solver.add(fixed_point_query(encoding, k, ctx, bits))
+        result = tracing.check(solver, kind='portfolio', bound=k, configuration=name)
+        model = solver.model() if result == sat else None
+        if encoding == 'bv':
+            # only counterexamples that also hold for Int are definitive
+            model = model and confirm_in_int(model, k, bits, ctx)
+            result = sat if model is not None else unknown
+        queue.put((name, str(result), time.perf_counter() - start, model and str(model)))
+    except Exception as e:
+        queue.put((name, 'error', time.perf_counter() - start, str(e)))
+
+def load_history(path=HISTORY):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def record_winner(name, k, path=HISTORY):
+    history = load_history(path)
+    history.setdefault(str(k), {})
+    history[str(k)][name] = history[str(k)].get(name, 0) + 1
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+
+def seeded_order(names, k, history):
+    """Configurations that won for bound k (or any bound) most often go first."""
+    wins_k = history.get(str(k), {})
+    wins_all = {}
+    for wins in history.values():
+        for name, n in wins.items():
+            wins_all[name] = wins_all.get(name, 0) + n
+    return sorted(names, key=lambda n: (-wins_k.get(n, 0), -wins_all.get(n, 0)))
+
+def portfolio(k, configurations=None, workers=None, bits=5, timeout=None, history=HISTORY):
+    """
+    Race the configurations on the fixed-point query of bound k.
+    At most `workers` processes run at a time; the others are started when
+    a running one finishes without a definitive answer.
+
+    Returns (result, winner, seconds, model); winner is None if no
+    configuration gave a definitive answer (within timeout seconds).
+    """
+    names = seeded_order(list(configurations or CONFIGURATIONS), k, load_history(history))
+    workers = workers or len(names)
+    mp = multiprocessing.get_context('spawn')
+    queue = mp.Queue()
+    running = {}
+    pending = list(names)
+    start = time.perf_counter()
+    answer = (unknown, None, None, None)
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                name = pending.pop(0)
+                proc = mp.Process(target=_run_configuration, args=(name, k, bits, queue), daemon=True)
+                proc.start()
+                running[name] = proc
+            if timeout is not None and time.perf_counter() - start >= timeout:
+                break
+            try:
+                name, result, seconds, model = queue.get(timeout=POLL)
+            except queues.Empty:
+                # a worker that died without posting (e.g. killed) is dropped
+                for name, proc in list(running.items()):
+                    if not proc.is_alive() and proc.exitcode != 0:
+                        del running[name]
+                continue
+            proc = running.pop(name, None)
+            if proc is not None:
+                proc.join()
+            if result in ('sat', 'unsat'):
+                answer = (sat if result == 'sat' else unsat, name, seconds, model)
+                break
+    finally:
+        # kill the configurations still racing
+        for proc in running.values():
+            proc.kill()
+            proc.join()
+    if answer[1] is not None:
+        record_winner(answer[1], k, history)
+    return answer
+
+def run_portfolio_up_to(max_k, **kwargs):
+    print("=== Portfolio (Int / BitVec encodings, tactics) for fixed-point GCD BMC ===")
+    for k in range(1, max_k+1):
+        result, winner, seconds, model = portfolio(k, **kwargs)
+        if winner is None:
+            print(f"[Portfolio k={k}] no definitive answer")
+        else:
+            print(f"[Portfolio k={k}] {result} by {winner} in {seconds:.4f}s")
+
+if __name__ == "__main__":
+    run_portfolio_up_to(10)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+# SMT-LIB2 export of the queries of the models, and offline batch solving
+#
+# encoding the unrolled queries in Python costs as much as solving them for
+# the larger sweeps, and everything runs in one process. Smt2Exporter is a
+# tracer (see tracing.py) that writes every query passing through
+# tracing.check() -- bmc.py, the gcd_bmc* scripts, test_gen, z3_sudoku and
+# the TransitionSystem engines -- to a .smt2 file, with the query event
+# (kind, bound, system, ...) as a JSON comment in the first line:
+#
+#   with tracing.tracing(Smt2Exporter('queries')):
+#       run_bmc_fixed_up_to(25)
+#
+# run_batch() then solves such files with a pool of z3 processes (each with
+# a timeout; a query that runs out of time is unknown), optionally only one
+# shard of them, and writes one JSON line per query: the result, the time
+# and the model mapped back onto the steps of the unrolling. Step variables
+# are recognized by their names (x_3, x3 -> x at step 3); functions of the
+# step (test_gen's x(i)) are evaluated at the steps 0..bound.
+#
+# run: python smt2_batch.py export <model> <directory> [bound]
+#      python smt2_batch.py run <directory or files> [--jobs N] [--timeout S] [--shard i/n] [--out file]
+#
+# models: counter, bmc, gcd, gcd-fp, gcd-bv, test-gen, sudoku
+
+import concurrent.futures
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+from z3 import *
+
+import tracing
+
+Z3 = os.environ.get('Z3', 'z3')
+
+def to_smt2(assertions, assumptions=(), meta=None):
+    """A query as an SMT-LIB2 script: declarations, assertions, check-sat(-assuming) and get-model."""
+    query = Solver()
+    query.add(assertions)
+    text = query.sexpr()
+    lines = []
+    if meta is not None:
+        lines.append("; query " + json.dumps(meta))
+    lines.append("(set-option :produce-models true)")
+    lines.append(text.rstrip())
+    # assumption literals that do not occur in the assertions are not declared yet
+    for a in assumptions:
+        c = a.arg(0) if is_not(a) else a
+        if is_const(c) and "(declare-fun %s " % c.sexpr() not in text:
+            lines.append("(declare-fun %s () %s)" % (c.sexpr(), c.sort().sexpr()))
+    if assumptions:
+        lines.append("(check-sat-assuming (%s))" % ' '.join( a.sexpr() for a in assumptions ))
+    else:
+        lines.append("(check-sat)")
+    lines.append("(get-model)")
+    return '\n'.join(lines) + '\n'
+
+def read_meta(path):
+    """The query event written in the first line of an exported file, or {}."""
+    with open(path) as f:
+        line = f.readline()
+    return json.loads(line[len("; query "):]) if line.startswith("; query ") else {}
+
+class Smt2Exporter(tracing.Tracer):
+    """
+    Tracer writing each query to directory/<number>-<kind>[-k<bound>].smt2
+    before it is solved. Solvers that replace their assertions by their
+    clauses on push and check (SolverFor('QF_FD'), as in
+    z3_sudoku.make_solver) cannot be exported; see run_model('sudoku').
+    """
+
+    def __init__(self, directory):
+        tracing.Tracer.__init__(self, render=False, statistics=False, sizes=False)
+        self.directory = directory
+        self.paths = []
+        os.makedirs(directory, exist_ok=True)
+
+    def query(self, solver, assumptions, event):
+        name = "%05d-%s" % (len(self.paths), event['kind'])
+        if event['bound'] is not None:
+            name += "-k%s" % event['bound']
+        path = os.path.join(self.directory, name + '.smt2')
+        meta = { k: v for k, v in event.items() if k not in ('event', 'time', 'encode_time') }
+        with open(path, 'w') as f:
+            f.write(to_smt2(solver.assertions(), assumptions, meta))
+        self.paths.append(path)
+
+    def emit(self, event):
+        pass
+
+# z3 output
+
+def parse_sexprs(text):
+    """All s-expressions of text as nested lists of atoms (strings)."""
+    tokens = re.findall(r'\|[^|]*\||"(?:[^"]|"")*"|[()]|[^\s()]+', text)
+    stack = [ [] ]
+    for token in tokens:
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) == 1:
+                break # unbalanced (truncated output)
+            e = stack.pop()
+            stack[-1].append(e)
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+def literal(e):
+    """Python value of an SMT-LIB literal: int (Int, bit-vector), bool, or the term as text."""
+    if isinstance(e, str):
+        if re.fullmatch(r'\d+', e):
+            return int(e)
+        if e.startswith('#b'):
+            return int(e[2:], 2)
+        if e.startswith('#x'):
+            return int(e[2:], 16)
+        if e in ('true', 'false'):
+            return e == 'true'
+        return e
+    if len(e) == 2 and e[0] == '-' and isinstance(literal(e[1]), int):
+        return -literal(e[1])
+    if len(e) == 3 and e[0] == '_' and e[1].startswith('bv'):
+        return int(e[1][2:])
+    return _text(e)
+
+def _text(e):
+    return e if isinstance(e, str) else '(' + ' '.join( _text(a) for a in e ) + ')'
+
+def apply_function(params, body, args):
+    """
+    Value of a model function (define-fun with params and body) at args: the
+    ite / = / and / or / not terms z3 uses for function interpretations.
+    """
+    env = dict(zip(params, args))
+    def ev(e):
+        if isinstance(e, str):
+            return env[e] if e in env else literal(e)
+        op = e[0]
+        if op == 'ite':
+            return ev(e[2]) if ev(e[1]) else ev(e[3])
+        if op == '=':
+            return all( ev(a) == ev(e[1]) for a in e[2:] )
+        if op == 'and':
+            return all( ev(a) for a in e[1:] )
+        if op == 'or':
+            return any( ev(a) for a in e[1:] )
+        if op == 'not':
+            return not ev(e[1])
+        if op == 'let':
+            for name, value in e[1]:
+                env[name] = ev(value)
+            return ev(e[2])
+        return literal(e)
+    return ev(body)
+
+def parse_output(text):
+    """
+    status and model of z3's output for an exported query: (status,
+    constants {name: value}, functions {name: (params, body)}).
+    """
+    exprs = parse_sexprs(text)
+    status = exprs[0] if exprs and exprs[0] in ('sat', 'unsat', 'unknown') else 'unknown'
+    constants = {}
+    functions = {}
+    if status == 'sat':
+        for e in exprs[1:]:
+            if not isinstance(e, list) or e[:1] == [ 'error' ]:
+                continue
+            for d in e:
+                if isinstance(d, list) and d[:1] == [ 'define-fun' ]:
+                    _, name, params, sort, body = d
+                    name = name.strip('|')
+                    if params:
+                        functions[name] = ([ p[0] for p in params ], body)
+                    else:
+                        constants[name] = literal(body)
+    return status, constants, functions
+
+STEP = re.compile(r'^(.*?[^\d_])_?(\d+)$')
+
+def map_to_steps(constants, functions, bound=None):
+    """
+    The model as a trace: step variables (x_3, x3) become trace[3]['x'],
+    unary functions are evaluated at the steps 0..bound; the other
+    constants (rigid variables, auxiliaries) are returned separately.
+    Without a bound the query is not an unrolling and all constants are
+    returned as they are.
+    """
+    if bound is None:
+        return [], dict(constants)
+    trace = []
+    other = {}
+    def at(i):
+        while len(trace) <= i:
+            trace.append({})
+        return trace[i]
+    for name, value in constants.items():
+        m = STEP.match(name)
+        if m and '!' not in name:
+            at(int(m.group(2)))[m.group(1)] = value
+        else:
+            other[name] = value
+    for name, (params, body) in functions.items():
+        if len(params) == 1:
+            for i in range(bound + 1):
+                try:
+                    at(i)[name] = apply_function(params, body, [ i ])
+                except (KeyError, TypeError, ValueError):
+                    break # not a function of the step
+    return trace, other
+
+# batch solving
+
+def solve_file(path, timeout=None, z3=Z3):
+    """Solve one exported query with a z3 process; the result as a dict (see run_batch)."""
+    meta = read_meta(path)
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run([ z3, '-smt2', path ], capture_output=True, text=True, timeout=timeout)
+        status, constants, functions = parse_output(proc.stdout)
+        error = proc.stderr.strip() or None
+    except subprocess.TimeoutExpired:
+        status, constants, functions, error = 'unknown', {}, {}, 'timeout'
+    seconds = time.perf_counter() - start
+    bound = meta.get('bound')
+    trace, other = map_to_steps(constants, functions, bound if isinstance(bound, int) else None)
+    return { 'file': path, 'status': status, 'time': seconds, 'meta': meta, 'trace': trace,
+             'constants': other, 'error': error }
+
+def shard(paths, index, count):
+    """The index-th of count shards of paths (every count-th file, in name order)."""
+    return sorted(paths)[index::count]
+
+def run_batch(paths, jobs=None, timeout=60, out=None, z3=Z3):
+    """
+    Solve the exported queries paths with up to jobs z3 processes at a time
+    (default: one per CPU); each result is written to out (a file, as JSON
+    lines) as soon as it is available. Returns the results in path order.
+    """
+    if shutil.which(z3) is None:
+        raise FileNotFoundError("z3 executable %r not found (set Z3)" % z3)
+    results = {}
+    # the work is done by the z3 processes, threads only wait for them
+    with concurrent.futures.ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+        pending = { pool.submit(solve_file, p, timeout, z3): p for p in paths }
+        for future in concurrent.futures.as_completed(pending):
+            result = future.result()
+            results[pending[future]] = result
+            if out is not None:
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+            print("%-40s %-8s %8.3fs" % (os.path.basename(result['file']), result['status'],
+                                         result['time']), file=sys.stderr)
+    return [ results[p] for p in paths ]
+
+# export of the models
+
+MODELS = ('counter', 'bmc', 'gcd', 'gcd-fp', 'gcd-bv', 'test-gen', 'sudoku')
+
+def run_model(model, bound=None):
+    """
+    Run the queries of model (one of MODELS, up to bound) with its output
+    suppressed; the queries go to the current tracer.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        if model == 'counter':
+            from bmc import counter_system
+            from transition_system import BMC
+            BMC(counter_system(bits=64)).run(bound or 15)
+        elif model == 'bmc':
+            import bmc
+            bmc.bmc(bound or bmc.length)
+        elif model == 'gcd':
+            from bmc_gcd import gcd_bmc
+            for k in range(1, (bound or 10) + 1):
+                gcd_bmc(k, verbose=False)
+        elif model == 'gcd-fp':
+            from bmc_gcd_fpsat import gcd_bmc_with_fixed_point
+            for k in range(1, (bound or 25) + 1):
+                gcd_bmc_with_fixed_point(k, verbose=False)
+        elif model == 'gcd-bv':
+            from bmc_gcd_fpsat_bv import gcd_bmc_with_fixed_point_bv
+            for k in range(1, (bound or 10) + 1):
+                gcd_bmc_with_fixed_point_bv(k, verbose=False)
+        elif model == 'test-gen':
+            import test_gen
+            length = bound or test_gen.length
+            s, x, y = test_gen.uf_encoding(length, test_gen.bits, test_gen.opt_integer)
+            test_gen.generate_tests(s, x, y, length, test_gen.bits, test_gen.tests, verbose=False)
+        elif model == 'sudoku':
+            import sudoku_bench
+            import z3_sudoku
+            # a plain solver: the QF_FD solver of make_solver('int') replaces
+            # its assertions by its clauses on push and check
+            s = Solver()
+            s.add(z3_sudoku.sudoku_c)
+            for line in sudoku_bench.EASY + sudoku_bench.HARD:
+                z3_sudoku.solve_with(s, z3_sudoku.parse_puzzle(line))
+        else:
+            raise ValueError("unknown model %r" % model)
+
+def export_model(model, directory, bound=None):
+    """Run model with an Smt2Exporter; returns the paths written."""
+    exporter = Smt2Exporter(directory)
+    with tracing.tracing(exporter):
+        run_model(model, bound)
+    return exporter.paths
+
+def main():
+    args = sys.argv[1:]
+    def option(name, default, convert=str):
+        if name in args:
+            i = args.index(name)
+            value = convert(args[i+1])
+            del args[i:i+2]
+            return value
+        return default
+    if len(args) >= 3 and args[0] == 'export':
+        paths = export_model(args[1], args[2], int(args[3]) if len(args) > 3 else None)
+        print("%d queries written to %s" % (len(paths), args[2]))
+    elif len(args) >= 2 and args[0] == 'run':
+        jobs = option('--jobs', None, int)
+        timeout = option('--timeout', 60, float)
+        index, count = option('--shard', '0/1').split('/')
+        out = option('--out', None)
+        paths = []
+        for a in args[1:]:
+            paths.extend(sorted(glob.glob(os.path.join(a, '*.smt2'))) if os.path.isdir(a) else [ a ])
+        paths = shard(paths, int(index), int(count))
+        with open(out, 'w') if out else contextlib.nullcontext(sys.stdout) as f:
+            results = run_batch(paths, jobs, timeout, f)
+        counts = {}
+        for r in results:
+            counts[r['status']] = counts.get(r['status'], 0) + 1
+        print("%d queries: %s" % (len(results), ', '.join( "%d %s" % (n, s) for s, n in sorted(counts.items()) )),
+              file=sys.stderr)
+    else:
+        sys.exit("usage: smt2_batch.py export <model> <directory> [bound]\n"
+                 "       smt2_batch.py run <directory or files> [--jobs N] [--timeout S] [--shard i/n] [--out file]")
+
+if __name__ == "__main__":
+    main()
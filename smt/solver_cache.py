@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+# persistent, content-addressed cache of solver results
+#
+# sweeps such as run_bmc_fixed_up_to(25), the test_gen loops or repeated
+# Sudoku batches solve the same queries on every invocation. The cache
+# keys a query by a hash of its SMT-LIB2 text (the solver's sexpr() plus
+# the assumptions), the solver configuration (how it was built: tactic,
+# logic, tuned configuration, and the parameters set on it, e.g. timeouts)
+# and the z3 version, and stores the result, the model (or unsat core) and
+# the solve time in an SQLite file, so unchanged queries are answered
+# across runs (and CI jobs sharing the file). Entries are evicted least
+# recently used first when the cache holds more than max_entries entries or
+# max_bytes of models.
+#
+#   cache = SolverCache('solver_cache.sqlite')
+#   s = CachedSolver(Solver(), cache)   # drop-in: add, push, pop, set, check, model
+#
+# unknown results (e.g. timeouts) are not cached. A model from the cache is a
+# CachedModel with the usual evaluate/eval/[] access; after a cache hit the
+# unsat core and the statistics are served from the cache too, and what
+# needs the solver to have run (e.g. proof()) raises a Z3Exception.
+#
+# run: python solver_cache.py [cache file]   (the GCD fixed-point sweep, twice)
+
+import hashlib
+import json
+import sqlite3
+import time
+
+from z3 import *
+
+import tracing
+
+DEFAULT_PATH = 'solver_cache.sqlite'
+
+def _lambda_of(interp, decl):
+    """
+    A function interpretation as a lambda term; its variables are given in
+    reverse order, so that Var(i) of the body is argument i (as
+    substitute_funs expects).
+    """
+    args = [ Const('%s!arg%d' % (decl.name(), i), decl.domain(i)) for i in range(decl.arity()) ]
+    body = interp.else_value()
+    for entry in reversed(interp.as_list()[:-1]):
+        body = If(And([ a == v for a, v in zip(args, entry[:-1]) ]), entry[-1], body)
+    return Lambda(list(reversed(args)), body)
+
+def _default_value(sort):
+    """Value used for constants that are not in a model (model_completion)."""
+    if sort.kind() == Z3_BOOL_SORT:
+        return BoolVal(False, sort.ctx)
+    if sort.kind() == Z3_INT_SORT:
+        return IntVal(0, sort.ctx)
+    if sort.kind() == Z3_REAL_SORT:
+        return RealVal(0, sort.ctx)
+    if sort.kind() == Z3_BV_SORT:
+        return BitVecVal(0, sort.size(), sort.ctx)
+    if sort.kind() == Z3_DATATYPE_SORT and sort.constructor(0).arity() == 0:
+        return sort.constructor(0)()
+    return None
+
+def _constants(e, found):
+    """Collect the uninterpreted constants of e into found (id -> constant)."""
+    todo = [ e ]
+    seen = set()
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_const(e) and e.decl().kind() == Z3_OP_UNINTERPRETED:
+            found[e.get_id()] = e
+        todo.extend(e.children())
+    return found
+
+def serialize_model(model):
+    """
+    A model as JSON: constant name -> value, function name -> lambda, as
+    SMT-LIB terms, and the names of the datatype sorts they use.
+    """
+    consts = {}
+    funcs = {}
+    datatypes = set()
+    for d in model.decls():
+        for sort in [ d.range() ] + [ d.domain(i) for i in range(d.arity()) ]:
+            if sort.kind() == Z3_DATATYPE_SORT:
+                datatypes.add(sort.name())
+        if d.arity() == 0:
+            consts[d.name()] = model[d].sexpr()
+        else:
+            funcs[d.name()] = _lambda_of(model[d], d).sexpr()
+    return json.dumps({ 'consts': consts, 'funcs': funcs, 'datatypes': sorted(datatypes),
+                        'text': model.sexpr() })
+
+class CachedModel:
+    """
+    Model restored from the cache, over the constants and functions of the
+    query: evaluate() substitutes the stored values and simplifies.
+    """
+
+    def __init__(self, data, assertions, ctx=None):
+        self.ctx = ctx
+        self.text = data['text']
+        sorts = {}
+        if data['datatypes']:
+            # the datatypes are declared by the query, find them there
+            for c in _constants(And(assertions), {}).values():
+                if c.sort().kind() == Z3_DATATYPE_SORT:
+                    sorts[c.sort().name()] = c.sort()
+        # all terms in one parse, each in a dummy assertion
+        names = list(data['consts']) + list(data['funcs'])
+        terms = list(data['consts'].values()) + list(data['funcs'].values())
+        text = ''.join( "(assert (= %s %s))" % (t, t) for t in terms )
+        parsed = [ eq.arg(0) for eq in parse_smt2_string(text, sorts=sorts, ctx=ctx) ]
+        self.consts = []
+        self.funcs = []
+        for name, value in zip(names, parsed):
+            if name in data['consts']:
+                self.consts.append((Const(name, value.sort()), value))
+            else:
+                n = value.num_vars()
+                domain = [ value.var_sort(n - 1 - i) for i in range(n) ]
+                self.funcs.append((Function(name, *domain, value.body().sort()), value.body()))
+        # the constants are kept alive in consts, so their ids stay valid
+        self.values = { c.get_id(): v for c, v in self.consts }
+
+    def evaluate(self, e, model_completion=False):
+        if e.get_id() in self.values:
+            return self.values[e.get_id()]
+        t = substitute(e, *self.consts) if self.consts else e
+        if self.funcs:
+            t = substitute_funs(t, *self.funcs)
+        t = simplify(t)
+        if model_completion:
+            missing = [ (c, _default_value(c.sort())) for c in _constants(t, {}).values() ]
+            missing = [ (c, v) for c, v in missing if v is not None ]
+            if missing:
+                t = simplify(substitute(t, *missing))
+        return t
+
+    eval = evaluate
+
+    def __getitem__(self, c):
+        if isinstance(c, FuncDeclRef):
+            c = c()
+        return self.values.get(c.get_id())
+
+    def decls(self):
+        return [ c.decl() for c, _ in self.consts ] + [ f for f, _ in self.funcs ]
+
+    def sexpr(self):
+        return self.text
+
+    def __str__(self):
+        return self.text
+
+class SolverCache:
+    """
+    On-disk cache: query key -> (result, model, solve time), with LRU
+    eviction beyond max_entries entries or max_bytes of stored models.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=10000, max_bytes=64 * 2**20):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT, model TEXT, "
+                        "seconds REAL, size INTEGER, used REAL)")
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(assertions, assumptions=(), params=None, ctx=None):
+        """Canonical hash of a query: SMT-LIB2 text, assumptions, parameters and z3 version."""
+        h = hashlib.sha256()
+        h.update(get_version_string().encode())
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        # as a fresh solver prints it: declarations and assertions only
+        query = Solver(ctx=ctx)
+        query.add(assertions)
+        h.update(query.sexpr().encode())
+        for a in assumptions:
+            h.update(b'\0' + a.sexpr().encode())
+        return h.hexdigest()
+
+    def lookup(self, key):
+        """(result, model data or None, seconds) of key, or None; marks the entry as used."""
+        row = self.db.execute("SELECT result, model, seconds FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        result = { 'sat': sat, 'unsat': unsat }[row[0]]
+        return result, json.loads(row[1]) if row[1] else None, row[2]
+
+    def store(self, key, result, model, seconds, core=None):
+        """Store a sat result with its model, or an unsat one with its core (indices of the assumptions)."""
+        if result == unknown:
+            return
+        if model is not None:
+            data = serialize_model(model)
+        else:
+            data = json.dumps({ 'core': core }) if core is not None else None
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, str(result), data, seconds, len(data or ''), time.time()))
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        """Drop least recently used entries until both bounds hold."""
+        count, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        for key, entry_size in self.db.execute("SELECT key, size FROM results ORDER BY used").fetchall():
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+            count -= 1
+            size -= entry_size
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self):
+        self.db.execute("DELETE FROM results")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+class CachedStatistics:
+    """Statistics of a check() answered from the cache."""
+
+    def __init__(self, seconds):
+        self.values = { 'cache hits': 1, 'cached time': seconds }
+
+    def keys(self):
+        return list(self.values)
+
+    def get_key_value(self, key):
+        return self.values[key]
+
+    def __repr__(self):
+        return repr(self.values)
+
+class CachedSolver:
+    """
+    A solver whose check() is answered from cache if the same query was
+    solved before; everything else is passed to the wrapped solver.
+
+    params describes how solver was built and configured (e.g. the tactic,
+    or autotune.solver_config(family) for a solver of autotune.make_solver,
+    and the parameters set on it before it was wrapped), as a JSON-able
+    dict; it is part of the key, as are the parameters set through set().
+
+    The query is the assertions made through add/push/pop (on top of those
+    of solver when it is wrapped): solver.assertions() is not used, as some
+    solvers (e.g. SolverFor('QF_FD')) replace it by their internal clauses
+    after a check.
+    """
+
+    # what only the solver can answer after it ran the check
+    _UNCACHED = ('proof', 'reason_unknown', 'trail', 'trail_levels', 'cube', 'consequences')
+
+    def __init__(self, solver, cache, params=None):
+        self.solver = solver
+        self.cache = cache
+        self.params = dict(params or {})
+        self.scopes = [ list(solver.assertions()) ]
+        self._model = None
+        self._core = None
+        self._hit = None # statistics of the last check() if it was answered from the cache
+
+    def __getattr__(self, name):
+        if name in self._UNCACHED and self._hit is not None:
+            raise Z3Exception("%s() is not available: the last check() was answered from the cache" % name)
+        return getattr(self.solver, name)
+
+    def __repr__(self):
+        return repr(self.solver)
+
+    def add(self, *args):
+        self.solver.add(*args)
+        for a in args:
+            self.scopes[-1].extend(a if isinstance(a, (list, tuple, AstVector)) else [ a ])
+
+    append = insert = add
+
+    def push(self):
+        self.solver.push()
+        self.scopes.append([])
+
+    def pop(self, num=1):
+        self.solver.pop(num)
+        del self.scopes[len(self.scopes) - num:]
+
+    def reset(self):
+        self.solver.reset()
+        self.scopes = [ [] ]
+
+    def set(self, *args, **keys):
+        self.solver.set(*args, **keys)
+        self.params.update(zip(args[0::2], args[1::2]))
+        self.params.update(keys)
+
+    def assertions(self):
+        return [ a for scope in self.scopes for a in scope ]
+
+    def check(self, *assumptions):
+        assertions = self.assertions()
+        key = SolverCache.key(assertions, assumptions, self.params, self.solver.ctx)
+        entry = self.cache.lookup(key)
+        if entry is not None:
+            result, data, seconds = entry
+            try:
+                self._model = CachedModel(data, assertions, self.solver.ctx) if result == sat and data else None
+                core = data.get('core') if result == unsat and data else None
+                self._core = None if core is None else [ assumptions[i] for i in core ]
+                self._hit = CachedStatistics(seconds)
+                tracing.debug('cache hit', result=str(result), seconds=seconds)
+                return result
+            except Z3Exception:
+                pass # model not readable in this context: solve again
+        self._hit = None
+        start = time.perf_counter()
+        result = self.solver.check(*assumptions)
+        seconds = time.perf_counter() - start
+        self._model = self.solver.model() if result == sat else None
+        self._core = None
+        core = None
+        if result == unsat:
+            self._core = list(self.solver.unsat_core())
+            ids = set(c.get_id() for c in self._core)
+            core = [ i for i, a in enumerate(assumptions) if a.get_id() in ids ]
+        self.cache.store(key, result, self._model, seconds, core)
+        return result
+
+    def model(self):
+        if self._model is None:
+            raise Z3Exception("model is not available")
+        return self._model
+
+    def unsat_core(self):
+        if self._core is None:
+            raise Z3Exception("unsat core is not available")
+        return self._core
+
+    def statistics(self):
+        return self._hit if self._hit is not None else self.solver.statistics()
+
+if __name__ == "__main__":
+    import sys
+    from bmc_gcd_fpsat import gcd_bmc_with_fixed_point
+
+    cache = SolverCache(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH)
+    for sweep in range(2):
+        hits, misses = cache.hits, cache.misses
+        start = time.perf_counter()
+        for k in range(1, 26):
+            gcd_bmc_with_fixed_point(k, verbose=False, cache=cache)
+        print("sweep %d: %.3fs, %d hits, %d misses" % (sweep + 1, time.perf_counter() - start,
+                                                     cache.hits - hits, cache.misses - misses))
+    print("%d entries in %s" % (len(cache), cache.path))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# benchmark of the Sudoku encodings of z3_sudoku.py on easy and hard puzzles
+#
+# run: python sudoku_bench.py [repetitions]
+
+import statistics
+import sys
+import time
+
+import sudoku_prop
+import z3_sudoku
+
+# easy puzzles: solved by naked/hidden singles
+EASY = [
+    "530070000600195000098000060800060003400803001700020006060000280000419005000080079",
+    "003020600900305001001806400008102900700000008006708200002609500800203009005010300",
+    "200080300060070084030500209000105408000000000402706000301007040720040060004010003",
+    "000000907000420180000705026100904000050000040000507009920108000034059000507000000",
+    "030050040008010500460000012070502080000603000040109030250000098001020600080060020",
+]
+
+# hard puzzles: need search
+HARD = [
+    "4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+    "52...6.........7.13...........4..8..6......5...........418.........3..2...87.....",
+    "6.....8.3.4.7.................5.4.7.3..2.....1.6.......2.....5.....8.6......1....",
+    "48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....",
+    "800000000003600000070090200050007000000045700000100030001000068008500010090000400",
+]
+
+def bench_encoding(encoding, puzzles, repetitions=3):
+    """
+    Per-puzzle solve times (seconds, best of repetitions) of one encoding,
+    on a single solver reused for all puzzles, plus its setup time.
+    """
+    start = time.perf_counter()
+    s = z3_sudoku.make_solver(encoding)
+    setup = time.perf_counter() - start
+    times = []
+    for line in puzzles:
+        instance = z3_sudoku.parse_puzzle(line)
+        best = None
+        for r in range(repetitions):
+            start = time.perf_counter()
+            solution = z3_sudoku.solve_with(s, instance, encoding)
+            t = time.perf_counter() - start
+            best = t if best is None else min(best, t)
+        if solution is None:
+            print("  %s: no solution for %s" % (encoding, line))
+        times.append(best)
+    return setup, times
+
+def bench_propagation(puzzles):
+    """
+    Latency split of the propagation preprocessor: seconds spent in
+    propagation and in z3 on the residual cells per puzzle, and the number
+    of residual unknown cells (0: z3 not called).
+    """
+    rows = []
+    for line in puzzles:
+        grid = [ 0 if c in '0.' else int(c) for c in line ]
+        start = time.perf_counter()
+        propagated = sudoku_prop.propagate(grid)
+        prop_time = time.perf_counter() - start
+        smt_time = 0.0
+        residual = 0
+        if propagated is not None and not all(propagated[0]):
+            residual = sum( 1 for v in propagated[0] if not v )
+            start = time.perf_counter()
+            sudoku_prop.residual_solve(*propagated)
+            smt_time = time.perf_counter() - start
+        rows.append((prop_time, smt_time, residual))
+    return rows
+
+def run(repetitions=3):
+    print("%-8s %-8s %8s %10s %10s %10s" % ("set", "encoding", "setup", "total", "median", "max"))
+    for name, puzzles in (("easy", EASY), ("hard", HARD)):
+        for encoding in z3_sudoku.ENCODINGS:
+            setup, times = bench_encoding(encoding, puzzles, repetitions)
+            print("%-8s %-8s %8.4f %10.4f %10.4f %10.4f" % (name, encoding, setup, sum(times),
+                  statistics.median(times), max(times)))
+    print()
+    print("%-8s %10s %10s %10s %10s" % ("set", "prop", "smt", "z3 calls", "residual"))
+    for name, puzzles in (("easy", EASY), ("hard", HARD)):
+        rows = bench_propagation(puzzles)
+        print("%-8s %10.4f %10.4f %10d %10.1f" % (name, sum( r[0] for r in rows ), sum( r[1] for r in rows ),
+              sum( 1 for r in rows if r[2] ), statistics.mean( r[2] for r in rows )))
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
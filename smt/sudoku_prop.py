@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# constraint propagation in front of the z3 Sudoku solver (z3_sudoku.py)
+#
+# candidates are kept as 9-bit masks in a flat array of 81 cells (bit d-1
+# set: digit d still possible); naked singles (a cell with one candidate)
+# and hidden singles (a digit with one place left in a row, column or
+# square) are propagated to a fixpoint. Most puzzles are solved right
+# there; otherwise z3 only gets the residual unknown cells, each with its
+# reduced domain.
+
+from array import array
+
+from z3 import *
+
+import tracing
+
+# the 27 units (rows, columns, squares) as lists of cell indices 0..80
+UNITS = [ [ 9*i + j for j in range(9) ] for i in range(9) ] \
+      + [ [ 9*i + j for i in range(9) ] for j in range(9) ] \
+      + [ [ 9*(3*i0 + i) + 3*j0 + j for i in range(3) for j in range(3) ]
+          for i0 in range(3) for j0 in range(3) ]
+
+# the 20 peers of every cell (cells sharing a unit)
+PEERS = [ sorted({ c for u in UNITS if cell in u for c in u } - { cell })
+          for cell in range(81) ]
+
+ALL = 0x1ff
+
+# mask -> digit for single-bit masks, 0 otherwise
+SINGLE = [ 0 ] * 512
+for d in range(9):
+    SINGLE[1 << d] = d + 1
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+def propagate(grid):
+    """
+    Propagate naked and hidden singles on grid (81 digits, 0 for empty).
+    Returns (values, candidates): arrays of the 81 fixed digits (0 if still
+    unknown) and candidate masks, or None if a contradiction was found.
+    """
+    values = array('b', [ 0 ] * 81)
+    candidates = array('H', [ ALL ] * 81)
+    todo = []
+    for cell, v in enumerate(grid):
+        if v:
+            if not candidates[cell] & (1 << (v - 1)):
+                return None
+            candidates[cell] = 1 << (v - 1)
+            todo.append(cell)
+    while True:
+        # naked singles: remove the digit of every newly fixed cell from its peers
+        while todo:
+            cell = todo.pop()
+            if values[cell]:
+                continue
+            v = SINGLE[candidates[cell]]
+            values[cell] = v
+            bit = 1 << (v - 1)
+            for p in PEERS[cell]:
+                if candidates[p] & bit:
+                    if values[p]:
+                        return None
+                    candidates[p] &= ~bit
+                    if candidates[p] == 0:
+                        return None
+                    if SINGLE[candidates[p]]:
+                        todo.append(p)
+        # hidden singles: a digit with a single possible cell in a unit
+        for unit in UNITS:
+            once = 0
+            twice = 0
+            for cell in unit:
+                twice |= once & candidates[cell]
+                once |= candidates[cell]
+            if once != ALL:
+                return None # some digit has no place left in this unit
+            for cell in unit:
+                if not values[cell]:
+                    hidden = candidates[cell] & ~twice
+                    if hidden:
+                        if SINGLE[hidden] == 0:
+                            return None # two digits only fit this cell
+                        candidates[cell] = hidden
+                        todo.append(cell)
+        if not todo:
+            return values, candidates
+
+def residual_solve(values, candidates):
+    """
+    Solve the residual puzzle with z3: one Int per unknown cell, restricted
+    to its candidates, Distinct over the unknown cells of every unit (the
+    fixed digits are already excluded from the candidates).
+    Returns the solution as an 81 character string, or None.
+    """
+    unknown = [ cell for cell in range(81) if not values[cell] ]
+    V = { cell: Int("x_%s_%s" % (cell // 9 + 1, cell % 9 + 1)) for cell in unknown }
+    s = SolverFor('QF_FD')
+    for cell in unknown:
+        s.add(Or([ V[cell] == d + 1 for d in range(9) if candidates[cell] & (1 << d) ]))
+    for unit in UNITS:
+        open_cells = [ V[cell] for cell in unit if not values[cell] ]
+        if len(open_cells) > 1:
+            s.add(Distinct(open_cells))
+    if tracing.check(s, kind='sudoku-residual', bound=len(unknown)) != sat:
+        return None
+    m = s.model()
+    return ''.join( str(values[cell]) if values[cell] else str(m.evaluate(V[cell]))
+                    for cell in range(81) )
+
+def solve(puzzle):
+    """
+    Solve puzzle (81 character line, '0' or '.' for empty cells) by
+    propagation, calling z3 only on the residual cells if needed.
+    Returns (solution or None, z3 used).
+    """
+    puzzle = puzzle.strip()
+    if len(puzzle) != 81:
+        raise ValueError("expected 81 cells, got %d: %r" % (len(puzzle), puzzle))
+    grid = [ 0 if c in '0.' else int(c) for c in puzzle ]
+    propagated = propagate(grid)
+    if propagated is None:
+        return None, False
+    values, candidates = propagated
+    if all(values):
+        return ''.join(map(str, values)), False
+    return residual_solve(values, candidates), True
@@ -1,14 +1,25 @@
+import json
+import sys
+import time
+
 from z3 import *
 
+from autotune import make_solver, solver_config
+import tracing
+
 # test generation for a function GCD(x, y): computes greatest common denominator of x and y by Euclid's algorithm and updates y with the GCD
 
 opt_integer = 1
 
-if opt_integer:
-    x = Function('x', IntSort(), IntSort()) # function mapping integers to integers; input argument
-    y = Function('y', IntSort(), IntSort()) # function mapping integers to integers; input argument and return value
-    m = Function('m', IntSort(), IntSort()) # function mapping integers to integers; local variable
+# debug output: print the solver and every model found (see tracing.py)
+opt_debug = 1
 
+# cache of solver results (see solver_cache.py): path of the cache file, or None; with it, rerunning the same
+# length, bits and tests answers the queries from the cache
+opt_cache = None
+
+# encode the loop with one constant per step (x_0, y_0, m_0, x_1, ...) instead of the uninterpreted functions x(i), y(i), m(i)
+opt_flat = 0
 
 # play with the length, tests, and bits parameters to see different program paths with different memory sizes, program path lengths, and numbers of tests
 
@@ -19,8 +30,7 @@ tests = 3 # number of tests to generate
 bits = 32 # number of bits to use for representing x, y, and m
 
 # add one to the number of bits when using bitvectors (not sure why, maybe they're signed)
-if not opt_integer:
-    bits = bits + 1
+# (done in the encodings below, so the bits parameter is the same for both variants)
 
 # In general this is not necessary and Z3 can work with unbounded integers; I'm just using this to illustrate there will be a finite number of tests with finite precision.
 # Also note that if you want to model bitvectors, you should use the bitvector types instead of integers, as the bitvector solver will be much better for most problems than an integer solver [e.g., nonlinear integer arithmetic is undecidable, but if you're modeling using bits instead of integers, it will be decidable due in part to the finite domain].
@@ -29,62 +39,193 @@ if not opt_integer:
 #
 # Example: try length 5 with 16 bits in integer versus bitvector
 
-if not opt_integer:
-    x = Function('x', IntSort(), BitVecSort(bits) )
-    y = Function('y', IntSort(), BitVecSort(bits) )
-    m = Function('m', IntSort(), BitVecSort(bits) )
-
-s = Solver() # instantiate a solver
+def gcd_steps(s, x, y, m, length, bits, opt_integer):
+    # unroll the loop `length` times
+    # x, y, m map the step i to the value of x, y, m at step i
+    for i in range(length + 1):
+        s.add(And (x(i) >= 0, y(i) >= 0, m(i) >= 0)) # datatype assumptions: unsigned
+        if opt_integer:     
+            s.add(And (x(i) < 2**bits, y(i) < 2**bits, m(i) < 2**bits)) # datatype assumptions: finite precision
+            
+        
+        # gcd program encoding (termination condition not satisfied)
+        if i < length:
+            s.add( And((m(i) == (x(i) % y(i))), (m(i) != 0), (x(i + 1) == y(i)), (y(i + 1) == m(i))) )
+        # gcd program encoding (termination condition satisfied)
+        else:
+            s.add( And((m(i) == (x(i) % y(i))), (m(i) == 0) ))
+
+def uf_encoding(length, bits, opt_integer):
+    """Encoding with uninterpreted functions x(i), y(i), m(i); returns (solver, x, y)."""
+    if opt_integer:
+        x = Function('x', IntSort(), IntSort()) # function mapping integers to integers; input argument
+        y = Function('y', IntSort(), IntSort()) # function mapping integers to integers; input argument and return value
+        m = Function('m', IntSort(), IntSort()) # function mapping integers to integers; local variable
+    else:
+        bits = bits + 1
+        x = Function('x', IntSort(), BitVecSort(bits) )
+        y = Function('y', IntSort(), BitVecSort(bits) )
+        m = Function('m', IntSort(), BitVecSort(bits) )
 
-if opt_integer:
-    s.add((y(0) > 0)) # add a constraint: input requirement: y must be positive
-else:
-    s.add((y(0) > BitVecVal(0,bits)))
+    s = make_solver('test_gen') # instantiate a solver (tuned configuration, see autotune.py)
 
-# unroll the loop `length` times
-for i in range(length + 1):
-    s.add(And (x(i) >= 0, y(i) >= 0, m(i) >= 0)) # datatype assumptions: unsigned
-    if opt_integer:     
-        s.add(And (x(i) < 2**bits, y(i) < 2**bits, m(i) < 2**bits)) # datatype assumptions: finite precision
-        
-    
-    # gcd program encoding (termination condition not satisfied)
-    if i < length:
-        s.add( And((m(i) == (x(i) % y(i))), (m(i) != 0), (x(i + 1) == y(i)), (y(i + 1) == m(i))) )
-    # gcd program encoding (termination condition satisfied)
+    if opt_integer:
+        s.add((y(0) > 0)) # add a constraint: input requirement: y must be positive
     else:
-        s.add( And((m(i) == (x(i) % y(i))), (m(i) == 0) ))
-        
-print(s)    
-    
+        s.add((y(0) > BitVecVal(0,bits)))
+
+    gcd_steps(s, x, y, m, length, bits, opt_integer)
+    return s, x, y
+
 # Encoding without functions for 2 loops: usually significantly more efficient, can write a script to generate a Python input file with all these variables.
 # This is probably how you would want to do this in practice.
 #x0, y0, m0, x1, y1, m1 = Ints('x0 y0 m0 x1 y1 m1') # 2 loops
 #s.add(And (x0 >= 0, y0 >= 0, m0 >= 0, x1 >= 0, y1 >= 0, m1 >= 0)) # datatype assumptions
 #P = And( (y0 > 0), (m0 == (x0 % y0)), (m0 != 0), (x1 == y0), (y1 == m0), (m1 == (x1 % y1)), (m1 == 0))
+#
+# flat_encoding generates exactly this for any length, instead of writing the variables by hand
+
+def flat_encoding(length, bits, opt_integer):
+    """Encoding with one constant per step x_i, y_i, m_i; returns (solver, x, y) with x(i), y(i) the step constants."""
+    if opt_integer:
+        X = [ Int('x_%d' % i) for i in range(length + 1) ]
+        Y = [ Int('y_%d' % i) for i in range(length + 1) ]
+        M = [ Int('m_%d' % i) for i in range(length + 1) ]
+    else:
+        bits = bits + 1
+        X = [ BitVec('x_%d' % i, bits) for i in range(length + 1) ]
+        Y = [ BitVec('y_%d' % i, bits) for i in range(length + 1) ]
+        M = [ BitVec('m_%d' % i, bits) for i in range(length + 1) ]
+    x = lambda i: X[i]
+    y = lambda i: Y[i]
+    m = lambda i: M[i]
+
+    s = make_solver('test_gen') # instantiate a solver (tuned configuration, see autotune.py)
+
+    if opt_integer:
+        s.add((y(0) > 0)) # add a constraint: input requirement: y must be positive
+    else:
+        s.add((y(0) > BitVecVal(0,bits)))
+
+    gcd_steps(s, x, y, m, length, bits, opt_integer)
+    return s, x, y
 
-#print(s)
-
-for t in range(tests):
-    i = 0 # constant
-    result = s.check() # check if the set of assertions are satisfiable
-    
-    # if they are satisfiable, use the model values to generate a different test input of the same trace length
-    if result == sat:
-        model = s.model()
-        print(model)
-        print("GCD(x,y): GCD(" + str(model.evaluate( x(0) )) + "," + str(model.evaluate( y(0) )) + ") = " + str(model.evaluate( y(length) )) + "\n")
+def generate_tests(s, x, y, length, bits, tests, verbose=True):
+    """Generate up to `tests` inputs with a path of `length` loops; returns a list of (x, y, gcd)."""
+    found = []
+    for t in range(tests):
+        i = 0 # constant
+        result = tracing.check(s, kind='test', bound=length) # check if the set of assertions are satisfiable
         
-        # can specify both x and y are different since GCD(x,y) = GCD(y,x)
-        # however: note that this will be a different path through the program (i.e., the path through the program for GCD(y,x) differs from GCD(x,y), so we should check both by specifying the disjunction)
-        #s.add( x(i) != model.evaluate( x(i) ) ) # ask for a different input
-        #s.add( y(i) != model.evaluate( y(i) ) ) # ask for a different input
-        s.add( Or(x(i) != model.evaluate( x(i) ), y(i) != model.evaluate( y(i) )) ) # ask for a different input for either x or y
-    # otherwise, there are no more traces
-    else:
-        print("There are no more traces of length " + str(length) + " (assuming " + str(bits) + " bits.  There were " + str(t) + " traces.")
-        print(s.unsat_core())
-        break
+        # if they are satisfiable, use the model values to generate a different test input of the same trace length
+        if result == sat:
+            model = s.model()
+            found.append((model.evaluate( x(0) ), model.evaluate( y(0) ), model.evaluate( y(length) )))
+            tracing.debug('model', length=length, formula=lambda: model)
+            if verbose:
+                print("GCD(x,y): GCD(" + str(model.evaluate( x(0) )) + "," + str(model.evaluate( y(0) )) + ") = " + str(model.evaluate( y(length) )) + "\n")
+            
+            # can specify both x and y are different since GCD(x,y) = GCD(y,x)
+            # however: note that this will be a different path through the program (i.e., the path through the program for GCD(y,x) differs from GCD(x,y), so we should check both by specifying the disjunction)
+            #s.add( x(i) != model.evaluate( x(i) ) ) # ask for a different input
+            #s.add( y(i) != model.evaluate( y(i) ) ) # ask for a different input
+            s.add( Or(x(i) != model.evaluate( x(i) ), y(i) != model.evaluate( y(i) )) ) # ask for a different input for either x or y
+        # otherwise, there are no more traces
+        else:
+            if verbose:
+                print("There are no more traces of length " + str(length) + " (assuming " + str(bits) + " bits.  There were " + str(t) + " traces.")
+                tracing.debug('unsat core', length=length, formula=lambda: s.unsat_core())
+            break
+    return found
 
 # We could use this procedure to generate ALL tests (by incrementing the length and checking an arbitrary number of tests), although it would be horribly inefficient.
-# For any finite choice of bit representation, the method would terminate.
\ No newline at end of file
+# For any finite choice of bit representation, the method would terminate.
+
+def stream_tests(out, max_length, bits, quota, opt_integer=opt_integer, seed=0, timeout=None):
+    """
+    Stream tests for all path lengths 1..max_length on a single solver, written
+    to out (a file) as JSON lines {"length", "x", "y", "gcd"} as they are found.
+
+    The flat encoding is extended one loop iteration per length: the loop
+    condition of step L-1 becomes a permanent constraint once length L is
+    explored, while the termination condition of step L and the blocking
+    clauses of the tests of length L are asserted in a scope (push/pop), so
+    they are removed when moving on: the solver keeps only the steps, and
+    its memory does not grow with the number of tests.
+    Diversity: at most `quota` tests per length, and a different random seed
+    per length. Returns the number of tests per length.
+    """
+    sort = IntSort() if opt_integer else BitVecSort(bits + 1)
+    X, Y, M = [], [], []
+    x = lambda i: X[i]
+    y = lambda i: Y[i]
+    m = lambda i: M[i]
+
+    s = make_solver('test_gen')
+    if timeout is not None:
+        s.set('timeout', timeout)
+
+    def add_step(i):
+        X.append(Const('x_%d' % i, sort))
+        Y.append(Const('y_%d' % i, sort))
+        M.append(Const('m_%d' % i, sort))
+        s.add(And (x(i) >= 0, y(i) >= 0, m(i) >= 0)) # datatype assumptions: unsigned
+        if opt_integer:
+            s.add(And (x(i) < 2**bits, y(i) < 2**bits, m(i) < 2**bits)) # datatype assumptions: finite precision
+        s.add(m(i) == (x(i) % y(i)))
+
+    add_step(0)
+    s.add(y(0) > 0) # input requirement: y must be positive
+
+    counts = {}
+    for L in range(1, max_length + 1):
+        # loop condition holds at step L-1, then step L
+        add_step(L)
+        s.add( And((m(L - 1) != 0), (x(L) == y(L - 1)), (y(L) == m(L - 1))) )
+        s.set('random_seed', seed + L)
+        s.push()
+        s.add( m(L) == 0 ) # terminates after step L
+
+        counts[L] = 0
+        while counts[L] < quota:
+            if tracing.check(s, kind='test-stream', bound=L) != sat:
+                break
+            model = s.model()
+            x0, y0, g = model.evaluate( x(0) ), model.evaluate( y(0) ), model.evaluate( y(L) )
+            out.write(json.dumps({ "length": L, "x": x0.as_long(), "y": y0.as_long(), "gcd": g.as_long() }) + "\n")
+            out.flush()
+            counts[L] += 1
+            s.add( Or(x(0) != x0, y(0) != y0) ) # ask for a different input of this length
+        s.pop() # remove the termination and the blocking clauses of length L
+    return counts
+
+def benchmark(lengths=(2, 5, 10, 15), bits_list=(8, 16, 32), tests=3, opt_integer=opt_integer, timeout=60000):
+    """Seconds to generate `tests` tests with the UF and the flat encoding, over the grid lengths x bits."""
+    print("%7s %5s %10s %10s" % ("length", "bits", "uf", "flat"))
+    for l in lengths:
+        for b in bits_list:
+            row = []
+            for encoding in (uf_encoding, flat_encoding):
+                start = time.perf_counter()
+                s, x, y = encoding(l, b, opt_integer)
+                s.set('timeout', timeout)
+                generate_tests(s, x, y, l, b, tests, verbose=False)
+                row.append(time.perf_counter() - start)
+            print("%7d %5d %10.4f %10.4f" % (l, b, row[0], row[1]))
+
+if __name__ == '__main__':
+    if opt_debug:
+        tracing.set_tracer(tracing.PrintTracer())
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'stream':
+        # python test_gen.py stream tests.jsonl: `tests` tests for each length 1..length
+        with open(sys.argv[2], 'w') as out:
+            print(stream_tests(out, length, bits, tests, opt_integer))
+    else:
+        s, x, y = (flat_encoding if opt_flat else uf_encoding)(length, bits, opt_integer)
+        if opt_cache:
+            from solver_cache import CachedSolver, SolverCache
+            s = CachedSolver(s, SolverCache(opt_cache), { 'family': 'test_gen', 'config': solver_config('test_gen') })
+        tracing.debug('solver', formula=lambda: s)
+        generate_tests(s, x, y, length, bits, tests)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+# structured instrumentation of solver queries
+#
+# instead of printing formulas and solvers for debugging (which for large k
+# costs more than solving), the engines report events to the current
+# tracer: check() wraps solver.check() and records one query event (kind,
+# bound, encode and check time, result, Z3 statistics, and with sizes=True
+# the formula size, which walks all assertions per query), and
+# debug() records named events whose formula fields are only rendered if
+# the tracer asks for it. Fields given as functions are called lazily, so
+#
+#   tracing.debug('reached', k=k, formula=lambda: reachedAll)
+#
+# costs one attribute lookup while no tracer is installed (the default).
+#
+#   with tracing.tracing(tracing.JsonlTracer('trace.jsonl')):
+#       BMC(counter_system()).run(15)
+#
+# writes one JSON object per query; MemoryTracer collects them in a list
+# and PrintTracer prints them (with formulas) like the old debug output.
+
+import contextlib
+import json
+import sys
+import time
+
+def z3_statistics(st):
+    """Statistics of a Solver, Optimize or Fixedpoint as a dict."""
+    return { k: st.get_key_value(k) for k in st.keys() }
+
+def formula_size(fs):
+    """Number of distinct AST nodes of the formulas fs."""
+    seen = set()
+    todo = list(fs)
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        todo.extend(e.children())
+    return len(seen)
+
+class Tracer:
+    """
+    Base of the tracers: emit(event) receives every event as a dict.
+
+    render:     call lazy fields and render formulas as strings (else they
+                are left out of the event)
+    statistics: add the Z3 statistics to query events
+    sizes:      add the formula size (AST nodes of the assertions) to query
+                events; off by default, as it walks all assertions on every
+                query, quadratic over an incremental sweep
+    """
+
+    enabled = True
+
+    def __init__(self, render=False, statistics=True, sizes=False):
+        self.render = render
+        self.statistics = statistics
+        self.sizes = sizes
+
+    def emit(self, event):
+        raise NotImplementedError
+
+    def query(self, solver, assumptions, event):
+        """Called by check() before solving, with the query event so far (e.g. to export it)."""
+        pass
+
+    def close(self):
+        pass
+
+class NullTracer(Tracer):
+    """No tracing: events are neither built nor rendered."""
+
+    enabled = False
+
+    def emit(self, event):
+        pass
+
+class MemoryTracer(Tracer):
+    """Collects the events in the list events."""
+
+    def __init__(self, render=False, statistics=True, sizes=False):
+        Tracer.__init__(self, render, statistics, sizes)
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+    def queries(self, kind=None):
+        return [ e for e in self.events if e['event'] == 'query' and (kind is None or e['kind'] == kind) ]
+
+class JsonlTracer(Tracer):
+    """Writes one JSON object per event to path (or an open file)."""
+
+    def __init__(self, path, render=False, statistics=True, sizes=False):
+        Tracer.__init__(self, render, statistics, sizes)
+        self.out = open(path, 'w') if isinstance(path, str) else path
+        self.owned = isinstance(path, str)
+
+    def emit(self, event):
+        self.out.write(json.dumps(event) + '\n')
+
+    def close(self):
+        if self.owned:
+            self.out.close()
+        else:
+            self.out.flush()
+
+class PrintTracer(Tracer):
+    """Prints the events in a readable form, formulas included."""
+
+    def __init__(self, out=None, statistics=False, sizes=False):
+        Tracer.__init__(self, True, statistics, sizes)
+        self.out = out
+
+    def emit(self, event):
+        out = self.out or sys.stdout
+        fields = { k: v for k, v in event.items() if k not in ('event', 'name', 'time') }
+        if event['event'] == 'query':
+            print("[%s k=%s] %s in %.4fs" % (event['kind'], event['bound'], event['result'],
+                  event['check_time']), file=out)
+            return
+        short = ' '.join( "%s=%s" % (k, v) for k, v in fields.items() if '\n' not in str(v) and len(str(v)) < 60 )
+        print("[%s] %s" % (event['name'], short), file=out)
+        for k, v in fields.items():
+            if '\n' in str(v) or len(str(v)) >= 60:
+                print(v, file=out)
+
+_tracer = NullTracer()
+
+def get_tracer():
+    return _tracer
+
+def set_tracer(tracer):
+    """Install tracer (None: no tracing); returns the previous tracer."""
+    global _tracer
+    previous = _tracer
+    _tracer = tracer if tracer is not None else NullTracer()
+    return previous
+
+@contextlib.contextmanager
+def tracing(tracer):
+    """Trace with tracer inside the with block, then close it."""
+    previous = set_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        set_tracer(previous)
+        tracer.close()
+
+def _render(value):
+    if callable(value):
+        value = value()
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
+
+def debug(name, **fields):
+    """
+    Record a named event. Fields that are functions (lazy) or z3 objects are
+    only evaluated and rendered if the tracer renders, otherwise dropped.
+    """
+    tracer = _tracer
+    if not tracer.enabled:
+        return
+    event = { 'event': 'debug', 'name': name, 'time': time.time() }
+    for k, v in fields.items():
+        if isinstance(v, (bool, int, float, str)) or v is None:
+            event[k] = v
+        elif tracer.render:
+            event[k] = _render(v)
+    tracer.emit(event)
+
+def check(solver, *assumptions, kind='check', bound=None, encode_time=None, **fields):
+    """
+    solver.check(*assumptions), recorded as a query event if a tracer is
+    installed; extra fields are added to the event like in debug().
+    """
+    tracer = _tracer
+    if not tracer.enabled:
+        return solver.check(*assumptions)
+    event = { 'event': 'query', 'kind': kind, 'bound': bound, 'time': time.time(),
+              'encode_time': encode_time, 'assumptions': len(assumptions) }
+    for k, v in fields.items():
+        if isinstance(v, (bool, int, float, str)) or v is None:
+            event[k] = v
+        elif tracer.render:
+            event[k] = _render(v)
+    tracer.query(solver, assumptions, event)
+    start = time.perf_counter()
+    result = solver.check(*assumptions)
+    event['check_time'] = time.perf_counter() - start
+    event['result'] = str(result)
+    if tracer.sizes:
+        assertions = solver.assertions()
+        event['assertions'] = len(assertions)
+        event['size'] = formula_size(assertions)
+    if tracer.statistics:
+        event['z3'] = z3_statistics(solver.statistics())
+    tracer.emit(event)
+    return result
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# reusable transition systems and model checking engines
+#
+# a model is described once as a TransitionSystem (state variables, initial
+# states, transition relation, bad states) and can then be checked by any
+# engine; engines own their solver and their frames (the step variables),
+# so several models and properties can be checked in one process without
+# module level state, e.g.:
+#
+#   from bmc import counter_system
+#   from transition_system import BMC, KInduction
+#   print(BMC(counter_system(bits=8)).run(15))
+#   print(KInduction(counter_system(bad=lambda V: V['x'] >= 11)).run(5))
+
+import time
+
+from z3 import *
+
+from autotune import make_solver
+import tracing
+
+class TransitionSystem:
+    """
+    Symbolic transition system.
+
+    state_vars: list of (name, sort), copied for every step as name_k
+    rigid_vars: list of (name, sort) that keep their value in all steps (e.g. G)
+    inputs:     names of state_vars that are inputs (ignored for simple paths)
+    init(V), bad(V), trans(V, W): formulas over the step variables, where
+    V and W map variable names to the constants of one step.
+    explicit:   optional function returning the same model (and property) as
+                an explicit.ExplicitSystem, for small finite state spaces
+    """
+
+    def __init__(self, name, state_vars, init, trans, bad, rigid_vars=(), inputs=(), family=None, explicit=None):
+        self.name = name
+        self.state_vars = list(state_vars)
+        self.rigid_vars = list(rigid_vars)
+        self.inputs = set(inputs)
+        self.init = init
+        self.trans = trans
+        self.bad = bad
+        self.family = family if family is not None else name
+        self.explicit = explicit
+        self._rigid = { n: Const(n, sort) for n, sort in self.rigid_vars }
+        self._steps = []
+
+    def variables(self, k):
+        """Return the map from variable name to its constant at step k."""
+        while len(self._steps) <= k:
+            i = len(self._steps)
+            V = { n: Const(f'{n}_{i}', sort) for n, sort in self.state_vars }
+            V.update(self._rigid)
+            self._steps.append(V)
+        return self._steps[k]
+
+    def different(self, V, W):
+        """States V and W differ in some (non-input) state variable."""
+        return Or([ V[n] != W[n] for n, _ in self.state_vars if n not in self.inputs ])
+
+    def with_bad(self, bad, name=None):
+        """Same system with another property (bad states); drops the explicit version."""
+        return TransitionSystem(name or self.name, self.state_vars, self.init, self.trans, bad,
+                                self.rigid_vars, self.inputs, self.family)
+
+    def __repr__(self):
+        return f"TransitionSystem({self.name})"
+
+
+class Result:
+    """
+    Outcome of an engine run: status is sat (bad states reachable, trace is
+    the counterexample of length k), unsat (safe for any k, proved at k,
+    with the inductive invariant if the engine computes one) or unknown
+    (bound reached without proof or counterexample).
+    """
+
+    def __init__(self, status, k, trace=None, invariant=None):
+        self.status = status
+        self.k = k
+        self.trace = trace
+        self.invariant = invariant
+
+    def __repr__(self):
+        return f"Result({self.status}, k={self.k})"
+
+    def print_trace(self):
+        for i, state in enumerate(self.trace or []):
+            print("step " + str(i) + "/" + str(self.k) + " state:")
+            for n, v in state.items():
+                print("  " + n + ": " + str(v))
+
+
+def extract_trace(system, model, k):
+    """Values of all step variables 0..k in model, as a list of dicts."""
+    trace = []
+    for i in range(k+1):
+        V = system.variables(i)
+        trace.append({ n: model.eval(v, model_completion=True) for n, v in V.items() })
+    return trace
+
+
+class BMC:
+    """
+    Incremental bounded model checking by unrolling: init is asserted once,
+    one transition per step, bad states of step k guarded by an assumption
+    literal. Repeated run() calls continue from the last checked bound.
+    """
+
+    def __init__(self, system, solver=None):
+        self.system = system
+        self.solver = solver if solver is not None else make_solver(system.family)
+        self.solver.add(system.init(system.variables(0)))
+        self.frames = 1 # number of step variable sets constrained so far
+        self.checked = -1 # last bound whose bad states were checked
+
+    def extend(self):
+        """Add one more transition step to the unrolling."""
+        V = self.system.variables(self.frames - 1)
+        W = self.system.variables(self.frames)
+        self.solver.add(self.system.trans(V, W))
+        self.frames += 1
+
+    def check(self, k):
+        """Are bad states reachable in exactly k steps?"""
+        start = time.perf_counter()
+        while self.frames <= k:
+            self.extend()
+        check_k = Bool(f'{self.system.name}_bad_{k}')
+        self.solver.add(Implies(check_k, self.system.bad(self.system.variables(k))))
+        result = tracing.check(self.solver, check_k, kind='bmc', bound=k, system=self.system.name,
+                               encode_time=time.perf_counter() - start)
+        if result != sat:
+            self.solver.add(Not(check_k)) # retire the bad states of step k
+        return result
+
+    def run(self, bound):
+        for k in range(self.checked + 1, bound + 1):
+            result = self.check(k)
+            self.checked = k
+            if result == sat:
+                model = self.solver.model()
+                self.solver.add(Not(Bool(f'{self.system.name}_bad_{k}')))
+                return Result(sat, k, extract_trace(self.system, model, k))
+        return Result(unknown, bound)
+
+
+class KInduction:
+    """
+    k-induction: the base case is a BMC engine, the inductive step checks if
+    k+1 good states on a simple path can be followed by a bad state. Both
+    solvers are extended by one step per k.
+    """
+
+    def __init__(self, system, solver=None, step_solver=None):
+        self.system = system
+        self.base = BMC(system, solver)
+        self.step = step_solver if step_solver is not None else make_solver(system.family)
+        self.steps = 0 # transitions in the inductive step solver
+
+    def check_step(self, k):
+        """Is the property (k+1)-inductive?"""
+        system = self.system
+        start = time.perf_counter()
+        while self.steps <= k:
+            i = self.steps
+            V = system.variables(i)
+            W = system.variables(i+1)
+            self.step.add(Not(system.bad(V)))
+            self.step.add(system.trans(V, W))
+            for j in range(i+1):
+                self.step.add(system.different(system.variables(j), W))
+            self.steps += 1
+        step_k = Bool(f'{system.name}_step_{k+1}')
+        self.step.add(Implies(step_k, system.bad(system.variables(k+1))))
+        result = tracing.check(self.step, step_k, kind='kind-step', bound=k+1, system=system.name,
+                               encode_time=time.perf_counter() - start)
+        self.step.add(Not(step_k))
+        return result
+
+    def run(self, bound):
+        for k in range(bound + 1):
+            result = self.base.run(k)
+            if result.status == sat:
+                return result
+            if self.check_step(k) == unsat:
+                return Result(unsat, k+1)
+        return Result(unknown, bound)
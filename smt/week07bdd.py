@@ -22,6 +22,8 @@ import dd.autoref as _bdd
 # uncomment if you have compiled `dd.cudd`
 # import dd.cudd as _bdd
 
+from bdd_reach import PartitionedRelation, backward_reach, forward_reach
+
 
 def transition_system(bdd):
     """Return the transition relation of a graph."""
@@ -38,6 +40,21 @@ def transition_system(bdd):
     return transitions
 
 
+def transition_parts(bdd):
+    """Return the transition relation of the graph as a list of conjuncts."""
+    transitions = transition_system(bdd)
+    parts = [
+        r"(~ x0 /\ ~ x1) => ( (~ x0' /\ ~ x1') \/ (x0' /\ ~ x1') )",
+        r"(x0 /\ ~ x1) => ~ (x0' /\ x1')",
+        r"(~ x0 /\ x1) => ( (~ x0' /\ x1') \/ (x0' /\ ~ x1') )",
+        r"~ (x0 /\ x1)",
+        ]
+    parts = [bdd.add_expr(p) for p in parts]
+    assert bdd.apply('and', bdd.apply('and', parts[0], parts[1]),
+                     bdd.apply('and', parts[2], parts[3])) == transitions
+    return parts
+
+
 def least_fixpoint(transitions, bdd):
     """Return ancestor nodes."""
     # target is the set {2}
@@ -59,12 +76,28 @@ def least_fixpoint(transitions, bdd):
     return q
 
 
+def frontier_fixpoint(parts, bdd):
+    """Return ancestor nodes, by preimages of the frontier only."""
+    target = bdd.add_expr(r'~ x0 /\ x1')
+    rel = PartitionedRelation(bdd, parts, {"x0": "x0'", "x1": "x1'"})
+    return backward_reach(rel, target)
+
+
 def reachability_example():
     bdd = _bdd.BDD()
     transitions = transition_system(bdd)
     q = least_fixpoint(transitions, bdd)
     s = q.to_expr()
     print(s)
+    # the same set with the frontier based, partitioned engine
+    parts = transition_parts(bdd)
+    stats = frontier_fixpoint(parts, bdd)
+    assert stats.reached == q
+    print(stats)
+    # and forward: the nodes reachable from node 0
+    rel = PartitionedRelation(bdd, parts, {"x0": "x0'", "x1": "x1'"})
+    stats = forward_reach(rel, bdd.add_expr(r'~ x0 /\ ~ x1'))
+    print(stats.reached.to_expr(), stats)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# bit-width abstraction refinement for bit-vector models
+#
+# bmc.py hard-codes 64 bits for the counter, bmc_gcd_fpsat_bv.py 5 bits, and
+# test_gen.py adds one bit for signedness; most counterexamples do not need
+# the full width though. Here a model given as a function bits -> TransitionSystem
+# is first checked at a small width; a counterexample is replayed at the
+# target width (or in exact Int semantics), and the width is only widened
+# when the counterexample is spurious there.
+#
+# A narrow width without counterexample proves nothing about the target
+# width (e.g. the wider model has more initial states), so in that case the
+# check is done at the target width.
+
+from z3 import *
+
+from transition_system import BMC, Result
+
+def lift(value, sort):
+    """The narrow model value as a value of sort (zero extended for bit-vectors)."""
+    if is_bv_value(value):
+        if sort.kind() == Z3_BV_SORT:
+            return BitVecVal(value.as_long(), sort.size())
+        return IntVal(value.as_long())
+    return value
+
+def replay(system, trace):
+    """
+    Does the trace (of a narrower version of system) exist in system?
+    All state and rigid variables are pinned to the lifted trace values,
+    so this is a cheap, fully determined check.
+    """
+    k = len(trace) - 1
+    s = Solver()
+    s.add(system.init(system.variables(0)))
+    for i in range(k):
+        s.add(system.trans(system.variables(i), system.variables(i+1)))
+    s.add(system.bad(system.variables(k)))
+    for i, state in enumerate(trace):
+        V = system.variables(i)
+        for n, value in state.items():
+            s.add(V[n] == lift(value, V[n].sort()))
+    return s.check() == sat
+
+def refine_width(make_system, target_bits, bound, start_bits=4, exact=None, verbose=True):
+    """
+    Bounded check of make_system(target_bits) up to bound, starting at
+    start_bits and doubling the width on spurious counterexamples.
+    Counterexamples are validated on exact (a TransitionSystem, e.g. with Int
+    semantics) if given, otherwise on make_system(target_bits).
+
+    Returns (result, bits): the Result (its trace at the width it was
+    found) and the width at which it was decided.
+    """
+    target = exact if exact is not None else make_system(target_bits)
+    bits = start_bits
+    while bits < target_bits:
+        result = BMC(make_system(bits)).run(bound)
+        if result.status != sat:
+            if verbose:
+                print(f"[width {bits}] no counterexample up to k={bound}: inconclusive, checking target width")
+            break
+        if replay(target, result.trace):
+            if verbose:
+                print(f"[width {bits}] counterexample at k={result.k} is valid at the target")
+            return result, bits
+        if verbose:
+            print(f"[width {bits}] counterexample at k={result.k} is spurious, widening")
+        bits = min(2 * bits, target_bits)
+    result = BMC(make_system(target_bits)).run(bound)
+    if verbose:
+        print(f"[width {target_bits}] {result}")
+    return result, target_bits
+
+if __name__ == "__main__":
+    from bmc import counter_system
+    from bmc_gcd_fpsat import gcd_fixed_point_system
+    from bmc_gcd_fpsat_bv import gcd_bv_system
+
+    print("=== counter, 64 bits ===")
+    print(refine_width(lambda bits: counter_system(bits=bits), 64, 15))
+    print("=== counter x >= 11, 64 bits ===")
+    print(refine_width(lambda bits: counter_system(bits=bits, bad=lambda V: V['x'] >= 11), 64, 15))
+    print("=== fixed-point GCD, 32 bits, validated in Int semantics ===")
+    print(refine_width(gcd_bv_system, 32, 5, start_bits=2, exact=gcd_fixed_point_system()))
@@ -1,15 +1,25 @@
 # from: https://stackoverflow.com/questions/23451388/z3-sudoku-solver
 
 # pip install z3-solver if necessary
+import multiprocessing
+import sys
+import time
+
 from z3 import *
 
+import autotune
+import tracing
+from solver_cache import CachedSolver
+
+# debug output of the demo: print the variables and constraints (see tracing.py)
+opt_debug = True
+
 # overview: represent each number in the 9x9 grid as an integer variable x_ij
 # for row i \in {1,...9} and column j \in {1,...,9}
 
 # set up 9x9 matrix of integer variables
 X = [ [ Int("x_%s_%s" % (i+1, j+1)) for j in range(9) ] 
       for i in range(9) ]
-print(X)
 
 # each cell contains a value in {1, ..., 9}
 cells_c  = [ And(1 <= X[i][j], X[i][j] <= 9) 
@@ -36,6 +46,35 @@ sq_c     = [ Distinct([ X[3*i0 + i][3*j0 + j]
 # all the rows, all the columns and all of the 9 smaller grids
 sudoku_c = cells_c + rows_c + cols_c + sq_c
 
+# alternative, purely propositional encoding: 729 Boolean variables
+# B[i][j][d] meaning "cell (i, j) contains digit d+1", with exactly-one
+# constraints per cell, and per digit in every row, column and 3x3 square;
+# this goes straight to the SAT core instead of the arithmetic solver
+B = [ [ [ Bool("b_%s_%s_%s" % (i+1, j+1, d+1)) for d in range(9) ]
+        for j in range(9) ]
+      for i in range(9) ]
+
+def exactly_one(bs, pb=False):
+    """Exactly one of bs: pairwise at-most-one clauses, or a pseudo-Boolean PbEq."""
+    if pb:
+        return [ PbEq([ (b, 1) for b in bs ], 1) ]
+    return [ Or(bs) ] + [ Or(Not(bs[a]), Not(bs[b]))
+                          for a in range(len(bs)) for b in range(a+1, len(bs)) ]
+
+def bool_sudoku_c(pb=False):
+    units = [ [ (i, j) for j in range(9) ] for i in range(9) ] \
+          + [ [ (i, j) for i in range(9) ] for j in range(9) ] \
+          + [ [ (3*i0 + i, 3*j0 + j) for i in range(3) for j in range(3) ]
+              for i0 in range(3) for j0 in range(3) ]
+    c = []
+    for i in range(9):
+        for j in range(9):
+            c += exactly_one(B[i][j], pb)
+    for unit in units:
+        for d in range(9):
+            c += exactly_one([ B[i][j][d] for (i, j) in unit ], pb)
+    return c
+
 # next part is for setting up individual boards with a few example boards
 
 # sudoku instance, we use '0' for empty cells
@@ -75,53 +114,254 @@ instance = ((1,0,0,0,0,0,0,0,0),
             (1,0,0,0,0,0,0,0,0))
 """
 
-# add constraint to specify the initial board values as specified
-# in the initial boards above, or any value possible if specified as a 0
-instance_c = [ If(instance[i][j] == 0, 
-                  True, 
-                  X[i][j] == instance[i][j]) 
-               for i in range(9) for j in range(9) ]
+def parse_puzzle(line):
+    """
+    Parse one puzzle given as an 81 character line, row by row, where
+    '0' or '.' is an empty cell.
+    """
+    line = line.strip()
+    if len(line) != 81:
+        raise ValueError("expected 81 cells, got %d: %r" % (len(line), line))
+    digits = [ 0 if c in '0.' else int(c) for c in line ]
+    return tuple( tuple(digits[9*i:9*i + 9]) for i in range(9) )
+
+def givens_c(instance, encoding='int'):
+    """Constraints for the given (non-zero) cells only."""
+    if encoding == 'int':
+        return [ X[i][j] == instance[i][j]
+                 for i in range(9) for j in range(9) if instance[i][j] != 0 ]
+    return [ B[i][j][instance[i][j] - 1]
+             for i in range(9) for j in range(9) if instance[i][j] != 0 ]
+
+# encodings available behind make_solver / solve_with / solve_puzzle
+ENCODINGS = ('int', 'bool', 'bool-pb')
+
+def make_solver(encoding='int', cache=None):
+    """
+    Solver holding the base constraints of encoding:
+      'int'     Int cells with Distinct (sudoku_c), finite domain solver
+      'bool'    one-hot Bool cells, pairwise exactly-one, SAT tactic
+      'bool-pb' one-hot Bool cells, PbEq exactly-one, SAT tactic
+    With cache (a solver_cache.SolverCache), puzzles solved before are
+    answered from the cache.
+    """
+    if encoding == 'int':
+        # all variables range over 1..9: the finite domain solver bit-blasts to
+        # the SAT core, which stays fast under push/pop, unlike the default
+        # Solver() that switches to its (much slower here) incremental mode;
+        # unless a configuration was tuned for sudoku (see autotune.py)
+        s = autotune.make_solver('sudoku', default=lambda: SolverFor('QF_FD'))
+        s.add(sudoku_c)
+    elif encoding == 'bool':
+        s = Then('simplify', 'sat').solver()
+        s.add(bool_sudoku_c())
+    elif encoding == 'bool-pb':
+        s = Then('simplify', 'card2bv', 'sat').solver()
+        s.add(bool_sudoku_c(pb=True))
+    else:
+        raise ValueError("unknown encoding %r, expected one of %s" % (encoding, ENCODINGS))
+    if cache is not None:
+        config = autotune.solver_config('sudoku') if encoding == 'int' else None
+        s = CachedSolver(s, cache, { 'encoding': encoding, 'config': config })
+    return s
+
+def solve_with(s, instance, encoding='int'):
+    """
+    Solve instance on a solver from make_solver(encoding): the givens are
+    added in a pushed scope, so the base constraints (and what the solver
+    learned from them) are reused for the next puzzle.
+    Returns the solution as an 81 character string, or None.
+    """
+    s.push()
+    s.add(givens_c(instance, encoding))
+    if tracing.check(s, kind='sudoku', encoding=encoding) == sat:
+        solution = model_solution(s.model(), encoding)
+    else:
+        solution = None
+    s.pop()
+    return solution
+
+def model_solution(m, encoding='int'):
+    """The grid of model m as an 81 character string."""
+    if encoding == 'int':
+        return ''.join( str(m.evaluate(X[i][j])) for i in range(9) for j in range(9) )
+    return ''.join( str(1 + [ is_true(m.evaluate(b, model_completion=True)) for b in B[i][j] ].index(True))
+                    for i in range(9) for j in range(9) )
+
+def _check_propagate(encoding, cache=None):
+    """Reject the options that do not apply to the residual solve of sudoku_prop."""
+    if encoding != 'int':
+        raise ValueError("propagate solves the residual cells with Ints, not the %r encoding" % encoding)
+    if cache is not None:
+        raise ValueError("propagate does not use the solver cache")
+
+def solve_puzzle(instance, encoding='int', propagate=False, cache=None):
+    """
+    Solve a single puzzle (tuple of rows or 81 character line).
+    With propagate, naked/hidden singles are propagated first and z3 only
+    sees the residual cells, if any (see sudoku_prop.py); the residual cells
+    have an encoding of their own (Ints) and are not cached, so encoding
+    must be 'int' and cache None then.
+    """
+    if isinstance(instance, str):
+        instance = parse_puzzle(instance)
+    if propagate:
+        import sudoku_prop
+        _check_propagate(encoding, cache)
+        return sudoku_prop.solve(''.join( str(v) for row in instance for v in row ))[0]
+    return solve_with(make_solver(encoding, cache), instance, encoding)
+
+def blocking_c(instance, solution, encoding='int'):
+    """
+    Clause excluding solution: some cell that is empty in instance differs
+    (the givens are fixed anyway, so they are left out of the clause).
+    """
+    free = [ (i, j) for i in range(9) for j in range(9) if instance[i][j] == 0 ]
+    if encoding == 'int':
+        return Or([ X[i][j] != int(solution[9*i + j]) for (i, j) in free ])
+    return Or([ Not(B[i][j][int(solution[9*i + j]) - 1]) for (i, j) in free ])
 
-# set up z3 solver
-s = Solver()
+def iter_solutions(instance, encoding='int', limit=None, s=None):
+    """
+    Lazily yield every solution of instance (81 character strings), at most
+    limit of them; each solution found is blocked by a clause over the
+    empty cells only. s may be a solver from make_solver(encoding) to reuse,
+    the blocking clauses are removed from it when the generator is done.
+    """
+    if isinstance(instance, str):
+        instance = parse_puzzle(instance)
+    if s is None:
+        s = make_solver(encoding)
+    s.push()
+    try:
+        s.add(givens_c(instance, encoding))
+        count = 0
+        while limit is None or count < limit:
+            if tracing.check(s, kind='sudoku-enum', bound=count, encoding=encoding) != sat:
+                return
+            m = s.model()
+            solution = model_solution(m, encoding)
+            count += 1
+            yield solution
+            if all( instance[i][j] != 0 for i in range(9) for j in range(9) ):
+                return # no empty cells: nothing to block
+            s.add(blocking_c(instance, solution, encoding))
+    finally:
+        s.pop()
 
-# add the problem constraints and the individual instance/initial board constraints
-overall_c = sudoku_c + instance_c
-s.add(overall_c)
-print(overall_c)
+def count_solutions(instance, encoding='int', limit=None, s=None):
+    """Number of solutions of instance, counting stops at limit."""
+    return sum( 1 for _ in iter_solutions(instance, encoding, limit, s) )
 
-# if satisfiable, that means there exists a solution meeting all the constraints
-if s.check() == sat:
-    m = s.model()
+def is_unique(instance, encoding='int', s=None):
+    """True if instance has exactly one solution (stops at the second one)."""
+    return count_solutions(instance, encoding, 2, s) == 1
+
+# solver of a worker process of the batch mode, asserts the base constraints once
+_worker_solver = None
+_worker_encoding = None
+_worker_propagate = False
+
+def _init_worker(encoding='int', propagate=False):
+    global _worker_solver, _worker_encoding, _worker_propagate
+    _worker_solver = make_solver(encoding)
+    _worker_encoding = encoding
+    _worker_propagate = propagate
+
+def _solve_line(line):
+    if _worker_propagate:
+        import sudoku_prop
+        return line.strip(), sudoku_prop.solve(line)[0]
+    return line.strip(), solve_with(_worker_solver, parse_puzzle(line), _worker_encoding)
+
+def solve_batch(puzzles_path, out=sys.stdout, workers=None, chunksize=32, encoding='int', propagate=False):
+    """
+    Solve every puzzle of puzzles_path (one 81 character line each) over a
+    process pool, each worker with its own solver holding the base constraints.
+    With propagate, puzzles go through the propagation preprocessor first
+    (encoding must be 'int' then, see solve_puzzle).
+    Solutions are streamed to out as "puzzle solution" lines (solution is
+    "unsat" if there is none), in input order.
+    Returns (puzzles solved, seconds).
+    """
+    if propagate:
+        _check_propagate(encoding)
+    with open(puzzles_path) as f:
+        lines = [ line for line in f if line.strip() ]
+    start = time.perf_counter()
+    count = 0
+    # spawn: each worker imports this module, i.e. builds its own X and sudoku_c
+    with multiprocessing.get_context('spawn').Pool(workers, initializer=_init_worker, initargs=(encoding, propagate)) as pool:
+        for puzzle, solution in pool.imap(_solve_line, lines, chunksize):
+            out.write(puzzle + " " + (solution or "unsat") + "\n")
+            count += 1
+    seconds = time.perf_counter() - start
+    return count, seconds
+
+
+def main():
+    if opt_debug:
+        tracing.set_tracer(tracing.PrintTracer())
+    tracing.debug('X', formula=lambda: X)
+
+    # add constraint to specify the initial board values as specified
+    # in the initial boards above, or any value possible if specified as a 0
+    instance_c = [ If(instance[i][j] == 0, 
+                      True, 
+                      X[i][j] == instance[i][j]) 
+                   for i in range(9) for j in range(9) ]
+
+    # set up z3 solver
+    s = Solver()
+
+    # add the problem constraints and the individual instance/initial board constraints
+    overall_c = sudoku_c + instance_c
+    s.add(overall_c)
+    tracing.debug('constraints', formula=lambda: overall_c)
+
+    # if satisfiable, that means there exists a solution meeting all the constraints
+    if tracing.check(s, kind='sudoku') == sat:
+        m = s.model()
     
-    # save the "model", ie, the satisfying assignment to the constraints, 
-    # that is, all the variable values that are the solution to the puzzle
-    r = [ [ m.evaluate(X[i][j]) for j in range(9) ] 
-          for i in range(9) ]
-    print_matrix(r)
+        # save the "model", ie, the satisfying assignment to the constraints, 
+        # that is, all the variable values that are the solution to the puzzle
+        r = [ [ m.evaluate(X[i][j]) for j in range(9) ] 
+              for i in range(9) ]
+        print_matrix(r)
     
-    quit()
-
-    # optional, asking for another solution if not quitting early
-    # could put this next bit into a loop: keep preventing previous solutions
-    # from being used, by constraining variables to not equal previous 
-    # solutions (models) found
-    # prevent next model from being equal to previous: generate other
-    # solutions
-    c_different = [ And([ X[i][j] != m.evaluate(X[i][j]) for j in range(9) ]) 
-          for i in range(9) ]
+        return
+
+        # optional, asking for another solution if not quitting early
+        # could put this next bit into a loop: keep preventing previous solutions
+        # from being used, by constraining variables to not equal previous 
+        # solutions (models) found
+        # prevent next model from being equal to previous: generate other
+        # solutions; a solution differs from the previous one if *some* empty
+        # cell differs (see iter_solutions for the generator version)
+        c_different = [ Or([ X[i][j] != m.evaluate(X[i][j])
+                             for i in range(9) for j in range(9) if instance[i][j] == 0 ]) ]
     
-    print(c_different)
-    s.add(c_different)
+        tracing.debug('different', formula=lambda: c_different)
+        s.add(c_different)
     
-    if s.check() == sat:
-	    m = s.model()
-	    r = [ [ m.evaluate(X[i][j]) for j in range(9) ] 
-	          for i in range(9) ]
-    else:
-    	print("no other solution")
+        if tracing.check(s, kind='sudoku') == sat:
+            m = s.model()
+            r = [ [ m.evaluate(X[i][j]) for j in range(9) ] 
+                  for i in range(9) ]
+        else:
+            print("no other solution")
 
           
-    print_matrix(r)
-else:
-    print("failed to solve: constraints unsatisfiable")
+        print_matrix(r)
+    else:
+        print("failed to solve: constraints unsatisfiable")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # batch mode: python z3_sudoku.py puzzles.txt [solutions.txt]
+        out = open(sys.argv[2], 'w') if len(sys.argv) > 2 else sys.stdout
+        count, seconds = solve_batch(sys.argv[1], out)
+        print("%d puzzles in %.3f s: %.1f puzzles/second" % (count, seconds, count / seconds), file=sys.stderr)
+    else:
+        main()